@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+'''Measures the time to import each parser module in a fresh interpreter.
+
+    python benchmarks/bench_import.py [-n RUNS] [module ...]
+
+Each run starts a new interpreter, so nothing is cached in sys.modules; the
+import itself is timed inside that interpreter, which leaves out interpreter
+startup.'''
+
+from __future__ import print_function
+
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = ['pyc_fmtstr_parser', 'pyc_fmtstr_parser.printf_parse',
+           'pyc_fmtstr_parser.scanf_parse']
+
+_PROBE = '''
+import sys, time
+clock = getattr(time, 'perf_counter', time.time)
+t = clock()
+import %s
+t = clock() - t
+sys.stdout.write('%%r %%d' %% (t, len(sys.modules)))
+'''
+
+def time_import(module, python=sys.executable):
+    '''Returns (seconds, number of modules loaded afterwards) for one import
+    of module in a fresh interpreter.'''
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [ROOT] + [p for p in [env.get('PYTHONPATH')] if p])
+    out = subprocess.check_output([python, '-c', _PROBE % module], env=env)
+    seconds, nmodules = out.decode('ascii').split()
+    return float(seconds), int(nmodules)
+
+def bench(module, runs):
+    times = sorted(time_import(module)[0] for _ in range(runs))
+    return {'module': module, 'runs': runs, 'min': times[0],
+            'median': times[len(times) // 2]}
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('-n', '--runs', type=int, default=20)
+    ap.add_argument('modules', nargs='*', default=MODULES)
+    args = ap.parse_args(argv)
+
+    for module in args.modules:
+        r = bench(module, args.runs)
+        print('%-34s min %7.3f ms  median %7.3f ms' %
+              (module, r['min'] * 1e3, r['median'] * 1e3))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,312 @@
+#!/usr/bin/env python
+'''Benchmarks printf_parse and scanf_parse over fixed format string corpora.
+
+    python benchmarks/bench_parse.py [-n ROUNDS] [-o FILE] [--compare FILE]
+                                     [--threshold PCT] [corpus ...]
+    python benchmarks/bench_parse.py --directive-memory [N]
+
+Each corpus is parsed ROUNDS times after one warm-up round, timing every
+parse on its own, and is reported as latency percentiles, throughput and the
+memory allocated per parse (blocks kept alive by the result and peak bytes,
+from tracemalloc where it exists).  The import time of each parser module is
+measured as in bench_import.py.
+
+-o writes the results as JSON.  --compare reads the JSON of an earlier run
+and lists each benchmark whose median latency grew by more than the
+threshold, exiting with status 1 if any did, so that two revisions can be
+compared on the same machine.
+
+--directive-memory reports instead the memory held per directive by N
+parsed log templates of four directives each (20000 by default), kept as
+the parser's result objects and as a ColumnarDirectives.'''
+
+from __future__ import print_function
+
+import argparse
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_import import bench as bench_import
+
+from pyc_fmtstr_parser.columnar import ColumnarDirectives
+from pyc_fmtstr_parser.printf_parse import printf_parse
+from pyc_fmtstr_parser.scanf_parse import scanf_parse
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+clock = getattr(time, 'perf_counter', time.time)
+
+PARSERS = {'printf': printf_parse, 'scanf': scanf_parse}
+
+# The corpora are built from fixed strings, so every run parses exactly the
+# same input.  Each maps a dialect to its list of format strings; dialects
+# that have no such strings (scansets in printf) are left out.
+_SHORT = ['%d', '%s\n', 'x=%d', '%5.2f%%', '%-10s|', '%lu items',
+          '%c', '%p', '%08x', '[%s] %s', '%lld', '%.3e']
+_SCANF_SHORT = ['%d', '%s', '%d %d', '%5c', '%lu', '%*s %s', '%x', '%f',
+                '%hhd', '%10s', '%n', '%lf']
+_WORDS = ('the quick brown fox jumps over the lazy dog while the format '
+          'parser skips literal text as fast as it can ')
+
+CORPORA = {
+    'short': {
+        'printf': _SHORT,
+        'scanf': _SCANF_SHORT,
+    },
+    'literal': {
+        'printf': [_WORDS * 8 + '%s' + _WORDS * 8 + '%d\n',
+                   (_WORDS + '\n') * 20 + 'done: %5.1f%%'],
+        'scanf': [_WORDS * 8 + '%s' + _WORDS * 8 + '%d',
+                  (_WORDS + '\n') * 20 + 'done: %f'],
+    },
+    'dense': {
+        'printf': ['%d%s%-08.3f%lx%c%%%p%hhu' * 32,
+                   '%*.*f %+5d %#o %ls ' * 32],
+        'scanf': ['%d%s%8lf%lx%c%%%p%hhu' * 32,
+                  '%*d %5s %lld %[a-z] ' * 32],
+    },
+    'positional': {
+        'printf': ['%3$s %1$d %2$*4$.*5$f %6$lu\n' * 16,
+                   ''.join('%%%d$d ' % (i + 1) for i in range(200))],
+        'scanf': ['%2$d %1$s %4$lf %3$c ' * 16,
+                  ''.join('%%%d$d ' % (i + 1) for i in range(200))],
+    },
+    'scanset': {
+        'scanf': ['%[a-zA-Z0-9_.-]', '%[^\n]', '%[\x01-\xff]',
+                  '%[' + ''.join(chr(c) for c in range(0x21, 0x7f)
+                                 if c != 0x5d) + ']',
+                  '%[^]' + 'abcdefghij' * 20 + ']'],
+    },
+    'digits': {
+        'printf': ['%' + '9' * 2000 + '.' + '9' * 2000 + 'f',
+                   '%' + '0' * 2000 + '1$d',
+                   '%*' + '0' * 2000 + '1$d'],
+        'scanf': ['%' + '9' * 4000 + 'd',
+                  '%' + '0' * 2000 + '1$d',
+                  '%*' + '9' * 2000 + 's'],
+    },
+}
+
+def _percentile(sorted_times, p):
+    return sorted_times[min(len(sorted_times) - 1,
+                            int(len(sorted_times) * p / 100.0))]
+
+def time_parses(parse, fmts, rounds):
+    '''Returns the sorted times of rounds parses of each of fmts, after one
+    untimed round.'''
+    for fmt in fmts:
+        parse(fmt)
+    times = []
+    append = times.append
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(rounds):
+            for fmt in fmts:
+                t = clock()
+                parse(fmt)
+                append(clock() - t)
+    finally:
+        if enabled:
+            gc.enable()
+    times.sort()
+    return times
+
+def measure_allocations(parse, fmts):
+    '''Returns (blocks, peak bytes) per parse of fmts, on average for blocks
+    and at most for peak bytes.  blocks counts the allocations made by the
+    parser that are still held by the results.  Either is None where
+    tracemalloc can't measure it.'''
+    if tracemalloc is None:
+        return None, None
+    has_reset = hasattr(tracemalloc, 'reset_peak')    # Python 3.9+
+    results = []
+    peak = 0
+    tracemalloc.start()
+    try:
+        for fmt in fmts:
+            current = tracemalloc.get_traced_memory()[0]
+            if has_reset:
+                tracemalloc.reset_peak()
+            results.append(parse(fmt))
+            peak = max(peak, tracemalloc.get_traced_memory()[1] - current)
+        snapshot = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    snapshot = snapshot.filter_traces([tracemalloc.Filter(
+        True, os.path.join(ROOT, 'pyc_fmtstr_parser', '*'))])
+    blocks = sum(stat.count for stat in snapshot.statistics('filename'))
+    return blocks / float(len(fmts)), peak if has_reset else None
+
+def bench_corpus(dialect, corpus, rounds):
+    fmts = CORPORA[corpus][dialect]
+    parse = PARSERS[dialect]
+    times = time_parses(parse, fmts, rounds)
+    total = sum(times)
+    blocks, peak = measure_allocations(parse, fmts)
+    return {
+        'dialect': dialect,
+        'corpus': corpus,
+        'strings': len(fmts),
+        'parses': len(times),
+        'p50': _percentile(times, 50),
+        'p90': _percentile(times, 90),
+        'p99': _percentile(times, 99),
+        'max': times[-1],
+        'parses_per_s': len(times) / total,
+        'chars_per_s': rounds * sum(len(fmt) for fmt in fmts) / total,
+        'alloc_blocks': blocks,
+        'alloc_peak_bytes': peak,
+    }
+
+def directive_memory(n):
+    '''Returns the bytes held per directive by the results of parsing n log
+    templates of four directives each, as {'objects': ..., 'columnar': ...},
+    or None where tracemalloc doesn't exist.'''
+    if tracemalloc is None:
+        return None
+    fmts = ['job %d: %%s sent %%lu bytes in %%.3f s to %%d' % i
+            for i in range(n)]
+    ndirs = 4 * len(fmts)
+
+    def held(build):
+        gc.collect()
+        tracemalloc.start()
+        try:
+            result = build()
+            size = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+        del result
+        return size / float(ndirs)
+
+    return {
+        'objects': held(lambda: [printf_parse(fmt) for fmt in fmts]),
+        'columnar': held(lambda: ColumnarDirectives.from_strings('printf',
+                                                                 fmts)),
+    }
+
+def revision():
+    '''Returns the git commit of the tree being measured, or None.'''
+    try:
+        with open(os.devnull, 'w') as devnull:
+            out = subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                          cwd=ROOT, stderr=devnull)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.decode('ascii').strip()
+
+def run(corpora, rounds, import_runs):
+    results = {}
+    for corpus in corpora:
+        for dialect in sorted(CORPORA[corpus]):
+            results['%s/%s' % (dialect, corpus)] = bench_corpus(
+                dialect, corpus, rounds)
+    imports = {}
+    for dialect in sorted(PARSERS):
+        module = 'pyc_fmtstr_parser.%s_parse' % dialect
+        imports[module] = bench_import(module, import_runs)
+    return {
+        'revision': revision(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'machine': platform.machine(),
+        'rounds': rounds,
+        'results': results,
+        'imports': imports,
+    }
+
+def report(data):
+    print('%-20s %9s %9s %9s %11s %8s %9s' %
+          ('benchmark', 'p50 us', 'p90 us', 'p99 us', 'parses/s', 'blocks',
+           'peak B'))
+    for name, r in sorted(data['results'].items()):
+        print('%-20s %9.2f %9.2f %9.2f %11.0f %8s %9s' %
+              (name, r['p50'] * 1e6, r['p90'] * 1e6, r['p99'] * 1e6,
+               r['parses_per_s'],
+               '-' if r['alloc_blocks'] is None
+               else '%.1f' % r['alloc_blocks'],
+               '-' if r['alloc_peak_bytes'] is None
+               else r['alloc_peak_bytes']))
+    for module, r in sorted(data['imports'].items()):
+        print('import %-34s min %7.3f ms  median %7.3f ms' %
+              (module, r['min'] * 1e3, r['median'] * 1e3))
+
+def compare(old, new, threshold):
+    '''Prints the change in median latency of each benchmark in both runs
+    and returns the names of those that slowed down by more than threshold
+    percent.'''
+    slower = []
+    for name in sorted(set(old['results']) & set(new['results'])):
+        before = old['results'][name]['p50']
+        after = new['results'][name]['p50']
+        change = (after - before) / before * 100
+        flag = ''
+        if change > threshold:
+            slower.append(name)
+            flag = '  REGRESSION'
+        print('%-20s %9.2f -> %9.2f us  %+6.1f%%%s' %
+              (name, before * 1e6, after * 1e6, change, flag))
+    return slower
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('-n', '--rounds', type=int, default=200)
+    ap.add_argument('--import-runs', type=int, default=10)
+    ap.add_argument('-o', '--output', help='write the results to this file')
+    ap.add_argument('--compare', metavar='FILE',
+                    help='compare against the results in this file')
+    ap.add_argument('--threshold', type=float, default=10.0,
+                    help='slow-down, in percent, reported as a regression')
+    ap.add_argument('--directive-memory', type=int, nargs='?', const=20000,
+                    metavar='N', help='report the memory held per directive '
+                    'by N parsed strings instead')
+    ap.add_argument('corpora', nargs='*', metavar='corpus',
+                    help='one of %s (default: all)' % ', '.join(
+                        sorted(CORPORA)))
+    args = ap.parse_args(argv)
+    for corpus in args.corpora:
+        if corpus not in CORPORA:
+            ap.error('unknown corpus: %s' % corpus)
+
+    if args.directive_memory is not None:
+        sizes = directive_memory(args.directive_memory)
+        if sizes is None:
+            ap.error('--directive-memory needs tracemalloc')
+        print('bytes per directive, %d strings of 4 directives:' %
+              args.directive_memory)
+        print('  Directive/Directives/Argument objects  %4.0f' %
+              sizes['objects'])
+        print('  ColumnarDirectives                      %4.0f' %
+              sizes['columnar'])
+        return 0
+
+    data = run(args.corpora or sorted(CORPORA), args.rounds,
+               args.import_runs)
+    report(data)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(data, f, indent=1, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+        print()
+        print('compared with %s' % (old.get('revision') or args.compare))
+        if compare(old, data, args.threshold):
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
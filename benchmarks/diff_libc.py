@@ -0,0 +1,643 @@
+#!/usr/bin/env python
+'''Checks the parsers and compilers against the host's C library.
+
+    python benchmarks/diff_libc.py [-n COUNT] [--seed SEED] [--show N]
+                                   [--rounds ROUNDS] [dialect ...]
+
+Generates COUNT random format strings per dialect, with arguments (printf)
+or input text (scanf) to match, and runs each through the C library's
+snprintf or sscanf via ctypes, passing every argument as the C type that
+printf_parse or scanf_parse gives it:
+
+  - printf: the output must be what printf_compile()'s function returns;
+  - scanf: sscanf must assign every argument exactly when scanf_compile()'s
+    function matches, and then store the same values;
+  - both: a %n (or any scanf) target must not be written past the size of
+    the parser's type for it, which the targets' padding shows.
+
+Any differences are listed (the first N of each dialect), and the exit
+status is 1 if there were any.  The throughput of the C library and of the
+compiled functions on the same strings is then reported, calls to the C
+library including the cost of ctypes.
+
+One glibc quirk is allowed for rather than followed, as C leaves the 0 flag
+of a left-justified field undefined: in a numbered directive (%1$...) with
+a '*' width whose argument is negative, the 0 flag and no - flag, glibc
+pads a finite %f, %e or %g on the right with zeros rather than spaces, and
+doesn't pad %a at all.  printf_compile() pads such a field with spaces, as
+any other left-justified one; the output is accepted if it differs from
+glibc's only in those fields (see _glibc_zero_fill()).
+
+Nothing is fetched or built: only Python, ctypes and the host's libc are
+needed, on Linux with glibc (whose behaviour the compilers follow).'''
+
+from __future__ import print_function
+
+import argparse
+import ctypes
+import ctypes.util
+import locale
+import math
+import os
+import random
+import re
+import struct
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from pyc_fmtstr_parser import printf_parse as P
+from pyc_fmtstr_parser import scanf_parse as S
+from pyc_fmtstr_parser.printf_compile import printf_compile
+from pyc_fmtstr_parser.scanf_compile import scanf_compile
+
+clock = getattr(time, 'perf_counter', time.time)
+
+# Each target is padded with this byte, so that bytes written past the end
+# of the parser's type can be seen.
+_PAD = b'\xa5'
+_PAD_SIZE = 16
+
+def load_libc():
+    '''Returns the C library, with snprintf and sscanf set up, or raises
+    OSError.'''
+    libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6')
+    libc.snprintf.restype = ctypes.c_int
+    libc.sscanf.restype = ctypes.c_int
+    return libc
+
+# printf.
+
+_PA = P.Arg_type
+
+# The C type each argument is passed as, after the default promotions.
+_PRINTF_CTYPES = {
+    _PA.TYPE_SCHAR: ctypes.c_int,
+    _PA.TYPE_UCHAR: ctypes.c_uint,
+    _PA.TYPE_SHORT: ctypes.c_int,
+    _PA.TYPE_USHORT: ctypes.c_uint,
+    _PA.TYPE_INT: ctypes.c_int,
+    _PA.TYPE_UINT: ctypes.c_uint,
+    _PA.TYPE_LONGINT: ctypes.c_long,
+    _PA.TYPE_ULONGINT: ctypes.c_ulong,
+    _PA.TYPE_LONGLONGINT: ctypes.c_longlong,
+    _PA.TYPE_ULONGLONGINT: ctypes.c_ulonglong,
+    _PA.TYPE_DOUBLE: ctypes.c_double,
+    _PA.TYPE_LONGDOUBLE: ctypes.c_longdouble,
+    _PA.TYPE_CHAR: ctypes.c_int,
+    _PA.TYPE_WIDE_CHAR: ctypes.c_uint,
+    _PA.TYPE_STRING: ctypes.c_char_p,
+    _PA.TYPE_WIDE_STRING: ctypes.c_wchar_p,
+    _PA.TYPE_POINTER: ctypes.c_void_p,
+}
+
+# The type a %n argument points to.
+_PRINTF_COUNTS = {
+    _PA.TYPE_COUNT_SCHAR_POINTER: ctypes.c_byte,
+    _PA.TYPE_COUNT_SHORT_POINTER: ctypes.c_short,
+    _PA.TYPE_COUNT_INT_POINTER: ctypes.c_int,
+    _PA.TYPE_COUNT_LONGINT_POINTER: ctypes.c_long,
+    _PA.TYPE_COUNT_LONGLONGINT_POINTER: ctypes.c_longlong,
+}
+
+_PRINTF_LENGTHS = {
+    'd': ['', 'hh', 'h', 'l', 'll', 'j', 'z', 't'],
+    'f': ['', 'l', 'L'],
+    'c': ['', 'l'],
+    'n': ['', 'hh', 'h', 'l', 'll'],
+    'p': [''],
+    '%': [''],
+}
+for _c in 'iouxX':
+    _PRINTF_LENGTHS[_c] = _PRINTF_LENGTHS['d']
+for _c in 'FeEgGaA':
+    _PRINTF_LENGTHS[_c] = _PRINTF_LENGTHS['f']
+_PRINTF_LENGTHS['s'] = _PRINTF_LENGTHS['c']
+_PRINTF_LENGTHS['C'] = _PRINTF_LENGTHS['S'] = ['']
+del _c
+
+_WORD = 'abcdefghijklmnopqrstuvwxyz'
+_TEXT = _WORD + 'ABC XYZ 0123456789.,:;-_=/()[]{}\t\n'
+
+def _text(rng, n):
+    return ''.join(rng.choice(_TEXT) for _ in range(rng.randint(0, n)))
+
+def _int_range(ctype):
+    bits = ctypes.sizeof(ctype) * 8
+    if ctype(-1).value < 0:
+        return -(1 << (bits - 1)), (1 << (bits - 1)) - 1
+    return 0, (1 << bits) - 1
+
+def _random_int(rng, ctype):
+    lo, hi = _int_range(ctype)
+    kind = rng.random()
+    if kind < 0.3:
+        return max(lo, min(hi, rng.randint(-300, 300)))
+    if kind < 0.4:
+        return rng.choice([lo, hi, 0])
+    # Anywhere in the type's range, at any magnitude.
+    return max(lo, min(hi, rng.choice([1, -1]) *
+                       rng.getrandbits(rng.randint(1, hi.bit_length()))))
+
+def _random_float(rng):
+    kind = rng.random()
+    if kind < 0.1:
+        # float('nan') has the sign bit set on some platforms.
+        return rng.choice([0.0, -0.0, float('inf'), float('-inf'),
+                           math.copysign(float('nan'), 1),
+                           math.copysign(float('nan'), -1),
+                           5e-324, 1.7976931348623157e308])
+    if kind < 0.4:
+        return float(rng.randint(-100000, 100000)) / rng.choice([1, 4, 100])
+    return rng.uniform(-1, 1) * 10.0 ** rng.randint(-20, 20)
+
+def printf_case(rng):
+    '''Returns a random printf format string.'''
+    specs = []
+    nslots = 0
+    for _ in range(rng.randint(1, 5)):
+        conv = rng.choice('diouxXfFeEgGaAcsCSpn%')
+        if conv == '%':
+            specs.append(None)
+            continue
+        flags = ''.join(rng.sample("-+ #0'", rng.randint(0, 3)))
+        width = rng.choice(['', '', str(rng.randint(0, 30)), '*'])
+        precision = rng.choice(['', '', '.', '.%d' % rng.randint(0, 25),
+                                '.*'])
+        if conv in 'cCpn':
+            precision = ''
+        length = rng.choice(_PRINTF_LENGTHS[conv])
+        specs.append([flags, width, precision, length, conv])
+        nslots += (width == '*') + (precision == '.*') + 1
+    numbers = None
+    if rng.random() < 0.2:
+        numbers = list(range(1, nslots + 1))
+        rng.shuffle(numbers)
+    pieces = [_text(rng, 6).replace('%', '%%')]
+    for spec in specs:
+        if spec is None:
+            pieces.append('%%')
+        else:
+            flags, width, precision, length, conv = spec
+            if numbers is not None:
+                if width == '*':
+                    width = '*%d$' % numbers.pop()
+                if precision == '.*':
+                    precision = '.*%d$' % numbers.pop()
+                pieces.append('%%%d$' % numbers.pop())
+            else:
+                pieces.append('%')
+            pieces.append(flags + width + precision + length + conv)
+        pieces.append(_text(rng, 6).replace('%', '%%'))
+    return ''.join(pieces)
+
+def printf_args(rng, d, a):
+    '''Returns (C arguments, Python arguments, %n targets) for the parse
+    d, a of a format string; each target is (buffer, C type).'''
+    star = set()
+    for i in range(d.count):
+        dp = d.dir[i]
+        star.update(x for x in (dp.width_arg_index, dp.precision_arg_index)
+                    if x != P.ARG_NONE)
+    c_args = []
+    py_args = []
+    targets = []
+    for index in range(a.count):
+        type = a.arg[index].type
+        if type in _PRINTF_COUNTS:
+            buf = ctypes.create_string_buffer(_PAD * _PAD_SIZE, _PAD_SIZE)
+            targets.append((buf, _PRINTF_COUNTS[type]))
+            c_args.append(buf)
+            py_args.append(None)
+            continue
+        ctype = _PRINTF_CTYPES[type]
+        if index in star:
+            value = rng.randint(-20, 20)
+        elif type in (_PA.TYPE_DOUBLE, _PA.TYPE_LONGDOUBLE):
+            value = _random_float(rng)
+        elif type in (_PA.TYPE_CHAR, _PA.TYPE_WIDE_CHAR):
+            value = ord(rng.choice(_TEXT))
+        elif type in (_PA.TYPE_STRING, _PA.TYPE_WIDE_STRING):
+            value = None if rng.random() < 0.05 else _text(rng, 12)
+        elif type == _PA.TYPE_POINTER:
+            value = rng.choice([0, rng.getrandbits(48)])
+        else:
+            value = _random_int(rng, ctype)
+        py_args.append(value)
+        if type == _PA.TYPE_STRING and value is not None:
+            value = value.encode('latin-1')
+        c_args.append(ctype(value))
+    return c_args, py_args, targets
+
+def libc_snprintf(libc, fmt, args):
+    size = 256
+    while True:
+        buf = ctypes.create_string_buffer(size)
+        n = libc.snprintf(buf, size, fmt, *args)
+        if n < size:
+            return buf.raw[:max(n, 0)] if n >= 0 else None
+        size = n + 1
+
+def _overrun(buf, ctype):
+    # The number of bytes written past sizeof(ctype) in buf, going by the
+    # padding.
+    raw = buf.raw.rstrip(_PAD)
+    return max(0, len(raw) - ctypes.sizeof(ctype))
+
+def check_printf(libc, rng):
+    '''Generates and checks one printf case.  Returns (fmt, C arguments,
+    Python arguments, problem or None).'''
+    fmt = printf_case(rng)
+    d, a = P.printf_parse(fmt)
+    c_args, py_args, targets = printf_args(rng, d, a)
+    out = libc_snprintf(libc, fmt.encode('ascii'), c_args)
+    if out is None:
+        return fmt, c_args, py_args, 'snprintf failed'
+    out = out.decode('latin-1')
+    try:
+        ours = printf_compile(fmt, cache=False)(*py_args)
+    except Exception as e:
+        return fmt, c_args, py_args, 'printf_compile: %r' % (e,)
+    if ours != out and _glibc_zero_fill(fmt, d, py_args) != out:
+        return fmt, c_args, py_args, 'libc %r, printf_compile %r' % (out,
+                                                                     ours)
+    for buf, ctype in targets:
+        if _overrun(buf, ctype):
+            return fmt, c_args, py_args, (
+                '%%n wrote %r, more than a %s' % (buf.raw, ctype.__name__))
+    return fmt, c_args, py_args, None
+
+# The flags of a directive, after any argument number.
+_FLAGS_RE = re.compile(r"%(?:[0-9]+\$)?([-+ #0']*)")
+
+def _glibc_zero_fill(fmt, d, py_args):
+    # What glibc prints for fmt, a printf_parse() result d, if it differs
+    # from printf_compile() only by the quirk described at the top: each
+    # directive is printed on its own, without its argument numbers, and the
+    # quirky ones without their widths, to be padded as glibc does.  None if
+    # no directive is quirky.
+    pieces = []
+    quirky = False
+    pos = 0
+    for dp in d.dir[:d.count]:
+        pieces.append(fmt[pos:dp.dir_start])
+        pos = dp.dir_end
+        if dp.conversion == '%':
+            pieces.append('%')
+            continue
+        text = fmt[dp.dir_start:dp.dir_end]
+        flags = _FLAGS_RE.match(text).group(1)
+        args = []
+        width = pad = None
+        if dp.width_arg_index != P.ARG_NONE:
+            width = py_args[dp.width_arg_index]
+        elif dp.width_start is not None:
+            width = int(fmt[dp.width_start:dp.width_end])
+        precision = ''
+        if dp.precision_arg_index != P.ARG_NONE:
+            if py_args[dp.precision_arg_index] >= 0:
+                precision = '.%d' % py_args[dp.precision_arg_index]
+        elif dp.precision_start is not None:
+            precision = fmt[dp.precision_start:dp.precision_end]
+        value = None
+        if dp.arg_index != P.ARG_NONE:
+            value = py_args[dp.arg_index]
+            args.append(value)
+        if ('$' in text and dp.width_arg_index != P.ARG_NONE and
+                width < 0 and
+                dp.flags & (P.FLAG_ZERO | P.FLAG_LEFT) == P.FLAG_ZERO and
+                dp.conversion in 'fFeEgGaA' and
+                not (math.isinf(value) or math.isnan(value))):
+            quirky = True
+            pad = -width
+            width = None
+        spec = '%' + flags
+        if width is not None:
+            spec += '%d' % width
+        body = printf_compile(spec + precision + dp.length + dp.conversion,
+                              cache=False)(*args)
+        if pad is not None and dp.conversion not in 'aA':
+            body += '0' * (pad - len(body))
+        pieces.append(body)
+    if not quirky:
+        return None
+    pieces.append(fmt[pos:])
+    return ''.join(pieces)
+
+# scanf.
+
+_SA = S.Arg_type
+
+# The C type each argument points to; strings are buffers of characters.
+_SCANF_CTYPES = {
+    _SA.TYPE_SCHAR: ctypes.c_byte,
+    _SA.TYPE_UCHAR: ctypes.c_ubyte,
+    _SA.TYPE_SHORT: ctypes.c_short,
+    _SA.TYPE_USHORT: ctypes.c_ushort,
+    _SA.TYPE_INT: ctypes.c_int,
+    _SA.TYPE_UINT: ctypes.c_uint,
+    _SA.TYPE_LONGINT: ctypes.c_long,
+    _SA.TYPE_ULONGINT: ctypes.c_ulong,
+    _SA.TYPE_LONGLONGINT: ctypes.c_longlong,
+    _SA.TYPE_ULONGLONGINT: ctypes.c_ulonglong,
+    _SA.TYPE_FLOAT: ctypes.c_float,
+    _SA.TYPE_DOUBLE: ctypes.c_double,
+    _SA.TYPE_LONGDOUBLE: ctypes.c_longdouble,
+    _SA.TYPE_POINTER: ctypes.c_void_p,
+    _SA.TYPE_NUMREAD: ctypes.c_int,
+    _SA.TYPE_CHAR: ctypes.c_char,
+    _SA.TYPE_STRING: ctypes.c_char,
+    _SA.TYPE_CHARSEQ: ctypes.c_char,
+    _SA.TYPE_WIDE_CHAR: ctypes.c_wchar,
+    _SA.TYPE_WIDE_STRING: ctypes.c_wchar,
+}
+
+_SCANF_LENGTHS = {
+    'd': ['', 'hh', 'h', 'l', 'll', 'j', 'z', 't'],
+    'f': ['', 'l', 'L'],
+    's': ['', 'l'],
+    'n': [''],
+    'p': [''],
+}
+for _c in 'iouxX':
+    _SCANF_LENGTHS[_c] = _SCANF_LENGTHS['d']
+for _c in 'aAeEFgG':
+    _SCANF_LENGTHS[_c] = _SCANF_LENGTHS['f']
+_SCANF_LENGTHS['c'] = _SCANF_LENGTHS['['] = _SCANF_LENGTHS['s']
+del _c
+
+# The conversions scanf_parse accepts, of those C99 has.
+_SCANF_CONVERSIONS = [c for c in 'diouxXaAeEfFgGcs[pn%'
+                      if c in S.DIALECT.conversions]
+
+_SCANSETS = [('[a-z]', 'abcxyz'), ('[^,]', 'ab cd;e'), ('[0-9a-f]', '0a9f'),
+             ('[]a]', 'a]a'), ('[^]\n]', 'x-y'), ('[a-c-]', 'a-b-c')]
+
+def _scanf_input(rng, conv):
+    # Text that conversion conv will likely read all of.
+    if conv in 'di':
+        value = rng.randint(-1, 1) << rng.choice([0, 7, 15, 31, 63, 70])
+        value += rng.randint(-300, 300)
+        if conv == 'i' and rng.random() < 0.5:
+            return ('-' if value < 0 else '') + rng.choice(
+                ['0x%x', '0%o']) % abs(value)
+        return str(value)
+    if conv == 'u':
+        return str(rng.getrandbits(rng.choice([7, 16, 31, 40, 64])))
+    if conv == 'o':
+        return '%o' % rng.getrandbits(rng.choice([6, 20, 40, 64]))
+    if conv in 'xXp':
+        return rng.choice(['', '0x']) + '%x' % rng.getrandbits(
+            rng.choice([8, 20, 40, 64]))
+    if conv in 'aAeEfFgG':
+        if rng.random() < 0.1:
+            return str(rng.randint(-99, 99))
+        return rng.choice(['%.6g', '%.3f', '%.10e']) % _random_float(rng)
+    if conv == 'c':
+        return ''.join(rng.choice(_WORD) for _ in range(12))
+    if conv == 's':
+        return ''.join(rng.choice(_WORD) for _ in range(rng.randint(1, 9)))
+    return ''
+
+def scanf_case(rng):
+    '''Returns a random scanf format string and input text for it.'''
+    fmt = []
+    text = []
+    for _ in range(rng.randint(1, 5)):
+        sep = rng.choice(['', ' ', ',', ' : '])
+        fmt.append(sep)
+        text.append(sep if rng.random() < 0.95 else ' ')
+        conv = rng.choice(_SCANF_CONVERSIONS)
+        if conv == '%':
+            fmt.append('%%')
+            text.append('%')
+            continue
+        suppress = '*' if conv != 'n' and rng.random() < 0.15 else ''
+        width = ''
+        if conv != 'n' and rng.random() < 0.3:
+            width = str(rng.randint(1, 12))
+        length = rng.choice(_SCANF_LENGTHS[conv])
+        if conv == '[':
+            scanset, chars = rng.choice(_SCANSETS)
+            fmt.append('%' + suppress + width + length + scanset)
+            text.append(''.join(rng.choice(chars)
+                                for _ in range(rng.randint(1, 8))))
+        else:
+            fmt.append('%' + suppress + width + length + conv)
+            text.append(_scanf_input(rng, conv))
+    text = ''.join(text)
+    if rng.random() < 0.1:
+        text = text[:rng.randint(0, len(text))]
+    return ''.join(fmt), text
+
+def _directive_of(d, index):
+    for i in range(d.count):
+        if d.dir[i].arg_index == index:
+            return d.dir[i]
+    return None
+
+def scanf_targets(d, a, text):
+    '''Returns (buffer, C type, count) for each argument of the parse d, a
+    of a format string to be matched against text: the target holds count
+    of the C type, as the parser's type for the argument says.  It is
+    followed by padding, and made large enough for anything sscanf could
+    store for the text, so that a wrong type can be seen and not corrupt
+    memory.'''
+    room = max(16, ctypes.sizeof(ctypes.c_wchar) * (len(text) + 1))
+    targets = []
+    for index in range(a.count):
+        ctype = _SCANF_CTYPES[a.arg[index].type]
+        count = 1
+        if ctype in (ctypes.c_char, ctypes.c_wchar):
+            count = len(text) + 1
+        size = max(room, ctypes.sizeof(ctype) * count) + _PAD_SIZE
+        targets.append((ctypes.create_string_buffer(_PAD * size, size),
+                        ctype, count))
+    return targets
+
+def _stored(buf, ctype, count, fmt, dp, type):
+    # The value in a target, as scanf_compile() would give it.
+    if ctype not in (ctypes.c_char, ctypes.c_wchar):
+        value = ctype.from_buffer_copy(buf.raw[:ctypes.sizeof(ctype)]).value
+        if type == _SA.TYPE_POINTER and value is None:
+            value = 0
+        return value
+    size = ctypes.sizeof(ctype)
+    units = [buf.raw[i:i + size] for i in range(0, size * count, size)]
+    if dp.conversion == 'c':
+        # No NUL is stored, and the end of the input may have cut the field
+        # short, leaving padding.
+        units = units[:int(fmt[dp.width_start:dp.width_end])
+                      if dp.width_start is not None else 1]
+        while units and units[-1] == _PAD * size:
+            units.pop()
+    else:
+        units = units[:units.index(b'\0' * size)]
+    s = b''.join(units)
+    if size == 1:
+        return s.decode('latin-1')
+    return s.decode('utf-32-le' if sys.byteorder == 'little'
+                    else 'utf-32-be')
+
+def check_scanf(libc, rng):
+    '''Generates and checks one scanf case.  Returns (fmt, text, problem or
+    None).'''
+    fmt, text = scanf_case(rng)
+    d, a = S.scanf_parse(fmt)
+    targets = scanf_targets(d, a, text)
+    ret = libc.sscanf(text.encode('latin-1'), fmt.encode('ascii'),
+                      *[buf for buf, ctype, count in targets])
+    try:
+        ours = scanf_compile(fmt, cache=False)(text)
+    except Exception as e:
+        return fmt, text, 'scanf_compile: %r' % (e,)
+
+    nassign = sum(1 for index in range(a.count)
+                  if a.arg[index].type != _SA.TYPE_NUMREAD)
+    # sscanf's count leaves out %n, so whether each was stored is told by
+    # its padding (a count is never 0xa5a5a5a5).
+    complete = max(ret, 0) == nassign and all(
+        buf.raw[:ctypes.sizeof(ctype)] != _PAD * ctypes.sizeof(ctype)
+        for index, (buf, ctype, count) in enumerate(targets)
+        if a.arg[index].type == _SA.TYPE_NUMREAD)
+    for index, (buf, ctype, count) in enumerate(targets):
+        pad = buf.raw[ctypes.sizeof(ctype) * count:]
+        if pad != _PAD * len(pad):
+            return fmt, text, 'sscanf wrote past a %s for argument %d' % (
+                ctype.__name__, index + 1)
+    if not complete:
+        if ours is not None:
+            return fmt, text, ('sscanf assigned %d of %d, scanf_compile '
+                               'matched %r' % (ret, nassign, ours[0]))
+        return fmt, text, None
+    if ours is None:
+        return fmt, text, 'sscanf assigned all %d, scanf_compile none' % (
+            nassign,)
+    values = []
+    for index, (buf, ctype, count) in enumerate(targets):
+        values.append(_stored(buf, ctype, count, fmt, _directive_of(d, index),
+                              a.arg[index].type))
+    expected = []
+    for index, value in enumerate(ours[0]):
+        ctype = targets[index][1]
+        if ctype is ctypes.c_float:
+            value = struct.unpack('f', struct.pack('f', value))[0]
+        expected.append(value)
+    if not _same(values, expected):
+        return fmt, text, 'sscanf stored %r, scanf_compile %r' % (
+            tuple(values), tuple(expected))
+    return fmt, text, None
+
+def _same(a, b):
+    # Equal, with NaNs equal to each other.
+    return len(a) == len(b) and all(
+        x == y or (x != x and y != y) for x, y in zip(a, b))
+
+# Throughput.
+
+def _rate(func, items, rounds):
+    t = clock()
+    for _ in range(rounds):
+        for item in items:
+            func(item)
+    return rounds * len(items) / (clock() - t)
+
+def throughput(libc, printf_cases, scanf_cases, rounds):
+    '''Returns (name, calls per second) for each way of formatting the
+    printf cases and reading the scanf cases.'''
+    results = []
+    if printf_cases:
+        calls = [(fmt.encode('ascii'), c_args,
+                  printf_compile(fmt, cache=False), py_args)
+                 for fmt, c_args, py_args in printf_cases]
+        buf = ctypes.create_string_buffer(4096)
+        results.append(('printf_parse', _rate(
+            lambda c: P.printf_parse(c[0]), printf_cases, rounds)))
+        results.append(('printf_compile', _rate(
+            lambda c: printf_compile(c[0], cache=False), printf_cases,
+            max(1, rounds // 10))))
+        results.append(('libc snprintf', _rate(
+            lambda c: libc.snprintf(buf, 4096, c[0], *c[1]), calls, rounds)))
+        results.append(('compiled printf', _rate(
+            lambda c: c[2](*c[3]), calls, rounds)))
+    if scanf_cases:
+        calls = []
+        for fmt, text in scanf_cases:
+            d, a = S.scanf_parse(fmt)
+            calls.append((fmt.encode('ascii'), text.encode('latin-1'),
+                          [buf for buf, ctype, count in
+                           scanf_targets(d, a, text)],
+                          scanf_compile(fmt, cache=False), text))
+        results.append(('scanf_parse', _rate(
+            lambda c: S.scanf_parse(c[0]), scanf_cases, rounds)))
+        results.append(('scanf_compile', _rate(
+            lambda c: scanf_compile(c[0], cache=False), scanf_cases,
+            max(1, rounds // 10))))
+        results.append(('libc sscanf', _rate(
+            lambda c: libc.sscanf(c[1], c[0], *c[2]), calls, rounds)))
+        results.append(('compiled scanf', _rate(
+            lambda c: c[3](c[4]), calls, rounds)))
+    return results
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('-n', '--count', type=int, default=5000,
+                    help='format strings per dialect')
+    ap.add_argument('--seed', type=int, default=0)
+    ap.add_argument('--show', type=int, default=10, metavar='N',
+                    help='differences to list per dialect')
+    ap.add_argument('--rounds', type=int, default=5,
+                    help='rounds over the strings when timing; 0 to skip')
+    ap.add_argument('dialects', nargs='*', metavar='dialect',
+                    help='printf or scanf (default: both)')
+    args = ap.parse_args(argv)
+    dialects = args.dialects or ['printf', 'scanf']
+    for dialect in dialects:
+        if dialect not in ('printf', 'scanf'):
+            ap.error('unknown dialect: %s' % dialect)
+    try:
+        libc = load_libc()
+    except OSError as e:
+        print('cannot load the C library: %s' % e, file=sys.stderr)
+        return 2
+    # The compilers follow the C locale, as a program that never calls
+    # setlocale() sees it.
+    locale.setlocale(locale.LC_ALL, 'C')
+
+    rng = random.Random(args.seed)
+    failed = False
+    printf_cases = []
+    scanf_cases = []
+    for dialect in dialects:
+        problems = []
+        for _ in range(args.count):
+            if dialect == 'printf':
+                fmt, c_args, py_args, problem = check_printf(libc, rng)
+                if problem is None:
+                    printf_cases.append((fmt, c_args, py_args))
+                else:
+                    problems.append('%r %r: %s' % (fmt, py_args, problem))
+            else:
+                fmt, text, problem = check_scanf(libc, rng)
+                if problem is None:
+                    scanf_cases.append((fmt, text))
+                else:
+                    problems.append('%r on %r: %s' % (fmt, text, problem))
+        print('%s: %d strings, %d differences' % (dialect, args.count,
+                                                  len(problems)))
+        for problem in problems[:args.show]:
+            print('  ' + problem)
+        failed = failed or bool(problems)
+
+    if args.rounds:
+        print()
+        print('%-16s %12s' % ('', 'calls/s'))
+        for name, rate in throughput(libc, printf_cases, scanf_cases,
+                                     args.rounds):
+            print('%-16s %12.0f' % (name, rate))
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
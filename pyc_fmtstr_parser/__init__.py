@@ -0,0 +1,21 @@
+'''Parsers for C printf and scanf format strings.
+
+Submodules are imported on first use, so importing the package costs nothing
+and using one parser never loads the other.'''
+
+_submodules = frozenset(['abi', 'batch', 'buffers', 'cache', 'catalog',
+                         'classify', 'columnar', 'diagnostics', 'diskcache',
+                         'engine', 'incremental', 'iterparse', 'lru',
+                         'prescan', 'printf_compile', 'printf_parse', 'query',
+                         'scan', 'scanf_compile', 'scanf_parse',
+                         'sharedcache', 'stats'])
+
+def __getattr__(name):
+    # Python 3.7+; on older versions import the submodules explicitly.
+    if name in _submodules:
+        from importlib import import_module
+        return import_module('.' + name, __name__)
+    raise AttributeError('module %r has no attribute %r' % (__name__, name))
+
+def __dir__():
+    return sorted(set(globals()) | _submodules)
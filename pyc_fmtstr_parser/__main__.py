@@ -0,0 +1,167 @@
+# Copyright (C) 2014, Mark Laws.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program; if not, see <http://www.gnu.org/licenses/>.
+
+'''Scans C sources and binaries for format strings and parses them.
+
+    python -m pyc_fmtstr_parser [-j JOBS] [-o FILE] [--dialect DIALECT]
+                                [--abi ABI] [--raw] [--chunk-size BYTES]
+                                [--max-length BYTES] [-q] path ...
+
+Writes one JSON object per format string found under the paths, in file
+order, as the scan module describes.  Jobs (a source file, or a chunk of a
+binary's read-only data) run across JOBS processes (default: one per CPU;
+1 runs them in this process), with at most a few jobs per process in flight
+at once, so memory stays bounded however large the input.  Progress and
+throughput go to stderr every second unless -q is given.'''
+
+from __future__ import print_function
+
+import argparse
+import collections
+import functools
+import io
+import sys
+import time
+
+from .scan import jobs, scan_job
+
+# Jobs in flight per worker process.
+_WINDOW = 4
+
+class _Progress(object):
+    __slots__ = ['out', 'quiet', 'tty', 'start', 'last', 'jobs', 'bytes',
+                 'strings', 'files', '_path']
+
+    def __init__(self, out, quiet):
+        self.out = out
+        self.quiet = quiet
+        self.tty = out.isatty()
+        self.start = self.last = time.time()
+        self.jobs = self.bytes = self.strings = self.files = 0
+        self._path = None
+
+    def update(self, job, nbytes, nstrings):
+        self.jobs += 1
+        self.bytes += nbytes
+        self.strings += nstrings
+        if job[1] != self._path:
+            self._path = job[1]
+            self.files += 1
+        now = time.time()
+        if not self.quiet and now - self.last >= 1:
+            self.last = now
+            # Overwrite the last report on a terminal.
+            self.report(now, '\r' if self.tty else '\n')
+
+    def report(self, now, end):
+        elapsed = max(now - self.start, 1e-9)
+        self.out.write('%d files, %.1f MB, %d strings in %.1fs: '
+                       '%.0f strings/s, %.1f MB/s%s' % (
+                           self.files, self.bytes / 1e6, self.strings,
+                           elapsed, self.strings / elapsed,
+                           self.bytes / 1e6 / elapsed, end))
+        self.out.flush()
+
+    def finish(self):
+        if not self.quiet:
+            self.report(time.time(), '\n')
+
+def _results(work, todo, nworkers):
+    # Yields (job, result) in job order, with at most _WINDOW jobs per worker
+    # in flight.
+    if nworkers == 1:
+        for job in todo:
+            yield job, work(job)
+        return
+    import multiprocessing
+    pool = multiprocessing.Pool(nworkers)
+    try:
+        pending = collections.deque()
+        for job in todo:
+            pending.append((job, pool.apply_async(work, (job,))))
+            if len(pending) >= nworkers * _WINDOW:
+                job, result = pending.popleft()
+                yield job, result.get()
+        while pending:
+            job, result = pending.popleft()
+            yield job, result.get()
+    finally:
+        pool.terminate()
+        pool.join()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m pyc_fmtstr_parser',
+        description='Find and parse the format strings in C sources (printf '
+        'and scanf calls) and ELF or PE binaries (read-only data), writing '
+        'one JSON object per string.')
+    parser.add_argument('paths', nargs='+', metavar='path',
+                        help='file or directory to scan')
+    parser.add_argument('-j', '--jobs', type=int, default=0,
+                        help='worker processes (default: one per CPU)')
+    parser.add_argument('-o', '--output', help='write to this file '
+                        'instead of stdout')
+    parser.add_argument('--dialect', choices=['printf', 'scanf'],
+                        default='printf',
+                        help='dialect of the strings in binaries')
+    parser.add_argument('--abi', help='ABI profile to parse for (default: '
+                        'the host\'s)')
+    parser.add_argument('--raw', action='store_true', help='scan files that '
+                        'are neither sources nor ELF or PE binaries as raw '
+                        'data')
+    parser.add_argument('--chunk-size', type=int, default=1 << 22,
+                        metavar='BYTES', help='bytes of a binary per job')
+    parser.add_argument('--max-length', type=int, default=4096,
+                        metavar='BYTES', help='longest string in a binary '
+                        'to consider')
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help='don\'t report progress')
+    args = parser.parse_args(argv)
+    if args.chunk_size < 1 or args.max_length < 1:
+        parser.error('--chunk-size and --max-length must be >= 1')
+    if args.abi is not None:
+        from .abi import get_profile
+        try:
+            get_profile(args.abi)
+        except ValueError as e:
+            parser.error(str(e))
+
+    nworkers = args.jobs
+    if nworkers < 1:
+        import multiprocessing
+        nworkers = multiprocessing.cpu_count()
+    if args.output:
+        out = io.open(args.output, 'w', encoding='utf-8')
+    else:
+        out = sys.stdout
+    progress = _Progress(sys.stderr, args.quiet)
+    work = functools.partial(scan_job, dialect=args.dialect, abi=args.abi,
+                             max_length=args.max_length)
+    todo = jobs(args.paths, args.chunk_size, args.raw)
+    try:
+        for job, (lines, nbytes, nstrings) in _results(work, todo, nworkers):
+            for line in lines:
+                out.write(u'%s\n' % line)
+            progress.update(job, nbytes, nstrings)
+    except KeyboardInterrupt:
+        return 130
+    finally:
+        progress.finish()
+        if out is not sys.stdout:
+            out.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,180 @@
+# Copyright (C) 2014, Mark Laws.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program; if not, see <http://www.gnu.org/licenses/>.
+
+'''Target ABI profiles: the sizes of the C types that length modifiers name.
+
+The parsers map a length modifier plus conversion character to a C type such
+as TYPE_LONGINT.  Only 'z', 'j' and 't' depend on the target, since they
+name typedefs (size_t, intmax_t, ptrdiff_t) that are int, long or long long
+depending on the ABI.  A profile also gives the format of long double,
+which printf_compile needs for %La.'''
+
+import os
+import struct
+import sys
+
+# The C type of each integer argument type, by Arg_type name, and whether it
+# is signed.
+_INTEGER_TYPES = {
+    'TYPE_SCHAR': ('char', True),
+    'TYPE_UCHAR': ('char', False),
+    'TYPE_SHORT': ('short', True),
+    'TYPE_USHORT': ('short', False),
+    'TYPE_INT': ('int', True),
+    'TYPE_UINT': ('int', False),
+    'TYPE_LONGINT': ('long', True),
+    'TYPE_ULONGINT': ('long', False),
+    'TYPE_LONGLONGINT': ('long_long', True),
+    'TYPE_ULONGLONGINT': ('long_long', False),
+}
+
+class AbiProfile(object):
+    '''Sizes in bytes of the C types of one target ABI, and the bits of
+    precision of its long double (LDBL_MANT_DIG): 53 where it is the same
+    as double, 64 for the x87's 80-bit format, 113 for IEEE quad.
+
+    sizes is a tuple of all of those, which, unlike the name, tells apart
+    profiles that give different results; caches key by it.'''
+    __slots__ = ['name', 'int', 'long', 'long_long', 'size_t', 'ptrdiff_t',
+                 'intmax_t', 'wchar_t', 'long_double_digits', 'sizes',
+                 'z_flags', 'j_flags', 't_flags', 'length_steps']
+
+    def __init__(self, name, int, long, long_long, size_t, ptrdiff_t,
+                 intmax_t, wchar_t, long_double_digits=53):
+        self.name = name
+        self.int = int
+        self.long = long
+        self.long_long = long_long
+        self.size_t = size_t
+        self.ptrdiff_t = ptrdiff_t
+        self.intmax_t = intmax_t
+        self.wchar_t = wchar_t
+        self.long_double_digits = long_double_digits
+        self.sizes = (int, long, long_long, size_t, ptrdiff_t, intmax_t,
+                      wchar_t, long_double_digits)
+        # How each typedef modifier adjusts the parsers' type/size flags:
+        # long long (16), long (8) or int (0).
+        self.z_flags = self._flags_for(size_t)
+        self.j_flags = self._flags_for(intmax_t)
+        self.t_flags = self._flags_for(ptrdiff_t)
+        # What each modifier but 'h' and 'L' adds to the flags.
+        self.length_steps = {'l': 8, 'z': self.z_flags, 'j': self.j_flags,
+                             't': self.t_flags}
+
+    def _flags_for(self, size):
+        if size > self.long:
+            return 16
+        elif size > self.int:
+            return 8
+        return 0
+
+    def length_flags(self, length):
+        '''Returns the type/size flags that the parsers compute for the raw
+        length modifier length (e.g. 'hh', 'll', 'z').'''
+        flags = 0
+        for c in length:
+            if c == 'h':
+                flags |= (1 << (flags & 1))
+            elif c == 'L':
+                flags |= 4
+            elif c in self.length_steps:
+                flags += self.length_steps[c]
+            else:
+                raise ValueError('bad length modifier: %r' % (length,))
+        return flags
+
+    def integer_bits(self, Arg_type, type):
+        '''Returns the width in bits and the signedness of the integer
+        argument type, a value of a parser's Arg_type, as (bits, signed), or
+        None if type isn't an integer type.'''
+        try:
+            name, signed = _INTEGER_TYPES[Arg_type.name(type)]
+        except (KeyError, ValueError):
+            return None
+        if name == 'char':
+            return 8, signed
+        if name == 'short':
+            return 16, signed
+        return getattr(self, name) * 8, signed
+
+    def __repr__(self):
+        return ('AbiProfile(%r, int=%d, long=%d, long_long=%d, size_t=%d, '
+                'ptrdiff_t=%d, intmax_t=%d, wchar_t=%d, '
+                'long_double_digits=%d)' %
+                (self.name, self.int, self.long, self.long_long, self.size_t,
+                 self.ptrdiff_t, self.intmax_t, self.wchar_t,
+                 self.long_double_digits))
+
+# LDBL_MANT_DIG by machine, for the hosts where long double isn't double.
+_LONG_DOUBLE_DIGITS = {
+    'x86_64': 64, 'amd64': 64, 'i386': 64, 'i486': 64, 'i586': 64,
+    'i686': 64, 'aarch64': 113, 's390x': 113, 'riscv64': 113,
+}
+
+def _host_long_double_digits():
+    # MSVC's long double is double, as is Apple's on arm64.
+    if sys.platform == 'win32':
+        return 53
+    machine = os.uname()[4].lower()
+    if sys.platform == 'darwin' and machine == 'arm64':
+        return 53
+    return _LONG_DOUBLE_DIGITS.get(machine, 53)
+
+def _host_profile():
+    calcsize = struct.calcsize
+    try:
+        size_t = calcsize('N')
+        ptrdiff_t = calcsize('n')
+    except struct.error:
+        # Python 2 has neither; both are pointer-sized on every host it runs
+        # on.
+        size_t = ptrdiff_t = calcsize('P')
+    return AbiProfile('host', int=calcsize('i'), long=calcsize('l'),
+                      long_long=calcsize('q'), size_t=size_t,
+                      ptrdiff_t=ptrdiff_t, intmax_t=calcsize('q'),
+                      wchar_t=2 if sys.platform == 'win32' else 4,
+                      long_double_digits=_host_long_double_digits())
+
+# The Unix profiles have the x87 long double of i386 and x86-64.
+ILP32 = AbiProfile('ilp32', int=4, long=4, long_long=8, size_t=4,
+                   ptrdiff_t=4, intmax_t=8, wchar_t=4, long_double_digits=64)
+LP64 = AbiProfile('lp64', int=4, long=8, long_long=8, size_t=8, ptrdiff_t=8,
+                  intmax_t=8, wchar_t=4, long_double_digits=64)
+LLP64 = AbiProfile('llp64', int=4, long=4, long_long=8, size_t=8,
+                   ptrdiff_t=8, intmax_t=8, wchar_t=2)
+HOST = _host_profile()
+
+profiles = {}
+
+def register_profile(profile):
+    '''Makes profile available to get_profile() under its name, replacing
+    any existing profile of that name.'''
+    profiles[profile.name] = profile
+
+def get_profile(abi):
+    '''Returns the profile registered as abi, or abi itself if it is already
+    an AbiProfile.  None means the host's profile.'''
+    if abi is None:
+        return HOST
+    if isinstance(abi, AbiProfile):
+        return abi
+    try:
+        return profiles[abi]
+    except KeyError:
+        raise ValueError('unknown ABI profile: %r' % (abi,))
+
+for _profile in (ILP32, LP64, LLP64, HOST):
+    register_profile(_profile)
+del _profile
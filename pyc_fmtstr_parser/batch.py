@@ -0,0 +1,284 @@
+# Copyright (C) 2014, Mark Laws.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program; if not, see <http://www.gnu.org/licenses/>.
+
+'''Batch parsing of many format strings, serially or across a thread or
+process pool.
+
+Results cross process boundaries in a packed form made only of tuples, ints
+and short strings, which pickles cheaply under any protocol, unlike the
+__slots__ result classes.  See pack() for the layout.'''
+
+import collections
+from importlib import import_module
+from itertools import islice
+
+try:
+    text_type = basestring
+except NameError:
+    text_type = str
+
+EXECUTOR_SERIAL = 'serial'
+EXECUTOR_THREAD = 'thread'
+EXECUTOR_PROCESS = 'process'
+
+ERRORS_RAISE = 'raise'     # re-raise the first parse error, in input order
+ERRORS_RETURN = 'return'   # put the exception instance in place of a result
+
+# Chunks in flight per pool worker.
+_WINDOW = 4
+
+# Parser module for each dialect, imported on first use so that working with
+# one dialect doesn't load the other.
+_dialects = dict.fromkeys(['printf', 'scanf'])
+
+def parser_module(dialect):
+    '''Returns the parser module of the dialect ('printf' or 'scanf'),
+    importing it if need be.'''
+    try:
+        mod = _dialects[dialect]
+    except KeyError:
+        raise ValueError('unknown dialect: %r' % (dialect,))
+    if mod is None:
+        mod = _dialects[dialect] = import_module('.%s_parse' % dialect,
+                                                 __package__)
+    return mod
+
+def pack(dialect, d, a):
+    '''Packs a parse result into a tuple of plain values:
+
+        (count, max_width_length, max_precision_length, fields, end, types)
+
+    fields holds every slot of every directive, in Directive.__slots__ order,
+    laid end to end, with each Scanset as its (bits, ranges, negate); end is
+    the dir_start of the trailing sentinel; types holds the Arg_type of each
+    argument.  max_precision_length is None for dialects without
+    precisions.  The tuple pickles and marshals as it is.'''
+    slots = parser_module(dialect).Directive.__slots__
+    fields = []
+    extend = fields.extend
+    for dp in d.dir[:d.count]:
+        extend([getattr(dp, name, None) for name in slots])
+    field = _scanset_field(dialect)
+    if field is not None:
+        i, nslots = field
+        for j in range(i, len(fields), nslots):
+            s = fields[j]
+            if s is not None:
+                fields[j] = (s.bits, s.ranges, s.negate)
+    return (d.count, d.max_width_length,
+            getattr(d, 'max_precision_length', None), tuple(fields),
+            d.dir[d.count].dir_start, tuple(x.type for x in a.arg))
+
+# The position of the scanset among a directive's packed fields, and the
+# number of fields, for each dialect; None for dialects without scansets.
+_scanset_fields = {}
+
+def _scanset_field(dialect):
+    try:
+        return _scanset_fields[dialect]
+    except KeyError:
+        slots = parser_module(dialect).Directive.__slots__
+        field = _scanset_fields[dialect] = (
+            (slots.index('scanset'), len(slots)) if 'scanset' in slots
+            else None)
+        return field
+
+def unpack_fields(dialect, fields):
+    '''Returns the fields of a packed result (see pack()) with the scansets,
+    which are packed as tuples, rebuilt as Scansets.'''
+    field = _scanset_field(dialect)
+    if field is None:
+        return fields
+    i, nslots = field
+    Scanset = parser_module(dialect).Scanset
+    fields = list(fields)
+    for j in range(i, len(fields), nslots):
+        if fields[j] is not None:
+            fields[j] = Scanset(*fields[j])
+    return fields
+
+# Directive builder for each dialect; see _builder().
+_builders = {}
+
+def _builder(dialect):
+    # Returns build(fields, count, append), which appends count new
+    # Directives made from the packed fields.  It is generated so that each
+    # directive is filled in by one tuple assignment: this is the hot loop
+    # when unpacking results from worker processes or the disk cache, and
+    # setting the slots one call at a time costs several times as much.
+    try:
+        return _builders[dialect]
+    except KeyError:
+        pass
+    Directive = parser_module(dialect).Directive
+    slots = Directive.__slots__
+    nslots = len(slots)
+    lines = [
+        'def build(fields, count, append):',
+        '    new = object.__new__',
+        '    for i in range(0, count * %d, %d):' % (nslots, nslots),
+        '        dp = new(Directive)',
+        '        %s = fields[i:i + %d]' % (
+            ', '.join('dp.' + name for name in slots), nslots),
+        '        append(dp)',
+    ]
+    namespace = {'Directive': Directive}
+    exec('\n'.join(lines), namespace)
+    build = _builders[dialect] = namespace['build']
+    return build
+
+def unpack(dialect, packed):
+    '''Rebuilds the (Directives, Arguments) pair from the output of pack().'''
+    mod = parser_module(dialect)
+    count, max_width_length, max_precision_length, fields, end, types = packed
+
+    d = mod.Directives()
+    _builder(dialect)(unpack_fields(dialect, fields), count, d.dir.append)
+    d.count = count
+    sentinel = mod.Directive()
+    sentinel.dir_start = end
+    d.dir.append(sentinel)
+    d.max_width_length = max_width_length
+    if max_precision_length is not None:
+        d.max_precision_length = max_precision_length
+
+    a = mod.Arguments()
+    for type in types:
+        arg = mod.Argument()
+        arg.type = type
+        a.arg.append(arg)
+    a.count = len(types)
+
+    return d, a
+
+def _chunks(iterable, chunksize):
+    it = iter(iterable)
+    while True:
+        chunk = list(islice(it, chunksize))
+        if not chunk:
+            return
+        yield chunk
+
+def _imap(pool, nworkers, jobs):
+    # Yields _parse_chunk(job) for each of jobs in order, with at most
+    # _WINDOW jobs per worker in flight.  Pool.imap() would read all of jobs
+    # (and so all of the input) ahead of the results.
+    pending = collections.deque()
+    for job in jobs:
+        pending.append(pool.apply_async(_parse_chunk, (job,)))
+        if len(pending) >= nworkers * _WINDOW:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+def _parse_chunk(job):
+    # Runs in the worker; must stay a module-level function so that it can be
+    # pickled by multiprocessing.
+    dialect, packed, fmts, abi = job
+    mod = parser_module(dialect)
+    parse = getattr(mod, dialect + '_parse')
+    out = []
+    # Collecting diagnostics rather than catching exceptions keeps strings
+    # that aren't formats at all cheap.
+    diagnostics = []
+    for fmt in fmts:
+        d, a = parse(fmt, abi=abi, diagnostics=diagnostics)
+        if diagnostics:
+            out.append(parse_error(fmt, diagnostics.pop()))
+            continue
+        out.append(pack(dialect, d, a) if packed else (d, a))
+    return out
+
+def parse_error(fmt, diagnostic):
+    '''Returns the ValueError that parsing fmt would have raised for the
+    Diagnostic diagnostic.'''
+    from .diagnostics import ERR_BAD_CONVERSION, error
+    if diagnostic.code != ERR_BAD_CONVERSION:
+        return error(diagnostic.code)
+    if not isinstance(fmt, text_type):
+        from .buffers import as_format
+        fmt = as_format(fmt)
+    return error(diagnostic.code, fmt[diagnostic.offset])
+
+def iparse_many(dialect, fmts, executor=EXECUTOR_SERIAL, chunksize=1024,
+                workers=None, errors=ERRORS_RAISE, packed=False, abi=None):
+    '''Parses each format string in the iterable fmts with the given dialect
+    ('printf' or 'scanf') for the ABI profile abi, yielding results in input
+    order.
+
+    executor is one of EXECUTOR_SERIAL, EXECUTOR_THREAD or EXECUTOR_PROCESS;
+    workers is the pool size (default: one per CPU).  Work is handed out in
+    chunks of chunksize strings, and fmts is consumed lazily: a pool has at
+    most four chunks per worker in flight, so fmts is read no further ahead
+    of the results than that.  If packed is true, results are yielded in
+    the form returned by pack(), which avoids rebuilding the result objects
+    in this process.'''
+    parser_module(dialect)
+    if chunksize < 1:
+        raise ValueError('chunksize must be >= 1')
+    if errors not in (ERRORS_RAISE, ERRORS_RETURN):
+        raise ValueError('unknown errors mode: %r' % (errors,))
+
+    if executor == EXECUTOR_SERIAL:
+        pool = None
+        results = (_parse_chunk((dialect, packed, chunk, abi))
+                   for chunk in _chunks(fmts, chunksize))
+    elif executor in (EXECUTOR_THREAD, EXECUTOR_PROCESS):
+        import multiprocessing
+        nworkers = workers or multiprocessing.cpu_count()
+        if executor == EXECUTOR_THREAD:
+            from multiprocessing.pool import ThreadPool
+            pool = ThreadPool(nworkers)
+        else:
+            pool = multiprocessing.Pool(nworkers)
+        results = _imap(pool, nworkers,
+                        ((dialect, packed or executor == EXECUTOR_PROCESS,
+                          chunk, abi)
+                         for chunk in _chunks(fmts, chunksize)))
+    else:
+        raise ValueError('unknown executor: %r' % (executor,))
+
+    # Results always come back from worker processes packed.
+    unpack_results = executor == EXECUTOR_PROCESS and not packed
+
+    try:
+        for chunk in results:
+            for result in chunk:
+                if isinstance(result, Exception):
+                    if errors == ERRORS_RAISE:
+                        raise result
+                elif unpack_results:
+                    result = unpack(dialect, result)
+                yield result
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+def printf_parse_many(fmts, executor=EXECUTOR_SERIAL, chunksize=1024,
+                      workers=None, errors=ERRORS_RAISE, packed=False,
+                      abi=None):
+    '''Returns a list of printf_parse results for each string in fmts.  See
+    iparse_many for the meaning of the other arguments.'''
+    return list(iparse_many('printf', fmts, executor, chunksize, workers,
+                            errors, packed, abi))
+
+def scanf_parse_many(fmts, executor=EXECUTOR_SERIAL, chunksize=1024,
+                     workers=None, errors=ERRORS_RAISE, packed=False,
+                     abi=None):
+    '''Returns a list of scanf_parse results for each string in fmts.  See
+    iparse_many for the meaning of the other arguments.'''
+    return list(iparse_many('scanf', fmts, executor, chunksize, workers,
+                            errors, packed, abi))
@@ -0,0 +1,248 @@
+# Copyright (C) 2014, Mark Laws.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program; if not, see <http://www.gnu.org/licenses/>.
+
+'''In-place access to NUL-terminated format strings inside binary buffers.
+
+A buffer holds a string of bytes, as printf and scanf take.  To parse the
+wide strings that wprintf and wscanf take, wrap the buffer in a WideBuffer,
+which says how wide its code units are and in which byte order:
+
+    d, a = printf_parse(WideBuffer(image, 2), start=offset // 2)
+
+Offsets (start, and those in the result) then count code units from the
+start of the buffer, and the string ends at the first NUL code unit.'''
+
+import re
+import struct
+import sys
+
+_NUL = re.compile(b'\0')
+_PERCENT = re.compile(b'%')
+
+if bytes is str:
+    # Indexing a buffer already yields 1-character strs.
+    _CHARS = None
+else:
+    # Bytes outside ASCII can't be part of a directive; map them to a
+    # character that none of the parsers' tests accept (in particular not
+    # isdigit(), which is true for e.g. U+00B2).
+    _CHARS = [chr(i) for i in range(128)] + [u'\ufffd'] * 128
+
+# What a code unit outside ASCII reads as, as for _CHARS.
+_OTHER = '\xff' if bytes is str else u'\ufffd'
+
+if bytes is str:
+    def _searchable(buf):
+        # Python 2's re can't search a memoryview, and buffer() can't wrap
+        # one, so a memoryview is copied.
+        return buf.tobytes() if isinstance(buf, memoryview) else buf
+else:
+    def _searchable(buf):
+        return buf
+
+def as_format(fmt, start=0):
+    '''Returns the format string object the parsers read fmt, a buffer or
+    WideBuffer that isn't a str, through: a BufferFormat or a
+    WideBufferFormat of the string at offset start.'''
+    if isinstance(fmt, WideBuffer):
+        return WideBufferFormat(fmt.buf, start, fmt.width, fmt.byteorder)
+    return BufferFormat(fmt, start)
+
+class BufferFormat(object):
+    '''Presents the NUL-terminated byte string at offset start of any buffer
+    (bytes, bytearray, memoryview, mmap, ...) as a format string, without
+    copying it.  Indices are offsets into the whole buffer, and len() is the
+    offset of the terminating NUL (or the end of the buffer if there is none).
+
+    Only the operations the parsers need are provided: indexing (which gives
+    '\\0' at len(), as if the NUL were there), slicing, code() and
+    find('%').'''
+    __slots__ = ['buf', 'start', 'end', '_view']
+
+    def __init__(self, buf, start=0):
+        try:
+            view = memoryview(buf)
+        except TypeError:
+            # e.g. mmap on Python 2, which only has the old buffer interface
+            # but can be indexed directly.
+            view = buf
+        else:
+            if view.ndim != 1 or view.itemsize != 1:
+                view = buf = view.cast('B')
+        if start < 0 or start > len(view):
+            raise ValueError('start offset %d out of range' % start)
+
+        buf = _searchable(buf)
+        m = _NUL.search(buf, start)
+        self.buf = buf
+        self.start = start
+        self.end = m.start() if m is not None else len(view)
+        self._view = view
+
+    def __len__(self):
+        return self.end
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            # Only used for short pieces such as length modifiers.
+            return ''.join([self[j] for j in range(*i.indices(self.end))])
+        if i >= self.end:
+            if i == self.end:
+                # The terminating NUL, even if the buffer has none.
+                return '\0'
+            raise IndexError('format string index out of range')
+        if _CHARS is None:
+            return self._view[i]
+        return _CHARS[self._view[i]]
+
+    def code(self, i):
+        '''Returns the value of the byte at offset i, which unlike self[i]
+        is exact for bytes outside ASCII.'''
+        if i >= self.end:
+            raise IndexError('format string index out of range')
+        if _CHARS is None:
+            return ord(self._view[i])
+        return self._view[i]
+
+    def find(self, sub, start=0):
+        if sub != '%':
+            raise ValueError('only %% can be searched for, not %r' % (sub,))
+        m = _PERCENT.search(self.buf, start, self.end)
+        return m.start() if m is not None else -1
+
+    def __str__(self):
+        # For error messages and debugging; this one does copy.
+        s = bytes(self._view[self.start:self.end])
+        return s if bytes is str else s.decode('latin-1')
+
+class WideBuffer(object):
+    '''A buffer of wide strings: code units of width bytes (2 for UTF-16,
+    4 for UTF-32), in byteorder ('little' or 'big').  Pass one to the parsers
+    in place of a buffer to parse the wide string at a code-unit offset.'''
+    __slots__ = ['buf', 'width', 'byteorder']
+
+    def __init__(self, buf, width=2, byteorder='little'):
+        if width not in (2, 4):
+            raise ValueError('code units must be 2 or 4 bytes wide, not %r' %
+                             (width,))
+        if byteorder not in ('little', 'big'):
+            raise ValueError("byteorder must be 'little' or 'big', not %r" %
+                             (byteorder,))
+        self.buf = buf
+        self.width = width
+        self.byteorder = byteorder
+
+    def __repr__(self):
+        return '<WideBuffer of %d-byte %s-endian code units>' % (
+            self.width, self.byteorder)
+
+# Per (width, byteorder): the struct of a code unit, and patterns matching a
+# NUL and a '%' code unit.
+_WIDE = {}
+for _width, _code in (2, 'H'), (4, 'I'):
+    for _order, _prefix in ('little', '<'), ('big', '>'):
+        _unit = struct.Struct(_prefix + _code)
+        _WIDE[_width, _order] = (_unit, re.compile(re.escape(_unit.pack(0))),
+                                 re.compile(re.escape(_unit.pack(ord('%')))))
+del _width, _code, _order, _prefix, _unit
+
+class WideBufferFormat(object):
+    '''Presents the wide string at code unit start of a buffer as a format
+    string, without copying it, as BufferFormat does for byte strings.
+    Indices and len() count code units from the start of the buffer, and
+    code() gives a code unit's exact value.  A trailing partial code unit is
+    ignored.'''
+    __slots__ = ['buf', 'start', 'end', 'width', 'byteorder', '_units',
+                 '_unit', '_percent']
+
+    def __init__(self, buf, start=0, width=2, byteorder='little'):
+        WideBuffer(buf, width, byteorder)       # check the arguments
+        unit, nul, percent = _WIDE[width, byteorder]
+        try:
+            view = memoryview(buf)
+        except TypeError:
+            view = None
+            size = len(buf)
+        else:
+            if view.ndim != 1 or view.itemsize != 1:
+                view = buf = view.cast('B')
+            size = len(view)
+        nunits = size // width
+        if start < 0 or start > nunits:
+            raise ValueError('start offset %d out of range' % start)
+
+        self._units = None
+        code = 'H' if width == 2 else 'I'
+        if (view is not None and hasattr(view, 'cast') and
+                byteorder == sys.byteorder and struct.calcsize(code) == width):
+            # Native order: index the code units directly.
+            self._units = view[:nunits * width].cast(code)
+        self.buf = _searchable(buf)
+        self.start = start
+        self.width = width
+        self.byteorder = byteorder
+        self._unit = unit
+        self._percent = percent
+        self.end = self._search(nul, start, nunits)
+        if self.end < 0:
+            self.end = nunits
+
+    def _search(self, pattern, start, end):
+        # The first code unit from start to end whose bytes match pattern,
+        # or -1.
+        width = self.width
+        pos = start * width
+        while True:
+            m = pattern.search(self.buf, pos, end * width)
+            if m is None:
+                return -1
+            if not m.start() % width:
+                return m.start() // width
+            pos = m.start() + 1
+
+    def __len__(self):
+        return self.end
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return ''.join([self[j] for j in range(*i.indices(self.end))])
+        if i >= self.end:
+            if i == self.end:
+                return '\0'
+            raise IndexError('format string index out of range')
+        n = self.code(i)
+        return chr(n) if n < 128 else _OTHER
+
+    def code(self, i):
+        '''Returns the value of the code unit at offset i.'''
+        if i >= self.end:
+            raise IndexError('format string index out of range')
+        if self._units is not None:
+            return self._units[i]
+        return self._unit.unpack_from(self.buf, i * self.width)[0]
+
+    def find(self, sub, start=0):
+        if sub != '%':
+            raise ValueError('only %% can be searched for, not %r' % (sub,))
+        return self._search(self._percent, start, self.end)
+
+    def __str__(self):
+        # For error messages and debugging; this one does copy.
+        width = self.width
+        data = bytes(bytearray(self.buf[self.start * width:
+                                        self.end * width]))
+        s = data.decode('utf-%d-%s' % (width * 8, 'le' if self.byteorder ==
+                                       'little' else 'be'), 'replace')
+        return s if bytes is not str else s.encode('utf-8')
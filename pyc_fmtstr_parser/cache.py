@@ -0,0 +1,95 @@
+# Copyright (C) 2014, Mark Laws.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program; if not, see <http://www.gnu.org/licenses/>.
+
+'''Memoizing front-end for printf_parse and scanf_parse.
+
+Results are returned as the read-only Frozen* variants of the parser's result
+types, so a cached entry can be handed to any number of callers.  The cache
+of each dialect (see parse_cache()) is created, and its parser imported, on
+first use.'''
+
+from .abi import get_profile
+from .batch import parser_module
+from .lru import LRUCache, POLICY_LRU
+
+class ParseCache(object):
+    '''Wraps a parse function, caching its frozen results by format string
+    and the sizes of the ABI profile they were parsed for.
+
+    Parse errors propagate to the caller and are not cached.'''
+    __slots__ = ['parse', 'freeze', 'entries']
+
+    def __init__(self, parse, freeze, maxsize=4096, policy=POLICY_LRU):
+        self.parse = parse
+        self.freeze = freeze
+        self.entries = LRUCache(maxsize, policy)
+
+    def __call__(self, fmt, abi=None):
+        abi = get_profile(abi)
+        key = (fmt, abi.sizes)
+        result = self.entries.get(key)
+        if result is None:
+            result = self.freeze(*self.parse(fmt, abi=abi))
+            self.entries.put(key, result)
+        return result
+
+    def info(self):
+        return self.entries.info()
+
+    def clear(self):
+        self.entries.clear()
+
+# ParseCache for each dialect, created on first use so that using one
+# dialect doesn't load the other's parser.
+_caches = dict.fromkeys(['printf', 'scanf'])
+# The arguments of LRUCache for those; see configure().
+_settings = {'maxsize': 4096, 'policy': POLICY_LRU}
+
+def parse_cache(dialect):
+    '''Returns the ParseCache that cached_printf_parse() or
+    cached_scanf_parse() uses for the dialect ('printf' or 'scanf').'''
+    cache = _caches.get(dialect)
+    if cache is None:
+        mod = parser_module(dialect)
+        cache = _caches[dialect] = ParseCache(
+            getattr(mod, dialect + '_parse'), mod.freeze, **_settings)
+    return cache
+
+def configure(maxsize=4096, policy=POLICY_LRU):
+    '''Sets the size and eviction policy (see the lru module) of the caches
+    that cached_printf_parse() and cached_scanf_parse() use, dropping their
+    entries.'''
+    LRUCache(maxsize, policy)       # raises ValueError for bad arguments
+    _settings.update(maxsize=maxsize, policy=policy)
+    for cache in _caches.values():
+        if cache is not None:
+            cache.entries = LRUCache(maxsize, policy)
+
+def __getattr__(name):
+    # Python 3.7+: printf_cache and scanf_cache, as before the caches were
+    # made on first use.  Elsewhere use parse_cache().
+    if name in ('printf_cache', 'scanf_cache'):
+        return parse_cache(name[:-len('_cache')])
+    raise AttributeError('module %r has no attribute %r' % (__name__, name))
+
+def cached_printf_parse(fmt, abi=None):
+    '''Like printf_parse, but memoized; returns (FrozenDirectives,
+    FrozenArguments).'''
+    return parse_cache('printf')(fmt, abi)
+
+def cached_scanf_parse(fmt, abi=None):
+    '''Like scanf_parse, but memoized; returns (FrozenDirectives,
+    FrozenArguments).'''
+    return parse_cache('scanf')(fmt, abi)
@@ -0,0 +1,324 @@
+# Copyright (C) 2014, Mark Laws.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program; if not, see <http://www.gnu.org/licenses/>.
+
+'''Checks that the translations in gettext catalogs take the same arguments
+as the messages they translate.
+
+    for problem in check_catalog('de.po'):
+        print(problem)
+
+read_po() and read_mo() stream the entries of a catalog.  check_entries()
+compares the signature() of each translation with that of its message and
+yields a Problem for each that differs.  Each distinct string is parsed once
+and each distinct pair of signatures compared once, however many entries
+share them, so checking a large catalog costs little more than parsing its
+distinct strings.
+
+An entry is checked if it is flagged c-format, or, unless require_flag is
+true, if it isn't flagged no-c-format and its message takes arguments (.mo
+files keep no flags).  Plural translations are compared with msgid_plural,
+and untranslated entries and the header are skipped.
+
+As with GNU msgfmt -c, a plural translation may leave out arguments, since
+a form such as "one file" for msgid_plural "%d files" needn't print the
+number; it may not add any or change their types.  Other translations must
+take exactly the message's arguments.'''
+
+import mmap
+import re
+import struct
+
+from .batch import parser_module
+
+try:
+    unichr
+except NameError:
+    unichr = chr
+
+PROBLEM_INVALID = 'invalid'        # the translation doesn't parse
+PROBLEM_COUNT = 'count'            # a different number of arguments
+PROBLEM_TYPES = 'types'            # the same number, of different types
+PROBLEM_PERCENT_N = 'percent-n'    # %n in the translation only
+
+def signature(a):
+    '''Returns the argument types of the Arguments a as a tuple, in argument
+    order.  Since a holds the arguments by number, strings that take the
+    same arguments have the same signature however their directives are
+    ordered: '%2$s %1$d' has that of '%d %s'.  An argument that no directive
+    refers to has TYPE_NONE.'''
+    return tuple(x.type for x in a.arg[:a.count])
+
+class Entry(object):
+    '''One message of a catalog.  msgstr is the list of translations: one,
+    or one per plural form.  flags is the set of flags of a .po entry (e.g.
+    'c-format', 'fuzzy'); line is the line of a .po entry's msgid, or the
+    index of a .mo entry.'''
+    __slots__ = ['msgctxt', 'msgid', 'msgid_plural', 'msgstr', 'flags',
+                 'line']
+
+    def __init__(self, msgctxt, msgid, msgid_plural, msgstr, flags, line):
+        self.msgctxt = msgctxt
+        self.msgid = msgid
+        self.msgid_plural = msgid_plural
+        self.msgstr = msgstr
+        self.flags = flags
+        self.line = line
+
+    def __repr__(self):
+        return '<Entry %r at %d>' % (self.msgid, self.line)
+
+class Problem(object):
+    '''A translation, entry.msgstr[index], whose signature (actual; None if
+    it doesn't parse) doesn't match that of the message (expected).  kind is
+    one of the PROBLEM_* constants.'''
+    __slots__ = ['kind', 'entry', 'index', 'expected', 'actual', 'dialect']
+
+    def __init__(self, kind, entry, index, expected, actual, dialect):
+        self.kind = kind
+        self.entry = entry
+        self.index = index
+        self.expected = expected
+        self.actual = actual
+        self.dialect = dialect
+
+    def _names(self, sig):
+        if sig is None:
+            return '-'
+        name = parser_module(self.dialect).Arg_type.name
+        return '(%s)' % ', '.join(name(t)[5:].lower() for t in sig)
+
+    def __str__(self):
+        return '%d: %s: msgstr[%d] %s, expected %s: %r' % (
+            self.entry.line, self.kind, self.index, self._names(self.actual),
+            self._names(self.expected), self.entry.msgstr[self.index])
+
+    def __repr__(self):
+        return '<Problem %s>' % self
+
+# Reading .po files.
+
+_ESCAPES = {'n': '\n', 't': '\t', 'r': '\r', 'a': '\a', 'b': '\b',
+            'f': '\f', 'v': '\v', '\\': '\\', '"': '"', "'": "'", '?': '?'}
+_ESCAPE = re.compile(r'\\(?:([0-7]{1,3})|x([0-9A-Fa-f]{1,2})|(.))', re.S)
+_CHARSET = re.compile(br'charset=([^\s;\\]+)', re.I)
+
+def _unescape(m):
+    if m.group(1):
+        return unichr(int(m.group(1), 8))
+    if m.group(2):
+        return unichr(int(m.group(2), 16))
+    return _ESCAPES.get(m.group(3), m.group(3))
+
+def unescape(s):
+    '''Returns the text of a C string literal's contents s, with its escape
+    sequences replaced.'''
+    return _ESCAPE.sub(_unescape, s) if '\\' in s else s
+
+def _charset(header, default):
+    # The charset that the (undecoded) header names, or default.
+    m = _CHARSET.search(header)
+    if m is None or m.group(1).upper() == b'CHARSET':
+        return default
+    return m.group(1).decode('ascii')
+
+class _PoEntry(object):
+    # An entry being read: the undecoded parts of each field.
+    __slots__ = ['fields', 'flags', 'line', 'current']
+
+    def __init__(self):
+        self.fields = {}        # keyword ('msgstr[1]'...) -> [parts]
+        self.flags = set()
+        self.line = 0
+        self.current = None     # the keyword of the field being read
+
+    def text(self, keyword, encoding):
+        parts = self.fields.get(keyword)
+        if parts is None:
+            return None
+        s = b''.join(parts).decode(encoding)
+        return unescape(s)
+
+    def header(self):
+        # True for the header entry, whose msgid is empty.
+        return (b''.join(self.fields.get('msgid', [b'-'])) == b'' and
+                'msgctxt' not in self.fields)
+
+    def finish(self, encoding):
+        if 'msgstr' in self.fields:
+            msgstr = [self.text('msgstr', encoding)]
+        else:
+            msgstr = []
+            while 'msgstr[%d]' % len(msgstr) in self.fields:
+                msgstr.append(self.text('msgstr[%d]' % len(msgstr),
+                                        encoding))
+        return Entry(self.text('msgctxt', encoding),
+                     self.text('msgid', encoding),
+                     self.text('msgid_plural', encoding), msgstr,
+                     frozenset(self.flags), self.line)
+
+def read_po(f, encoding='utf-8'):
+    '''Yields the Entries of the .po file f, a binary file object or any
+    iterable of lines as bytes.  Strings are decoded with the charset the
+    header names, and with encoding until it's read.  Obsolete entries are
+    skipped.'''
+    entry = _PoEntry()
+    for lineno, line in enumerate(f, 1):
+        line = line.strip()
+        if line.startswith(b'"'):
+            if entry.current is not None:
+                entry.fields[entry.current].append(line[1:-1])
+            continue
+        keyword, _, rest = line.partition(b' ')
+        keyword = keyword.decode('ascii', 'replace')
+
+        # Anything but another translation ends an entry once it has one.
+        if (entry.current is not None and entry.current.startswith('msgstr')
+                and not keyword.startswith('msgstr')):
+            if entry.header():
+                encoding = _charset(b''.join(entry.fields.get('msgstr', [])),
+                                    encoding)
+            yield entry.finish(encoding)
+            entry = _PoEntry()
+
+        if keyword == '#,':
+            entry.flags.update(flag.strip().decode('ascii', 'replace')
+                               for flag in rest.split(b','))
+        elif keyword.startswith('msg'):
+            if keyword == 'msgid':
+                entry.line = lineno
+            entry.current = keyword
+            entry.fields[keyword] = [rest.strip()[1:-1]]
+    if entry.fields:
+        yield entry.finish(encoding)
+
+# Reading .mo files.
+
+MO_MAGIC = 0x950412de
+MO_MAGIC_SWAPPED = 0xde120495
+
+def read_mo(data, encoding='utf-8'):
+    '''Yields the Entries of the .mo file whose contents are data (bytes, or
+    any buffer such as an mmap).  Strings are decoded with the charset the
+    header names, or with encoding if there is none.'''
+    magic, = struct.unpack_from('<I', data)
+    if magic == MO_MAGIC:
+        order = '<'
+    elif magic == MO_MAGIC_SWAPPED:
+        order = '>'
+    else:
+        raise ValueError('not a .mo file')
+    table = struct.Struct(order + 'II')
+    _, n, originals, translations = struct.unpack_from(order + 'IIII',
+                                                       data, 4)
+    for i in range(n):
+        length, offset = table.unpack_from(data, originals + 8 * i)
+        msgid = data[offset:offset + length]
+        length, offset = table.unpack_from(data, translations + 8 * i)
+        msgstr = data[offset:offset + length].split(b'\0')
+        msgctxt = msgid_plural = None
+        if b'\x04' in msgid:
+            msgctxt, msgid = msgid.split(b'\x04', 1)
+            msgctxt = msgctxt.decode(encoding)
+        if b'\0' in msgid:
+            msgid, msgid_plural = msgid.split(b'\0', 1)
+            msgid_plural = msgid_plural.decode(encoding)
+        if not msgid and msgctxt is None:
+            encoding = _charset(msgstr[0], encoding)
+        msgid = msgid.decode(encoding)
+        msgstr = [s.decode(encoding) for s in msgstr]
+        yield Entry(msgctxt, msgid, msgid_plural, msgstr, frozenset(), i)
+
+# Checking.
+
+def check_entries(entries, dialect='printf', abi=None, require_flag=False):
+    '''Yields a Problem for each translation among the Entries entries whose
+    signature differs from its message's; see the module documentation for
+    the entries that are checked.'''
+    mod = parser_module(dialect)
+    parse = getattr(mod, dialect + '_parse')
+    # The argument types of %n, which a translation must not add.
+    n_types = frozenset(mod.DIALECT.conversions['n'][1])
+    none = mod.Arg_type.TYPE_NONE
+    signatures = {}     # string -> signature, or None if it doesn't parse
+    verdicts = {}       # (expected, actual, plural) -> problem kind, or None
+
+    def lookup(s):
+        try:
+            return signatures[s]
+        except KeyError:
+            diagnostics = []
+            d, a = parse(s, abi=abi, diagnostics=diagnostics)
+            sig = signatures[s] = None if diagnostics else signature(a)
+            return sig
+
+    for entry in entries:
+        if not entry.msgid or 'no-c-format' in entry.flags:
+            continue
+        flagged = 'c-format' in entry.flags
+        if require_flag and not flagged:
+            continue
+        plural = entry.msgid_plural is not None
+        message = entry.msgid_plural if plural else entry.msgid
+        expected = lookup(message)
+        if expected is None or not (flagged or expected):
+            continue
+        for index, translation in enumerate(entry.msgstr):
+            if not translation:
+                continue
+            actual = lookup(translation)
+            try:
+                kind = verdicts[expected, actual, plural]
+            except KeyError:
+                kind = verdicts[expected, actual, plural] = _compare(
+                    expected, actual, plural, n_types, none)
+            if kind is not None:
+                yield Problem(kind, entry, index, expected, actual, dialect)
+
+def _compare(expected, actual, plural, n_types, none):
+    if actual is None:
+        return PROBLEM_INVALID
+    if (any(t in n_types for t in actual) and
+            not any(t in n_types for t in expected)):
+        return PROBLEM_PERCENT_N
+    if plural:
+        # Arguments may be left out (as TYPE_NONE, or from the end), but
+        # not added.
+        if len(actual) > len(expected):
+            return PROBLEM_COUNT
+        if any(t != e and t != none for t, e in zip(actual, expected)):
+            return PROBLEM_TYPES
+        return None
+    if len(actual) != len(expected):
+        return PROBLEM_COUNT
+    if actual != expected:
+        return PROBLEM_TYPES
+    return None
+
+def check_catalog(path, dialect='printf', abi=None, require_flag=False):
+    '''Returns the Problems of the .po or .mo file at path, as
+    check_entries() finds them.'''
+    with open(path, 'rb') as f:
+        head = f.read(4)
+        f.seek(0)
+        if len(head) == 4 and struct.unpack('<I', head)[0] in (
+                MO_MAGIC, MO_MAGIC_SWAPPED):
+            # Mapped rather than read, so that only the strings are copied.
+            m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                return list(check_entries(read_mo(m), dialect, abi,
+                                          require_flag))
+            finally:
+                m.close()
+        return list(check_entries(read_po(f), dialect, abi, require_flag))
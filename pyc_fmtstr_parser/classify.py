@@ -0,0 +1,356 @@
+# Copyright (C) 2014, Mark Laws.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program; if not, see <http://www.gnu.org/licenses/>.
+
+'''Works out which of many printf format strings produced a line of output.
+
+A TemplateIndex holds a set of printf templates.  Each template's longest run
+of literal text is its anchor; an Aho-Corasick automaton over all the anchors
+finds, in one pass over a line, the templates whose anchor occurs in it.
+Only those candidates (plus any templates with no literal text at all) are
+checked against the line with their full regex, so the cost of classifying
+a line depends on the line and the number of candidates, not on the number
+of templates.'''
+
+import re
+
+from .printf_parse import ARG_NONE, FLAG_GROUP, FLAG_LEFT, printf_parse
+
+# The most transitions an _Automaton memoizes for characters in none of its
+# keys.
+_MAX_FOREIGN = 1 << 16
+
+class _Automaton(object):
+    '''An Aho-Corasick automaton over a set of keys.
+
+    goto holds the transitions of each state, out the keys that end at each
+    state (including those reached through failure links).  Transitions that
+    follow failure links are added to goto as they are first needed, so the
+    scan of a line costs one dict lookup per character.  Those on
+    characters of the keys (alphabet) are bounded by the states times the
+    alphabet; those on other characters, which all lead to the root, could
+    grow with every character the lines hold, so only the first
+    _MAX_FOREIGN of them are kept.'''
+    __slots__ = ['keys', 'goto', 'fail', 'out', 'alphabet', 'foreign']
+
+    def __init__(self, keys):
+        keys = list(keys)
+        goto = [{}]
+        out = [[]]
+        for key in keys:
+            state = 0
+            for c in key:
+                nxt = goto[state].get(c)
+                if nxt is None:
+                    nxt = goto[state][c] = len(goto)
+                    goto.append({})
+                    out.append([])
+                state = nxt
+            out[state].append(key)
+
+        # Breadth-first, so that a state's failure target is complete before
+        # the state itself is.
+        fail = [0] * len(goto)
+        queue = list(goto[0].values())
+        for state in queue:
+            for c, nxt in goto[state].items():
+                queue.append(nxt)
+                f = fail[state]
+                while f and c not in goto[f]:
+                    f = fail[f]
+                target = goto[f].get(c, 0)
+                fail[nxt] = target if target != nxt else 0
+                out[nxt] = out[nxt] + out[fail[nxt]]
+
+        self.keys = keys
+        self.goto = goto
+        self.fail = fail
+        self.out = out
+        self.alphabet = frozenset(c for key in keys for c in key)
+        self.foreign = 0
+
+    def _step(self, state, c):
+        if c not in self.alphabet:
+            if self.foreign < _MAX_FOREIGN:
+                self.foreign += 1
+                self.goto[state][c] = 0
+            return 0
+        start = state
+        goto = self.goto
+        while state and c not in goto[state]:
+            state = self.fail[state]
+        nxt = goto[state].get(c, 0)
+        goto[start][c] = nxt
+        return nxt
+
+    def scan(self, text):
+        '''Returns the keys that occur in text, possibly with repeats.'''
+        goto = self.goto
+        out = self.out
+        found = []
+        state = 0
+        for c in text:
+            try:
+                state = goto[state][c]
+            except KeyError:
+                state = self._step(state, c)
+            if out[state]:
+                found.extend(out[state])
+        return found
+
+# Regexes for what printf prints for each conversion, without padding.
+_SIGN = '[-+ ]?'
+_DIGITS = '[0-9]+'
+_GROUPED = '[0-9]+(?:[^0-9\\s][0-9]{3})*'
+_INF_NAN = 'inf|nan|INF|NAN'
+_OUTPUT = {
+    'd': _SIGN + _DIGITS,
+    'u': _DIGITS,
+    'o': '[0-7]+',
+    'x': '(?:0x)?[0-9a-f]+',
+    'X': '(?:0X)?[0-9A-F]+',
+    'f': (_SIGN + '(?:(?:%s)(?:\\.[0-9]*)?|\\.[0-9]+)(?:[eE][-+][0-9]+)?|' +
+          _SIGN + '(?:' + _INF_NAN + ')'),
+    'a': _SIGN + ('(?:0[xX][0-9a-fA-F](?:\\.[0-9a-fA-F]*)?[pP][-+][0-9]+|' +
+                  _INF_NAN + ')'),
+    'c': '.',
+    's': '.*?',
+    'p': '0x[0-9a-f]+|\\(nil\\)',
+}
+_OUTPUT['i'] = _OUTPUT['d']
+for _c in 'FeEgG':
+    _OUTPUT[_c] = _OUTPUT['f']
+_OUTPUT['A'] = _OUTPUT['a']
+del _c
+
+_BASE = {'d': 10, 'i': 10, 'u': 10, 'o': 8, 'x': 16, 'X': 16, 'p': 16}
+
+def _to_int(s, base):
+    # Drops padding, grouping separators and the 0x prefix.
+    s = s.strip()
+    digits = re.sub('[^0-9a-fA-F]', '', s[2:] if s[:2] in ('0x', '0X')
+                    else s)
+    value = int(digits or '0', base)
+    return -value if s.startswith('-') else value
+
+def _to_float(s):
+    s = s.strip()
+    try:
+        return float(s)
+    except ValueError:
+        pass
+    if 'x' in s or 'X' in s:
+        return float.fromhex(s)
+    # Grouped digits.
+    return float(re.sub('[^-+0-9.eE]', '', s))
+
+def _to_pointer(s):
+    return None if s == '(nil)' else int(s, 16)
+
+class Template(object):
+    '''A printf format string registered with a TemplateIndex.
+
+    id is its index in TemplateIndex.templates, data whatever was passed to
+    TemplateIndex.add() with it.  anchor is the literal text used to find it
+    ('' if it has none), specificity the number of literal characters in
+    it.  pattern is the regex that its output matches; it is compiled the
+    first time it's needed.'''
+    __slots__ = ['id', 'fmt', 'data', 'anchor', 'specificity', 'nargs',
+                 'pattern', 'converters', '_match']
+
+    def __init__(self, id, fmt, data=None):
+        self.id = id
+        self.fmt = fmt
+        self.data = data
+        d, a = printf_parse(fmt)
+        self.nargs = a.count
+
+        pattern = []
+        literals = []
+        self.converters = []     # (group, arg_index, conversion)
+        cp = 0
+        for dp in d.dir[:d.count]:
+            literals.append(fmt[cp:dp.dir_start])
+            pattern.append(re.escape(fmt[cp:dp.dir_start]))
+            pattern.append(self._directive(fmt, dp))
+            cp = dp.dir_end
+        literals.append(fmt[cp:])
+        pattern.append(re.escape(fmt[cp:]))
+
+        self.anchor = max(literals, key=len)
+        self.specificity = sum(len(s) for s in literals)
+        self.pattern = ''.join(pattern) + '\\Z'
+        self._match = None
+
+    def _directive(self, fmt, dp):
+        conv = dp.conversion
+        if conv == '%':
+            return '%'
+        if conv == 'n':
+            return ''
+
+        core = _OUTPUT[conv]
+        if conv in 'fFeEgG':
+            core = core % (_GROUPED if dp.flags & FLAG_GROUP else _DIGITS)
+        elif conv in 'diu' and dp.flags & FLAG_GROUP:
+            core = (_SIGN if conv != 'u' else '') + _GROUPED
+        if dp.precision_start is not None and conv in 'diouxX':
+            # "%.0d" prints nothing for 0.
+            core = '(?:%s)?' % core
+        elif (conv == 's' and dp.precision_start is not None and
+              dp.precision_arg_index == ARG_NONE):
+            core = '.{0,%d}?' % int(fmt[dp.precision_start + 1:
+                                        dp.precision_end] or 0)
+
+        self.converters.append((len(self.converters) + 1, dp.arg_index,
+                                conv))
+        core = '(%s)' % core
+        if dp.width_start is None:
+            return core
+        if dp.width_arg_index != ARG_NONE:
+            # A negative width argument left-justifies.
+            return ' *%s *' % core
+        if dp.flags & FLAG_LEFT:
+            return core + ' *'
+        return ' *' + core
+
+    def match(self, line):
+        '''Returns the re match object of line against pattern, or None.'''
+        if self._match is None:
+            self._match = re.compile(self.pattern, re.DOTALL).match
+        return self._match(line)
+
+    def args(self, m):
+        '''Returns the argument values recovered from the match m, in argument
+        order.  Arguments that don't appear in the output (widths and
+        precisions given by '*', %n) are None.'''
+        args = [None] * self.nargs
+        for group, arg_index, conv in self.converters:
+            s = m.group(group)
+            if conv in 'cs':
+                value = s
+            elif conv == 'p':
+                value = _to_pointer(s)
+            elif conv in _BASE:
+                value = _to_int(s, _BASE[conv])
+            else:
+                value = _to_float(s)
+            args[arg_index] = value
+        return tuple(args)
+
+    def __repr__(self):
+        return '<Template %d %r>' % (self.id, self.fmt)
+
+class TemplateMatch(object):
+    '''A template that matches a line, with the argument values recovered
+    from it.  alternatives holds the other templates' matches when the line
+    is ambiguous (see TemplateIndex.classify()).'''
+    __slots__ = ['template', 'args', 'alternatives']
+
+    def __init__(self, template, args, alternatives=()):
+        self.template = template
+        self.args = args
+        self.alternatives = alternatives
+
+    @property
+    def ambiguous(self):
+        return bool(self.alternatives)
+
+    def __repr__(self):
+        return '<TemplateMatch %r %r%s>' % (
+            self.template.fmt, self.args,
+            ' ambiguous' if self.alternatives else '')
+
+class TemplateIndex(object):
+    '''An index of printf templates for classifying lines of output.
+
+    Templates may be added at any time.  The anchors are split among several
+    automata, each more than twice the size of the next: the anchors added
+    since the last lookup get one of their own, merged with the newer ones
+    until that holds.  So adds between lookups cost each anchor O(log n)
+    rebuilds, not one rebuild of all of them per add, and a lookup scans
+    the line at most log2(n) + 1 times.'''
+    __slots__ = ['templates', 'anchored', 'fallback', 'automata', 'pending']
+
+    def __init__(self, fmts=()):
+        self.templates = []
+        self.anchored = {}       # anchor -> [Template]
+        self.fallback = []       # templates without literal text
+        self.automata = []       # oldest (largest) first
+        self.pending = []        # anchors in none of the automata yet
+        for fmt in fmts:
+            self.add(fmt)
+
+    def add(self, fmt, data=None):
+        '''Adds the printf format string fmt, which must parse, and returns
+        its Template.  data is kept with it as Template.data.'''
+        template = Template(len(self.templates), fmt, data)
+        self.templates.append(template)
+        if template.anchor:
+            if template.anchor not in self.anchored:
+                self.pending.append(template.anchor)
+                self.anchored[template.anchor] = []
+            self.anchored[template.anchor].append(template)
+        else:
+            self.fallback.append(template)
+        return template
+
+    def __len__(self):
+        return len(self.templates)
+
+    def candidates(self, line):
+        '''Returns the templates that might match line, in the order they
+        were added.'''
+        if self.pending:
+            self._build()
+        found = set()
+        for automaton in self.automata:
+            found.update(automaton.scan(line))
+        anchored = self.anchored
+        result = list(self.fallback)
+        for anchor in found:
+            result.extend(anchored[anchor])
+        result.sort(key=lambda t: t.id)
+        return result
+
+    def _build(self):
+        keys = self.pending
+        automata = self.automata
+        while automata and len(automata[-1].keys) <= 2 * len(keys):
+            keys = automata.pop().keys + keys
+        automata.append(_Automaton(keys))
+        self.pending = []
+
+    def match_all(self, line):
+        '''Returns a TemplateMatch for every template that could have
+        produced line, the most specific (the one with the most literal
+        text) first.'''
+        matches = []
+        for template in self.candidates(line):
+            m = template.match(line)
+            if m is not None:
+                matches.append(TemplateMatch(template, template.args(m)))
+        matches.sort(key=lambda x: -x.template.specificity)
+        return matches
+
+    def classify(self, line):
+        '''Returns the TemplateMatch of the most specific template that
+        matches line, or None if none does.  If others match too, their
+        matches are in its alternatives.'''
+        matches = self.match_all(line)
+        if not matches:
+            return None
+        best = matches[0]
+        best.alternatives = tuple(matches[1:])
+        return best
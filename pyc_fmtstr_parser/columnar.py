@@ -0,0 +1,261 @@
+# Copyright (C) 2014, Mark Laws.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program; if not, see <http://www.gnu.org/licenses/>.
+
+'''Compact storage for the directives of many parsed format strings.
+
+A ColumnarDirectives holds every directive of every string added to it in
+parallel typed arrays, one per Directive slot plus one for the type of the
+directive's argument, so a directive costs a few dozen bytes instead of a
+handful of Python objects.  DirectiveView gives the usual per-directive
+attribute API on top of the arrays.'''
+
+from array import array
+
+from .batch import parser_module, unpack_fields
+
+# Typecode of offsets, argument numbers and indexes: 64 bits, so that
+# neither directives deep inside buffers over 2 GB nor large positional
+# numbers nor many distinct length modifiers overflow them.  Python 2's
+# array has no 'q', so there they are C longs, which are only 32 bits on
+# Windows.
+try:
+    array('q')
+    _INDEX = 'q'
+except ValueError:
+    _INDEX = 'l'
+
+# Typecode of the column for each Directive slot; None is stored as -1
+# (which is also ARG_NONE).
+_TYPECODES = {
+    'dir_start': _INDEX,
+    'dir_end': _INDEX,
+    'flags': 'B',
+    'width_start': _INDEX,
+    'width_end': _INDEX,
+    'width_arg_index': _INDEX,
+    'precision_start': _INDEX,
+    'precision_end': _INDEX,
+    'precision_arg_index': _INDEX,
+    'conversion': 'B',
+    'arg_index': _INDEX,
+    'length': _INDEX,   # index into ColumnarDirectives.lengths
+    'scanset': _INDEX,  # index into ColumnarDirectives.scansets
+}
+
+# Slots stored as indexes into a list of their distinct values, and the
+# attribute holding that list.
+_INTERNED = {'length': 'lengths', 'scanset': 'scansets'}
+
+class ColumnarDirectives(object):
+    '''Directives of a batch of format strings of one dialect ('printf' or
+    'scanf') in parallel arrays.
+
+    columns maps each Directive slot name to its array, and arg_type holds
+    the Arg_type of each directive's argument (0 if it takes none).  The
+    length column indexes the list of distinct length modifiers, lengths,
+    and the scanset column (scanf only) the list of distinct Scansets,
+    scansets, whose first entry is None.
+    Directives of string k are those in the index range [string_starts[k],
+    string_starts[k + 1]); ends[k] is the dir_start of its trailing sentinel.
+    The argument types of string k are
+    arg_types[arg_starts[k]:arg_starts[k + 1]].'''
+    __slots__ = ['dialect', 'slots', 'columns', 'arg_type', 'string_starts',
+                 'ends', 'max_width_length', 'max_precision_length',
+                 'arg_starts', 'arg_types', 'lengths', 'scansets', '_codes']
+
+    def __init__(self, dialect='printf'):
+        self.dialect = dialect
+        self.slots = parser_module(dialect).Directive.__slots__
+        self.columns = dict((name, array(_TYPECODES[name]))
+                            for name in self.slots)
+        self.arg_type = array('B')
+        self.string_starts = array(_INDEX, [0])
+        self.ends = array(_INDEX)
+        self.max_width_length = array(_INDEX)
+        self.max_precision_length = array(_INDEX)
+        self.arg_starts = array(_INDEX, [0])
+        self.arg_types = array('B')
+        self.lengths = ['']
+        self.scansets = [None]
+        self._codes = {'length': {'': 0}, 'scanset': {None: 0}}
+
+    @classmethod
+    def from_strings(cls, dialect, fmts):
+        '''Parses each string of the iterable fmts into a new instance.'''
+        self = cls(dialect)
+        parse = getattr(parser_module(dialect), dialect + '_parse')
+        for fmt in fmts:
+            self.append(*parse(fmt))
+        return self
+
+    def append(self, d, a):
+        '''Adds the result of one parse.'''
+        types = [x.type for x in a.arg]
+        columns = self.columns
+        for name in self.slots:
+            col = columns[name]
+            for dp in d.dir[:d.count]:
+                col.append(self._encode(name, getattr(dp, name, None)))
+        for dp in d.dir[:d.count]:
+            if dp.arg_index != -1:
+                self.arg_type.append(types[dp.arg_index])
+            else:
+                self.arg_type.append(0)
+        self._finish_string(d.count, d.dir[d.count].dir_start,
+                            d.max_width_length,
+                            getattr(d, 'max_precision_length', 0), types)
+
+    def append_packed(self, packed):
+        '''Adds one result in the form produced by batch.pack(), without
+        building any result objects.'''
+        count, max_width_length, max_precision_length, fields, end, types = \
+            packed
+        fields = unpack_fields(self.dialect, fields)
+        nslots = len(self.slots)
+        for j, name in enumerate(self.slots):
+            self.columns[name].extend(self._encode(name, v)
+                                      for v in fields[j::nslots])
+        arg_index = fields[self.slots.index('arg_index')::nslots]
+        self.arg_type.extend(types[i] if i != -1 else 0 for i in arg_index)
+        self._finish_string(count, end, max_width_length,
+                            max_precision_length or 0, types)
+
+    def _encode(self, name, value):
+        if name in _INTERNED:
+            codes = self._codes[name]
+            try:
+                return codes[value]
+            except KeyError:
+                values = getattr(self, _INTERNED[name])
+                code = codes[value] = len(values)
+                values.append(value)
+                return code
+        if value is None:
+            return 0 if name == 'conversion' else -1
+        if name == 'conversion':
+            return ord(value)
+        return value
+
+    def _decode(self, name, value):
+        if name == 'conversion':
+            return chr(value) if value else None
+        if name in _INTERNED:
+            return getattr(self, _INTERNED[name])[value]
+        if value == -1 and not name.endswith('arg_index'):
+            return None
+        return value
+
+    def _finish_string(self, count, end, max_width_length,
+                       max_precision_length, types):
+        self.string_starts.append(self.string_starts[-1] + count)
+        self.ends.append(end)
+        self.max_width_length.append(max_width_length)
+        self.max_precision_length.append(max_precision_length)
+        self.arg_types.extend(types)
+        self.arg_starts.append(len(self.arg_types))
+
+    def __len__(self):
+        '''Number of directives, over all strings.'''
+        return len(self.arg_type)
+
+    @property
+    def nstrings(self):
+        return len(self.ends)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('directive index out of range')
+        return DirectiveView(self, i)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield DirectiveView(self, i)
+
+    def directives(self, k):
+        '''Returns views of the directives of string k.'''
+        return [DirectiveView(self, i)
+                for i in range(self.string_starts[k],
+                               self.string_starts[k + 1])]
+
+    def to_result(self, k):
+        '''Rebuilds the (Directives, Arguments) pair for string k.'''
+        mod = parser_module(self.dialect)
+        d = mod.Directives()
+        for view in self.directives(k):
+            dp = mod.Directive()
+            for name in self.slots:
+                setattr(dp, name, getattr(view, name))
+            d.dir.append(dp)
+        d.count = len(d.dir)
+        sentinel = mod.Directive()
+        sentinel.dir_start = self.ends[k]
+        d.dir.append(sentinel)
+        d.max_width_length = self.max_width_length[k]
+        if 'max_precision_length' in mod.Directives.__slots__:
+            d.max_precision_length = self.max_precision_length[k]
+
+        a = mod.Arguments()
+        for type in self.arg_types[self.arg_starts[k]:self.arg_starts[k + 1]]:
+            arg = mod.Argument()
+            arg.type = type
+            a.arg.append(arg)
+        a.count = len(a.arg)
+        return d, a
+
+    def nbytes(self):
+        '''Bytes used by the array buffers.'''
+        arrays = list(self.columns.values()) + [
+            self.arg_type, self.string_starts, self.ends,
+            self.max_width_length, self.max_precision_length,
+            self.arg_starts, self.arg_types]
+        return sum(x.itemsize * len(x) for x in arrays)
+
+    def to_numpy(self):
+        '''Returns a dict of NumPy arrays sharing memory with the columns
+        (requires NumPy).  Keys are the Directive slot names, 'arg_type',
+        'string_starts', 'ends' and 'arg_types'.'''
+        import numpy
+        out = dict((name, numpy.frombuffer(col, dtype=col.typecode))
+                   for name, col in self.columns.items())
+        for name in ('arg_type', 'string_starts', 'ends', 'arg_types'):
+            col = getattr(self, name)
+            out[name] = numpy.frombuffer(col, dtype=col.typecode)
+        return out
+
+class DirectiveView(object):
+    '''A lightweight, read-only view of one directive of a
+    ColumnarDirectives, with the same attributes as Directive plus
+    arg_type (an Arg_type, or None if the directive takes no argument).'''
+    __slots__ = ['_cols', '_i']
+
+    def __init__(self, cols, i):
+        self._cols = cols
+        self._i = i
+
+    def __getattr__(self, name):
+        try:
+            col = self._cols.columns[name]
+        except KeyError:
+            raise AttributeError(name)
+        return self._cols._decode(name, col[self._i])
+
+    @property
+    def arg_type(self):
+        return self._cols.arg_type[self._i] or None
+
+    def __repr__(self):
+        return '<DirectiveView %d of %r>' % (self._i, self._cols)
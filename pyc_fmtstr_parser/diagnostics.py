@@ -0,0 +1,79 @@
+# Copyright (C) 2014, Mark Laws.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program; if not, see <http://www.gnu.org/licenses/>.
+
+'''Error codes and diagnostics for malformed format strings.
+
+By default printf_parse and scanf_parse raise ValueError for a malformed
+format string.  Given a list as their diagnostics argument, they instead
+append a Diagnostic to it and return what they parsed before the error:
+parsing stops at the first bad directive, which becomes the sentinel
+(directives[N].dir_start is where it starts), and the arguments are those of
+the directives before it.  Neither the parse nor the caller pays for an
+exception, which matters when most of the strings scanned aren't formats at
+all.'''
+
+ERR_UNTERMINATED = 1           # the string ends inside a directive
+ERR_BAD_CONVERSION = 2         # not a conversion character
+ERR_ARG_ZERO = 3               # argument number 0, as in %0$d
+ERR_AMBIGUOUS_ARG = 4          # an argument used with two different types
+ERR_UNTERMINATED_SCANSET = 5   # %[ with no closing ]
+
+MESSAGES = {
+    ERR_UNTERMINATED: 'unterminated directive',
+    ERR_BAD_CONVERSION: 'bad conversion character',
+    ERR_ARG_ZERO: 'positional argument 0',
+    ERR_AMBIGUOUS_ARG: 'ambiguous type for positional argument',
+    ERR_UNTERMINATED_SCANSET: 'unterminated scanset',
+}
+
+class Diagnostic(object):
+    '''A malformed directive.  offset is where the error is (the bad
+    conversion character, the argument number, the end of the string...),
+    dir_start where the directive starts.'''
+    __slots__ = ['code', 'offset', 'dir_start']
+
+    def __init__(self, code, offset, dir_start):
+        self.code = code
+        self.offset = offset
+        self.dir_start = dir_start
+
+    @property
+    def message(self):
+        return MESSAGES[self.code]
+
+    def __eq__(self, other):
+        return (isinstance(other, Diagnostic) and
+                (self.code, self.offset, self.dir_start) ==
+                (other.code, other.offset, other.dir_start))
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((self.code, self.offset, self.dir_start))
+
+    def __reduce__(self):
+        return Diagnostic, (self.code, self.offset, self.dir_start)
+
+    def __repr__(self):
+        return '<Diagnostic %s at %d (directive at %d)>' % (
+            self.message, self.offset, self.dir_start)
+
+def error(code, c=None):
+    '''Returns the ValueError that the parsers raise for code; c is the bad
+    conversion character, for ERR_BAD_CONVERSION.'''
+    if code == ERR_BAD_CONVERSION:
+        return ValueError('bad conversion character: %%%s' % c)
+    return ValueError(MESSAGES[code])
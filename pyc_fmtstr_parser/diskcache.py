@@ -0,0 +1,354 @@
+# Copyright (C) 2014, Mark Laws.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program; if not, see <http://www.gnu.org/licenses/>.
+
+'''Parse results saved in a file, for reuse across runs and processes.
+
+    with DiskCache('formats.cache') as cache:
+        cache.prefill('printf', corpus)
+        d, a = cache.printf_parse(fmt)
+
+Results are keyed by a hash of the dialect, the ABI profile's type sizes and
+the format string.  The file is memory-mapped and holds an open-addressing
+hash table of keys, each pointing at its result packed by batch.pack() and
+marshalled, so a lookup reads one table slot or a few and then one record;
+nothing else in the file is read.  A lookup costs a few microseconds: more
+than parsing a short format string, much less than parsing a long one.
+
+The file is written only by flush() (and so by prefill() and close()).  A
+flush appends the new records to the file, then a new table covering the
+entries on disk at that moment plus the new ones, and finally points the
+header at the new table.  Nothing already in the file is overwritten, so
+processes that have it mapped go on reading it as it was, and entries added
+by other processes in the meantime are kept.  Its cost is that of copying
+the table, which is a small fraction of the file.  Once replaced tables
+take up more of the file than its live data, a flush instead rewrites the
+file from scratch and moves it into place, which costs as much as copying
+every record.  Flushes hold an advisory lock on the file path + '.lock'
+(with fcntl.flock), so that processes flushing at the same time keep each
+other's entries too; where there is no fcntl (Windows), every flush rewrites
+the file, and overlapping flushes may lose the entries of all but the last.
+
+A file written by a different PARSER_VERSION (see the engine module), major
+version of Python or marshal format is ignored and overwritten by the next
+flush().
+
+A format string that doesn't parse is saved too, and raises the same
+ValueError on every lookup.'''
+
+import errno
+import hashlib
+import marshal
+import mmap
+import os
+import struct
+import sys
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from .abi import get_profile
+from .batch import (ERRORS_RETURN, EXECUTOR_SERIAL, iparse_many, pack,
+                    parse_error, parser_module, unpack)
+from .engine import PARSER_VERSION
+from .lru import CacheInfo
+
+try:
+    text_type = basestring
+except NameError:
+    text_type = str
+
+_replace = getattr(os, 'replace', os.rename)
+
+MAGIC = b'PYCFMTDC'
+LAYOUT = 1
+
+# magic, layout, reserved, version hash, entries, table offset, table slots
+_HEADER = struct.Struct('<8sII20sQQQ')
+# key, record offset (0 for an empty slot), record length
+_SLOT = struct.Struct('<16sQI')
+_EMPTY_SLOT = _SLOT.pack(b'\0' * 16, 0, 0)
+_HASH = struct.Struct('<Q')
+
+# Python 3 strings may hold lone surrogates, which only this handler can
+# encode.
+_ENCODE_ERRORS = 'surrogatepass' if sys.version_info[0] >= 3 else 'strict'
+
+def version():
+    '''Returns the hash identifying the results a cache file written by this
+    process can be read by.'''
+    return hashlib.sha1(('%d %d %d' % (PARSER_VERSION, sys.version_info[0],
+                                       marshal.version)).encode(
+                                           'ascii')).digest()
+
+# The start of the hashed data of a key, by (dialect, type of string, ABI).
+_prefixes = {}
+
+def cache_key(dialect, fmt, abi):
+    '''Returns the 16-byte key of the result of parsing fmt with the dialect
+    for the ABI profile abi.'''
+    if isinstance(fmt, text_type):
+        if isinstance(fmt, bytes):
+            data = fmt
+        else:
+            data = fmt.encode('utf-8', _ENCODE_ERRORS)
+    elif isinstance(fmt, bytes):
+        data = fmt
+    else:
+        raise TypeError('DiskCache keys must be strings, not %s' %
+                        type(fmt).__name__)
+    abi = get_profile(abi)
+    try:
+        prefix = _prefixes[dialect, type(fmt), abi]
+    except KeyError:
+        prefix = _prefixes[dialect, type(fmt), abi] = (
+            '%s %s %d %d %d %d %d %d %d ' % (
+                dialect, type(fmt).__name__, abi.int, abi.long,
+                abi.long_long, abi.size_t, abi.ptrdiff_t, abi.intmax_t,
+                abi.wchar_t)).encode('ascii')
+    return hashlib.sha1(prefix + data).digest()[:16]
+
+def _loads(dialect, data):
+    value = marshal.loads(data)
+    if not isinstance(value, tuple):
+        raise ValueError(value)
+    return unpack(dialect, value)
+
+def _table(slots):
+    # Returns the number of slots and the packed table holding the list of
+    # (key, record offset, record length) slots.
+    nslots = 8
+    while nslots < 2 * len(slots):
+        nslots *= 2
+    mask = nslots - 1
+    table = [_EMPTY_SLOT] * nslots
+    for key, offset, length in slots:
+        i = _HASH.unpack_from(key)[0] & mask
+        while table[i] is not _EMPTY_SLOT:
+            i = (i + 1) & mask
+        table[i] = _SLOT.pack(key, offset, length)
+    return nslots, b''.join(table)
+
+def _write(f, offset, records, slots):
+    # Writes the list of (key, record) records to the file f at offset,
+    # followed by a table of them and the list of slots already in f, and
+    # then the header.
+    f.seek(offset)
+    slots = list(slots)
+    for key, data in records:
+        f.write(data)
+        slots.append((key, offset, len(data)))
+        offset += len(data)
+    nslots, table = _table(slots)
+    f.write(table)
+    f.flush()
+    f.seek(0)
+    f.write(_HEADER.pack(MAGIC, LAYOUT, 0, version(), len(slots), offset,
+                         nslots))
+
+def _lock(path):
+    # Returns the open lock file of the cache file at path, once this
+    # process holds the lock; closing it releases the lock.
+    f = open(path + '.lock', 'ab')
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+    return f
+
+class DiskCache(object):
+    '''Parse results saved in the file at path, which is created by the
+    first flush() if it doesn't exist.  Not thread-safe.'''
+    __slots__ = ['path', 'hits', 'misses', '_map', '_entries', '_table',
+                 '_nslots', '_pending']
+
+    def __init__(self, path):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._map = None
+        self._entries = 0
+        self._pending = {}      # key -> record, not yet written
+        self._open()
+
+    def _open(self):
+        try:
+            f = open(self.path, 'rb')
+        except IOError as e:
+            if e.errno == errno.ENOENT:
+                return
+            raise
+        with f:
+            size = os.fstat(f.fileno()).st_size
+            if size < _HEADER.size:
+                return
+            m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, layout, _, file_version, entries, table, nslots = \
+            _HEADER.unpack_from(m)
+        # The header may have been pointed at a table appended after the
+        # map was made.
+        if (magic != MAGIC or layout != LAYOUT or file_version != version()
+                or table + nslots * _SLOT.size > len(m)):
+            m.close()
+            return
+        self._map = m
+        self._entries = entries
+        self._table = table
+        self._nslots = nslots
+
+    def _close_map(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+            self._entries = 0
+
+    def _lookup(self, key):
+        # The record of key in the file, or None.
+        m = self._map
+        if m is None:
+            return None
+        mask = self._nslots - 1
+        i = _HASH.unpack_from(key)[0] & mask
+        while True:
+            k, offset, length = _SLOT.unpack_from(m, self._table +
+                                                  i * _SLOT.size)
+            if not offset:
+                return None
+            if k == key:
+                return m[offset:offset + length]
+            i = (i + 1) & mask
+
+    def _slots(self):
+        # The (key, record offset, record length) of each entry in the file.
+        m = self._map
+        if m is None:
+            return
+        for i in range(self._nslots):
+            slot = _SLOT.unpack_from(m, self._table + i * _SLOT.size)
+            if slot[1]:
+                yield slot
+
+    def parse(self, dialect, fmt, abi=None):
+        '''Returns the result of parsing fmt (a str or bytes) with the
+        dialect ('printf' or 'scanf') for the ABI profile abi, from the
+        cache if it's there and by parsing it otherwise.'''
+        key = cache_key(dialect, fmt, abi)
+        data = self._pending.get(key)
+        if data is None:
+            data = self._lookup(key)
+        if data is not None:
+            self.hits += 1
+            return _loads(dialect, data)
+
+        self.misses += 1
+        parse = getattr(parser_module(dialect), dialect + '_parse')
+        diagnostics = []
+        d, a = parse(fmt, abi=abi, diagnostics=diagnostics)
+        if diagnostics:
+            e = parse_error(fmt, diagnostics[0])
+            self._pending[key] = marshal.dumps(str(e))
+            raise e
+        self._pending[key] = marshal.dumps(pack(dialect, d, a))
+        return d, a
+
+    def printf_parse(self, fmt, abi=None):
+        return self.parse('printf', fmt, abi)
+
+    def scanf_parse(self, fmt, abi=None):
+        return self.parse('scanf', fmt, abi)
+
+    def prefill(self, dialect, fmts, abi=None, executor=EXECUTOR_SERIAL,
+                chunksize=1024, workers=None):
+        '''Parses each string of the iterable fmts that isn't cached yet, as
+        batch.iparse_many() would, and saves the results with flush().
+        Returns the number of strings parsed.'''
+        keys = []
+        todo = []
+        seen = set()
+        for fmt in fmts:
+            key = cache_key(dialect, fmt, abi)
+            if (key in seen or key in self._pending or
+                    self._lookup(key) is not None):
+                continue
+            seen.add(key)
+            keys.append(key)
+            todo.append(fmt)
+
+        results = iparse_many(dialect, todo, executor, chunksize, workers,
+                              ERRORS_RETURN, packed=True, abi=abi)
+        for key, result in zip(keys, results):
+            if isinstance(result, Exception):
+                self._pending[key] = marshal.dumps(str(result))
+            else:
+                self._pending[key] = marshal.dumps(result)
+        self.flush()
+        return len(todo)
+
+    def flush(self):
+        '''Writes the results parsed since the last flush() to the file.'''
+        if not self._pending:
+            return
+        # Start from the file as it is now, which another process may have
+        # rewritten since this one opened it, and keep others from doing so
+        # until this one's is in place.
+        with _lock(self.path):
+            self._close_map()
+            self._open()
+            slots = list(self._slots())
+            keys = set(key for key, _, _ in slots)
+            records = [(key, data) for key, data in self._pending.items()
+                       if key not in keys]
+            m = self._map
+            append = False
+            if m is not None and fcntl is not None:
+                # Replaced tables, and the records of any flush that died
+                # before writing the header, are dead space.
+                size = len(m)
+                live = (_HEADER.size + sum(length for _, _, length in slots) +
+                        self._nslots * _SLOT.size)
+                append = size - live < live
+            if append:
+                # Leave what is there in place for readers.
+                self._close_map()
+                with open(self.path, 'r+b') as f:
+                    _write(f, size, records, slots)
+            else:
+                # Rewrite the live records into a new file.
+                records.extend((key, m[offset:offset + length])
+                               for key, offset, length in slots)
+                self._close_map()
+                tmp = '%s.%d.tmp' % (self.path, os.getpid())
+                with open(tmp, 'wb') as f:
+                    f.write(b'\0' * _HEADER.size)
+                    _write(f, _HEADER.size, records, [])
+                _replace(tmp, self.path)
+        self._pending = {}
+        self._open()
+
+    def close(self):
+        '''Flushes and unmaps the file.'''
+        self.flush()
+        self._close_map()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self._entries + len(self._pending)
+
+    def info(self):
+        return CacheInfo(self.hits, self.misses, 0, None, len(self), None)
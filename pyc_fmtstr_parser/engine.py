@@ -0,0 +1,551 @@
+# Copyright (C) 2014, Mark Laws.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program; if not, see <http://www.gnu.org/licenses/>.
+
+'''The parser shared by the printf and scanf dialects.
+
+Both dialects write a directive as
+
+    % [argnum$] [flags] [width] [.precision] [length] conversion
+
+and differ only in which flags there are, whether the width and precision
+exist or can come from arguments, and which conversions there are and what
+argument each takes with each length modifier.  A Dialect holds those
+differences as tables, and scan_directives() runs any dialect from its
+tables, so a new dialect is a new Dialect rather than a new parser.
+parse() builds the Directives and Arguments from what scan_directives()
+reads, as do the iterparse and query modules their own results, so that
+the grammar is written once.
+
+The argument types are precomputed for every conversion and every class of
+length modifier (see length_class()): the type/size flags that the length
+modifiers add up to only ever select one of six types per conversion.'''
+
+from .abi import get_profile
+from .diagnostics import (Diagnostic, ERR_AMBIGUOUS_ARG, ERR_ARG_ZERO,
+                          ERR_BAD_CONVERSION, ERR_UNTERMINATED, error)
+
+try:
+    text_type = basestring
+except NameError:
+    text_type = str
+
+# Incremented whenever a change makes the parsers return a different result
+# for some format string, so that results saved by an earlier version (see
+# the diskcache module) aren't used.
+PARSER_VERSION = 2
+
+# arg_index value indicating that no argument is consumed.
+ARG_NONE = ~0
+
+# Classes of type/size flags, i.e. of length modifiers, that select
+# different argument types: none, h, hh, l, ll (or lL, or a typedef the size
+# of long long), L.
+LENGTH_NONE = 0
+LENGTH_H = 1
+LENGTH_HH = 2
+LENGTH_L = 3
+LENGTH_LL = 4
+LENGTH_BIG_L = 5
+
+# The flags that each class is computed from when building the tables.
+_CLASS_FLAGS = (0, 1, 3, 8, 16, 4)
+
+def _flags_class(flags):
+    if flags & 4:
+        return LENGTH_LL if flags >= 8 else LENGTH_BIG_L
+    elif flags >= 8:
+        return LENGTH_L
+    elif flags & 2:
+        return LENGTH_HH
+    elif flags & 1:
+        return LENGTH_H
+    return LENGTH_NONE
+
+_LENGTH_CLASS = tuple(_flags_class(flags) for flags in range(16))
+
+def length_class(flags):
+    '''Returns the class of the type/size flags that the length modifiers
+    add up to (see AbiProfile.length_flags()).'''
+    return _LENGTH_CLASS[flags] if flags < 16 else LENGTH_LL
+
+# The characters of length modifiers, and the digits of widths, precisions
+# and argument numbers: only ASCII ones, where str.isdigit() also accepts
+# other scripts' digits.
+LENGTH_CHARS = frozenset('hlLjzt')
+DIGITS = frozenset('0123456789')
+
+# The fields scan_directives() reads for each directive: the slots of a
+# Directive (precision_* are None and ARG_NONE in dialects without
+# precisions), then the type of the argument that arg_index refers to
+# (TYPE_NONE if none) and the scanset (None but for scanf's %[).
+DIRECTIVE_FIELDS = (
+    'dir_start', 'dir_end', 'flags', 'width_start', 'width_end',
+    'width_arg_index', 'precision_start', 'precision_end',
+    'precision_arg_index', 'conversion', 'arg_index', 'length', 'type',
+    'scanset')
+
+def conversion_table(conv_char):
+    '''Builds a Dialect's conversion table from a dict of conversion
+    characters to functions conv(c, flags) -> (conversion, type), which
+    give the conversion to record (e.g. 'c' for 'C') and the argument type
+    for type/size flags.'''
+    table = {}
+    for c, conv in conv_char.items():
+        results = [conv(c, flags) for flags in _CLASS_FLAGS]
+        table[c] = (results[0][0], tuple(type for _, type in results), None)
+    return table
+
+class Dialect(object):
+    '''The tables that scan_directives() runs a dialect from.
+
+    name: the dialect's name, e.g. 'printf'
+    Directive, Directives, Argument, Arguments: the classes of the results
+    flags: dict of flag characters to the bits they set in Directive.flags
+    repeat_flags: whether flags may follow each other; if not, at most one
+        is read
+    suppress: flag bits that make a directive consume no argument
+    star: whether widths and precisions may be given as '*' (taking an int
+        argument) rather than digits
+    precision: whether there are precisions at all
+    conversions: dict of conversion characters to (conversion, types, hook),
+        where conversion is what the directive records, types the argument
+        type for each length class (TYPE_NONE for none), and hook None or
+        hook(fmt, cp, end, dp), which parses the rest of the directive from
+        the conversion character at cp, sets dp.scanset, and returns (offset
+        past it, None) or (offset of the error, error code)
+    Arg_type: the dialect's argument types
+    make_directive: make_directive(fields) returns a new Directive made from
+        a tuple of the DIRECTIVE_FIELDS'''
+    __slots__ = ['name', 'Directive', 'Directives', 'Argument', 'Arguments',
+                 'flags', 'repeat_flags', 'suppress', 'star', 'precision',
+                 'conversions', 'Arg_type', 'make_directive']
+
+    def __init__(self, name, Directive, Directives, Argument, Arguments,
+                 flags, repeat_flags, suppress, star, precision, conversions,
+                 Arg_type):
+        self.name = name
+        self.Directive = Directive
+        self.Directives = Directives
+        self.Argument = Argument
+        self.Arguments = Arguments
+        self.flags = flags
+        self.repeat_flags = repeat_flags
+        self.suppress = suppress
+        self.star = star
+        self.precision = precision
+        self.conversions = conversions
+        self.Arg_type = Arg_type
+        self.make_directive = _directive_maker(Directive)
+
+    def arg_type(self, conversion, flags):
+        '''Returns the argument type of the conversion character with the
+        type/size flags.'''
+        return self.conversions[conversion][1][length_class(flags)]
+
+    def __repr__(self):
+        return '<Dialect %s>' % self.name
+
+def _directive_maker(Directive):
+    # Generated so that a directive is filled in by one tuple assignment,
+    # the fields that Directive has no slot for going to _.
+    slots = Directive.__slots__
+    lines = [
+        'def make_directive(fields):',
+        '    dp = new(Directive)',
+        '    %s = fields' % ', '.join('dp.' + name if name in slots else '_'
+                                      for name in DIRECTIVE_FIELDS),
+        '    return dp',
+    ]
+    namespace = {'Directive': Directive, 'new': object.__new__}
+    exec('\n'.join(lines), namespace)
+    return namespace['make_directive']
+
+class _ReadOnly(object):
+    '''Mixin that rejects attribute assignment once an object is built.'''
+    __slots__ = []
+
+    def __setattr__(self, name, value):
+        raise AttributeError("'%s' object is read-only" % type(self).__name__)
+
+    def __delattr__(self, name):
+        raise AttributeError("'%s' object is read-only" % type(self).__name__)
+
+def _copy_slots(dst, src, slots):
+    for name in slots:
+        try:
+            object.__setattr__(dst, name, getattr(src, name))
+        except AttributeError:
+            pass
+
+def frozen_results(module, Directive, Directives, Argument, Arguments):
+    '''Returns read-only subclasses FrozenDirective, FrozenDirectives,
+    FrozenArgument and FrozenArguments of a dialect's result classes, named
+    as if defined in the module, and the dialect's freeze(d, a).'''
+    def frozen(base, doc, init):
+        return type('Frozen' + base.__name__, (_ReadOnly, base),
+                    {'__slots__': [], '__doc__': doc, '__init__': init,
+                     '__module__': module})
+
+    def init_argument(self, arg):
+        _copy_slots(self, arg, Argument.__slots__)
+
+    def init_arguments(self, a):
+        object.__setattr__(self, 'count', a.count)
+        object.__setattr__(self, 'arg',
+                           tuple(FrozenArgument(x) for x in a.arg))
+
+    def init_directive(self, dp):
+        _copy_slots(self, dp, Directive.__slots__)
+
+    def init_directives(self, d):
+        _copy_slots(self, d, Directives.__slots__)
+        object.__setattr__(self, 'dir',
+                           tuple(FrozenDirective(x) for x in d.dir))
+
+    FrozenArgument = frozen(Argument, 'Read-only copy of an Argument.',
+                            init_argument)
+    FrozenArguments = frozen(Arguments, 'Read-only copy of an Arguments; '
+                             'arg is a tuple.', init_arguments)
+    FrozenDirective = frozen(Directive, 'Read-only copy of a Directive.',
+                             init_directive)
+    FrozenDirectives = frozen(Directives, 'Read-only copy of a Directives; '
+                              'dir is a tuple.', init_directives)
+
+    def freeze(d, a):
+        '''Returns read-only copies of the results of a parse, suitable for
+        sharing between callers (e.g. from a cache).'''
+        return FrozenDirectives(d), FrozenArguments(a)
+    freeze.__module__ = module
+
+    return (FrozenDirective, FrozenDirectives, FrozenArgument,
+            FrozenArguments, freeze)
+
+def register_arg(dialect, a, index, type):
+    '''Records in the Arguments a that argument number index (from 0) has
+    the given type, raising ValueError if it already has another.'''
+    TYPE_NONE = dialect.Arg_type.TYPE_NONE
+    while a.count <= index:
+        try:
+            a.arg[a.count]
+        except IndexError:
+            a.arg.append(dialect.Argument())
+        a.arg[a.count].type = TYPE_NONE
+        a.count += 1
+    if a.arg[index].type == TYPE_NONE:
+        a.arg[index].type = type
+    elif a.arg[index].type != type:
+        raise error(ERR_AMBIGUOUS_ARG)
+
+def _arg_number(fmt, cp):
+    # The value of the argument number ("12$") at cp and the offset past the
+    # '$', or (None, cp) if there isn't one.
+    np = cp
+    while fmt[np] in DIGITS:
+        np += 1
+    if np == cp or fmt[np] != '$':
+        return None, cp
+    n = 0
+    while cp < np:
+        n = n * 10 + (ord(fmt[cp]) - ord('0'))
+        cp += 1
+    return n, np + 1
+
+def prepare(fmt, start):
+    '''Returns the format string fmt, as scan_directives() takes it, and
+    its length: a str or unicode gets a NUL appended, as C strings have
+    (which none of the tests accept, so reaching the end needs no checks
+    until the conversion character), and a buffer is read in place as the
+    NUL-terminated string at start (see the buffers module).'''
+    if isinstance(fmt, text_type):
+        return fmt + '\0', len(fmt)
+    from .buffers import as_format
+    fmt = as_format(fmt, start)
+    return fmt, len(fmt)
+
+class _Scratch(object):
+    # Where a conversion hook stores what it parses.
+    __slots__ = ['scanset']
+
+def scan_directives(dialect, fmt, end, start, abi, diagnostics, types,
+                    maxima, new):
+    '''Yields new(fields) for each directive of the format string fmt of
+    length end, prepared by prepare(), from offset start, where fields is a
+    tuple of the DIRECTIVE_FIELDS.  Argument numbers are assigned and
+    checked as it goes, and the list types holds the type of each argument
+    so far, by number: once the directives end, it holds what the Arguments
+    of the parse would.  The list maxima likewise holds the greatest width
+    length and precision length so far, as [width, precision].
+
+    A malformed directive ends the iteration by raising ValueError, or, if
+    diagnostics is a list, by appending a Diagnostic to it.'''
+    length_steps = get_profile(abi).length_steps
+    flag_bits = dialect.flags
+    repeat_flags = dialect.repeat_flags
+    suppress = dialect.suppress
+    star = dialect.star
+    has_precision = dialect.precision
+    conversions = dialect.conversions
+    TYPE_NONE = dialect.Arg_type.TYPE_NONE
+    INT = dialect.Arg_type.TYPE_INT
+    scratch = None
+
+    cp = start               # index into format string
+    arg_posn = 0             # number of regular arguments consumed
+    positional = False       # whether any argument has been numbered
+    err = None
+
+    while True:
+        # Literal text can't contain a directive, so jump straight to the next
+        # '%' rather than examining it a character at a time.
+        cp = fmt.find('%', cp)
+        if cp < 0:
+            return
+
+        dir_start = cp
+        cp += 1
+        arg_index = width_index = precision_index = ARG_NONE
+        width_start = width_end = precision_start = precision_end = None
+        c = fmt[cp]
+
+        # Test for positional argument.
+        if c in DIGITS:
+            n, np = _arg_number(fmt, cp)
+            if n == 0:
+                err = ERR_ARG_ZERO
+                break
+            elif n is not None:
+                arg_index = n - 1
+                positional = True
+                cp = np
+                c = fmt[cp]
+
+        # Read the flags.
+        bits = 0
+        bit = flag_bits.get(c)
+        while bit is not None:
+            bits |= bit
+            cp += 1
+            c = fmt[cp]
+            bit = flag_bits.get(c) if repeat_flags else None
+
+        # Parse the field width.
+        if c == '*' and star:
+            width_start = cp
+            cp += 1
+            width_end = cp
+            if maxima[0] < 1:
+                maxima[0] = 1
+            n, np = _arg_number(fmt, cp)
+            if n is None:
+                width_index = arg_posn
+                arg_posn += 1
+            elif n == 0:
+                err = ERR_ARG_ZERO
+                break
+            else:
+                width_index = n - 1
+                positional = True
+                cp = np
+            c = fmt[cp]
+        elif c in DIGITS:
+            width_start = cp
+            cp += 1
+            while fmt[cp] in DIGITS:
+                cp += 1
+            width_end = cp
+            if maxima[0] < cp - width_start:
+                maxima[0] = cp - width_start
+            c = fmt[cp]
+
+        # Parse the precision.
+        if c == '.' and has_precision:
+            precision_start = cp
+            cp += 1
+            if fmt[cp] == '*' and star:
+                cp += 1
+                precision_end = cp
+                if maxima[1] < 2:
+                    maxima[1] = 2
+                n, np = _arg_number(fmt, cp)
+                if n is None:
+                    precision_index = arg_posn
+                    arg_posn += 1
+                elif n == 0:
+                    err = ERR_ARG_ZERO
+                    break
+                else:
+                    precision_index = n - 1
+                    positional = True
+                    cp = np
+            else:
+                while fmt[cp] in DIGITS:
+                    cp += 1
+                precision_end = cp
+                if maxima[1] < cp - precision_start:
+                    maxima[1] = cp - precision_start
+            c = fmt[cp]
+
+        # Parse argument type/size specifiers.
+        flags = 0
+        length = ''
+        if c in LENGTH_CHARS:
+            length_start = cp
+            while c in LENGTH_CHARS:
+                if c == 'h':
+                    flags |= (1 << (flags & 1))
+                elif c == 'L':
+                    flags |= 4
+                else:
+                    flags += length_steps[c]
+                cp += 1
+                c = fmt[cp]
+            length = fmt[length_start:cp]
+
+        # Read the conversion character.
+        conv = conversions.get(c)
+        if conv is None:
+            err = ERR_UNTERMINATED if cp >= end else ERR_BAD_CONVERSION
+            break
+        conversion, conv_types, hook = conv
+        type = conv_types[_LENGTH_CLASS[flags] if flags < 16 else LENGTH_LL]
+        scanset = None
+        if hook is None:
+            cp += 1
+            if conversion != c:
+                # e.g. printf's %C and %S are %lc and %ls.
+                length = 'l'
+        else:
+            if scratch is None:
+                scratch = _Scratch()
+            scratch.scanset = None
+            cp, err = hook(fmt, cp, end, scratch)
+            if err is not None:
+                break
+            scanset = scratch.scanset
+
+        if type != TYPE_NONE and not bits & suppress:
+            if arg_index == ARG_NONE:
+                arg_index = arg_posn
+                arg_posn += 1
+        else:
+            arg_index = ARG_NONE
+            type = TYPE_NONE
+
+        # Only numbered arguments can clash.  Check before registering any,
+        # so that a bad directive leaves none behind.
+        if positional:
+            if _clash(types, width_index, precision_index, arg_index, type,
+                      INT, TYPE_NONE):
+                err = ERR_AMBIGUOUS_ARG
+                cp = dir_start
+                break
+            for index, t in ((width_index, INT), (precision_index, INT),
+                             (arg_index, type)):
+                if index != ARG_NONE:
+                    while len(types) <= index:
+                        types.append(TYPE_NONE)
+                    types[index] = t
+        else:
+            # Without numbers, each argument is the next one.
+            if width_index != ARG_NONE:
+                types.append(INT)
+            if precision_index != ARG_NONE:
+                types.append(INT)
+            if arg_index != ARG_NONE:
+                types.append(type)
+
+        yield new((dir_start, cp, bits, width_start, width_end, width_index,
+                   precision_start, precision_end, precision_index,
+                   conversion, arg_index, length, type, scanset))
+
+    if diagnostics is None:
+        raise error(err, fmt[cp])
+    diagnostics.append(Diagnostic(err, cp, dir_start))
+
+def _clash(types, width, precision, index, type, INT, TYPE_NONE):
+    # True if the arguments of a directive disagree with the types so far.
+    for i in width, precision:
+        if i != ARG_NONE and (_differs(types, i, INT, TYPE_NONE) or
+                              (i == index and type != INT)):
+            return True
+    return index != ARG_NONE and _differs(types, index, type, TYPE_NONE)
+
+def _differs(types, index, type, TYPE_NONE):
+    return (index < len(types) and types[index] != type and
+            types[index] != TYPE_NONE)
+
+def parse(dialect, fmt, start=0, abi=None, diagnostics=None):
+    '''Parses the format string fmt in the dialect; see printf_parse() for
+    the arguments and the result.'''
+    fmt, end = prepare(fmt, start)
+    errors = len(diagnostics) if diagnostics is not None else 0
+
+    d = dialect.Directives()
+    dirs = d.dir
+    types = []
+    maxima = [0, 0]
+    dirs.extend(scan_directives(dialect, fmt, end, start, abi, diagnostics,
+                                types, maxima, dialect.make_directive))
+    if diagnostics is not None and len(diagnostics) > errors:
+        # The bad directive becomes the sentinel, and the lengths are those
+        # of the directives before it.
+        end = diagnostics[-1].dir_start
+        maxima = [0, 0]
+        for dp in dirs:
+            if dp.width_start is not None:
+                maxima[0] = max(maxima[0], dp.width_end - dp.width_start)
+            if getattr(dp, 'precision_start', None) is not None:
+                maxima[1] = max(maxima[1],
+                                dp.precision_end - dp.precision_start)
+
+    d.count = len(dirs)
+    dp = dialect.Directive()
+    dp.dir_start = end
+    dirs.append(dp)
+
+    d.max_width_length = maxima[0]
+    if dialect.precision:
+        d.max_precision_length = maxima[1]
+
+    a = dialect.Arguments()
+    Argument = dialect.Argument
+    args = a.arg
+    for type in types:
+        x = Argument()
+        x.type = type
+        args.append(x)
+    a.count = len(args)
+
+    return d, a
+
+def resolve_arguments(dialect, d, abi=None):
+    '''Returns the Arguments that parsing the format string for the ABI
+    profile abi would have produced, working from the length modifiers and
+    conversions recorded in the Directives d instead of re-scanning the
+    string.'''
+    abi = get_profile(abi)
+    INT = dialect.Arg_type.TYPE_INT
+    a = dialect.Arguments()
+
+    for dp in d.dir[:d.count]:
+        if dp.width_arg_index != ARG_NONE:
+            register_arg(dialect, a, dp.width_arg_index, INT)
+        if getattr(dp, 'precision_arg_index', ARG_NONE) != ARG_NONE:
+            register_arg(dialect, a, dp.precision_arg_index, INT)
+        if dp.arg_index != ARG_NONE:
+            register_arg(dialect, a, dp.arg_index, dialect.arg_type(
+                dp.conversion, abi.length_flags(dp.length)))
+
+    return a
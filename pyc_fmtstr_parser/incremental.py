@@ -0,0 +1,173 @@
+# Copyright (C) 2014, Mark Laws.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program; if not, see <http://www.gnu.org/licenses/>.
+
+'''Incremental re-parsing of edited format strings.
+
+printf_reparse() and scanf_reparse() bring the result of a parse up to date
+with an edit of the format string (offset, number of characters deleted,
+text inserted).  Only the directives that the edit touches are parsed again,
+by running the parser over the slice of the new string that holds them; the
+directives after it keep their objects and just have their offsets moved,
+and their argument numbers when the edit changes how many arguments come
+before them.  A directive's parse depends only on its own characters, so a
+slice that parses without running off its end parses the same as it would
+in the full string.
+
+Formats that number their arguments explicitly ('%2$d') are parsed in full
+after each edit: there, one directive can change the type of an argument
+that any other directive refers to.'''
+
+import re
+
+_POSITIONAL = re.compile('[%*][0-9]+\\$')
+
+_INDEXES = ('width_arg_index', 'precision_arg_index', 'arg_index')
+_LENGTHS = (('max_width_length', 'width'),
+            ('max_precision_length', 'precision'))
+
+def _indexes(dirs, ARG_NONE):
+    return [getattr(dp, name) for dp in dirs for name in _INDEXES
+            if getattr(dp, name, ARG_NONE) != ARG_NONE]
+
+def _longest(dirs, field):
+    start = field + '_start'
+    end = field + '_end'
+    return max([getattr(dp, end) - getattr(dp, start) for dp in dirs
+                if getattr(dp, start) is not None] or [0])
+
+def _move(dirs, shift, delta, precision, ARG_NONE):
+    # Adds shift to the offsets and delta to the argument numbers of dirs.
+    # This is the only part of a re-parse whose cost grows with the length of
+    # the string, so it sticks to plain attribute arithmetic.
+    for dp in dirs:
+        if shift:
+            dp.dir_start += shift
+            dp.dir_end += shift
+            if dp.width_start is not None:
+                dp.width_start += shift
+                dp.width_end += shift
+            if precision and dp.precision_start is not None:
+                dp.precision_start += shift
+                dp.precision_end += shift
+        if delta:
+            if dp.arg_index != ARG_NONE:
+                dp.arg_index += delta
+            if dp.width_arg_index != ARG_NONE:
+                dp.width_arg_index += delta
+            if precision and dp.precision_arg_index != ARG_NONE:
+                dp.precision_arg_index += delta
+
+def _replace(dst, src):
+    for name in type(src).__slots__:
+        try:
+            setattr(dst, name, getattr(src, name))
+        except AttributeError:
+            pass
+
+def _reparse(parse, ARG_NONE, fmt, d, a, offset, deleted, inserted, abi):
+    new = fmt[:offset] + inserted + fmt[offset + deleted:]
+    if (('$' in new and _POSITIONAL.search(new)) or
+            ('$' in fmt and _POSITIONAL.search(fmt))):
+        d2, a2 = parse(new, abi=abi)
+        _replace(d, d2)
+        _replace(a, a2)
+        return new, d, a
+
+    dirs = d.dir
+    count = d.count
+    shift = len(inserted) - deleted
+
+    # dirs[i0:i1] are the directives that overlap the edit.
+    lo, hi = 0, count
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if dirs[mid].dir_end > offset:
+            hi = mid
+        else:
+            lo = mid + 1
+    i0 = i1 = lo
+    while i1 < count and dirs[i1].dir_start < offset + deleted:
+        i1 += 1
+    start = offset
+    if i0 < i1 and dirs[i0].dir_start < start:
+        start = dirs[i0].dir_start
+
+    # Parse up to the next untouched directive; if the slice cuts a
+    # directive short, take in more of the ones after it.
+    step = 1
+    while True:
+        stop = dirs[i1].dir_start + shift if i1 < count else len(new)
+        try:
+            d2, a2 = parse(new[start:stop], abi=abi)
+            break
+        except ValueError:
+            if i1 >= count:
+                raise
+        i1 = min(i1 + step, count)
+        step *= 2
+
+    # The number of arguments used before the edit.
+    first = 0
+    i = i0
+    while i and not first:
+        i -= 1
+        used = _indexes(dirs[i:i + 1], ARG_NONE)
+        if used:
+            first = max(used) + 1
+    old_nargs = len(_indexes(dirs[i0:i1], ARG_NONE))
+    delta = a2.count - old_nargs
+
+    fresh = d2.dir[:d2.count]
+    precision = hasattr(d, 'max_precision_length')
+    _move(fresh, start, first, precision, ARG_NONE)
+    if shift or delta:
+        _move(dirs[i1:count], shift, delta, precision, ARG_NONE)
+
+    # The longest width or precision only needs a pass over every directive
+    # if the longest one was in the part replaced and nothing as long
+    # replaced it.
+    lengths = [(name, field) for name, field in _LENGTHS if hasattr(d, name)]
+    old_longest = [_longest(dirs[i0:i1], field) for name, field in lengths]
+
+    dirs[i0:i1] = fresh
+    d.count += d2.count - (i1 - i0)
+    dirs[d.count].dir_start = len(new)
+    a.arg[first:first + old_nargs] = a2.arg[:a2.count]
+    a.count += delta
+
+    for (name, field), old in zip(lengths, old_longest):
+        longest = getattr(d, name)
+        if getattr(d2, name) >= longest:
+            setattr(d, name, getattr(d2, name))
+        elif old == longest:
+            setattr(d, name, _longest(dirs[:d.count], field))
+
+    return new, d, a
+
+def printf_reparse(fmt, d, a, offset, deleted, inserted, abi=None):
+    '''Brings the result (d, a) of printf_parse(fmt, abi=abi) up to date
+    with an edit that replaces the deleted characters of fmt at offset with
+    the string inserted.  Returns (new_fmt, d, a); d and a are updated in
+    place, so they must not be frozen.  If the edited string doesn't parse,
+    the error propagates and d and a are left as they were.'''
+    from .printf_parse import ARG_NONE, printf_parse
+    return _reparse(printf_parse, ARG_NONE, fmt, d, a, offset, deleted,
+                    inserted, abi)
+
+def scanf_reparse(fmt, d, a, offset, deleted, inserted, abi=None):
+    '''Like printf_reparse(), for the result of scanf_parse().'''
+    from .scanf_parse import ARG_NONE, scanf_parse
+    return _reparse(scanf_parse, ARG_NONE, fmt, d, a, offset, deleted,
+                    inserted, abi)
@@ -0,0 +1,43 @@
+# Copyright (C) 2014, Mark Laws.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program; if not, see <http://www.gnu.org/licenses/>.
+
+'''Parsing a format string one directive at a time.
+
+    for dt in iter_printf_directives(fmt):
+        if dt.conversion == 'n':
+            break
+
+iter_directives() runs engine.scan_directives(), as engine.parse() does,
+but yields each directive as a DirectiveTuple as soon as it's read, and
+builds no Directive, Arguments or sentinel.  A caller that stops early pays
+only for the directives it read.
+
+The directives yielded are exactly those of the full parse, in the same
+order and with the same fields, up to the first error; the error is raised
+(or appended to diagnostics) when the iteration reaches the bad directive,
+so directives before it have already been yielded.'''
+
+from collections import namedtuple
+
+from .engine import DIRECTIVE_FIELDS, prepare, scan_directives
+
+DirectiveTuple = namedtuple('DirectiveTuple', DIRECTIVE_FIELDS)
+
+def iter_directives(dialect, fmt, start=0, abi=None, diagnostics=None):
+    '''Yields the directives of the format string fmt in the dialect as
+    DirectiveTuples; see printf_parse() for the arguments.'''
+    fmt, end = prepare(fmt, start)
+    return scan_directives(dialect, fmt, end, start, abi, diagnostics, [],
+                           [0, 0], DirectiveTuple._make)
@@ -0,0 +1,86 @@
+# Copyright (C) 2014, Mark Laws.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program; if not, see <http://www.gnu.org/licenses/>.
+
+'''A small bounded mapping with LRU or FIFO eviction and hit/miss/eviction
+counters, shared by the caches in this package.'''
+
+import threading
+from collections import namedtuple, OrderedDict
+
+CacheInfo = namedtuple('CacheInfo',
+                       'hits misses evictions maxsize currsize policy')
+
+POLICY_LRU = 'lru'     # evict the least recently used entry
+POLICY_FIFO = 'fifo'   # evict the oldest entry; hits don't reorder
+
+class LRUCache(object):
+    '''A bounded, thread-safe mapping.  maxsize None means unbounded.'''
+    __slots__ = ['maxsize', 'policy', 'hits', 'misses', 'evictions',
+                 '_data', '_lock']
+
+    def __init__(self, maxsize=4096, policy=POLICY_LRU):
+        if maxsize is not None and maxsize < 0:
+            raise ValueError('maxsize must be None or >= 0')
+        if policy not in (POLICY_LRU, POLICY_FIFO):
+            raise ValueError('unknown eviction policy: %r' % (policy,))
+        self.maxsize = maxsize
+        self.policy = policy
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            if self.policy == POLICY_LRU:
+                del self._data[key]
+                self._data[key] = value
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            data = self._data
+            if key in data:
+                del data[key]
+            elif self.maxsize is not None:
+                if self.maxsize == 0:
+                    return
+                while len(data) >= self.maxsize:
+                    data.popitem(last=False)
+                    self.evictions += 1
+            data[key] = value
+
+    def clear(self):
+        '''Drops all entries and zeroes the counters.'''
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def info(self):
+        return CacheInfo(self.hits, self.misses, self.evictions, self.maxsize,
+                         len(self._data), self.policy)
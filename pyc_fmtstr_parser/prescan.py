@@ -0,0 +1,239 @@
+# Copyright (C) 2014, Mark Laws.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program; if not, see <http://www.gnu.org/licenses/>.
+
+'''Finding the candidate format strings in a large binary buffer.
+
+    for offset in candidates(image, threads=4):
+        d, a = printf_parse(image, offset, diagnostics=[])
+
+A candidate is a run of printable ASCII characters (tab, newline and
+carriage return included) that ends in a NUL, is at most max_length bytes
+long, isn't preceded by another printable character, and contains a '%'
+followed by a character that can begin a directive in the dialect: a flag,
+a digit, a length modifier or a conversion character (including '%'), or
+'.' and '*' in dialects with precisions and '*' widths.  Text such as
+"(100%)" is thus skipped without being parsed, though "100% done" isn't,
+since "% d" is a directive.
+
+Without NumPy, a regular expression finds each plausible '%' and the run
+around it is measured in Python, which is fast where '%'s are rare but
+slow in string tables, where most runs are candidates.  With NumPy, the
+'%'s of a chunk and their runs are found with array operations, several
+times faster there.  NumPy releases the GIL while it works, so threads > 1
+scans several chunks at once.'''
+
+import re
+
+from .batch import parser_module
+from .engine import DIGITS, LENGTH_CHARS
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Bytes scanned per chunk.
+CHUNK_SIZE = 1 << 22
+
+# The first window around a '%' looked at for the ends of its run.  For the
+# runs it doesn't hold, _scan_re() grows it 8 times at a time, up to
+# max_length + 1, and _scan_numpy() finds the ends among all the stops.
+_WINDOW = 64
+
+# A run of printable characters.
+_RUN_RE = re.compile(b'[\\t\\n\\r\\x20-\\x7e]*')
+
+# Per dialect: the bytes that can follow a '%' in a candidate, the pattern
+# matching such a '%' and (with NumPy) a table of the bytes, by value.
+_followers = {}
+_patterns = {}
+_tables = {}
+
+def _following(dialect):
+    try:
+        return _followers[dialect]
+    except KeyError:
+        pass
+    d = parser_module(dialect).DIALECT
+    chars = set(d.flags) | set(d.conversions) | DIGITS | LENGTH_CHARS
+    if d.precision:
+        chars.add('.')
+    if d.star:
+        chars.add('*')
+    result = _followers[dialect] = bytes(bytearray(sorted(ord(c)
+                                                          for c in chars)))
+    return result
+
+def _pattern(dialect):
+    try:
+        return _patterns[dialect]
+    except KeyError:
+        following = _following(dialect)
+        result = _patterns[dialect] = re.compile(
+            b'%[' + b''.join(re.escape(following[i:i + 1])
+                             for i in range(len(following))) + b']')
+        return result
+
+def _table(dialect):
+    try:
+        return _tables[dialect]
+    except KeyError:
+        table = _tables[dialect] = numpy.zeros(256, dtype=bool)
+        table[numpy.frombuffer(_following(dialect), dtype=numpy.uint8)] = True
+        return table
+
+if numpy is not None:
+    # True for the bytes that can be in a run: printable ASCII.
+    _RUN = numpy.zeros(256, dtype=bool)
+    _RUN[[9, 10, 13]] = True
+    _RUN[0x20:0x7f] = True
+
+def _scan_re(buf, start, end, lo, hi, max_length, dialect):
+    # The candidates starting in [start, end), found from their first
+    # plausible '%', after which the search goes on past the run's end.
+    percent = _pattern(dialect)
+    hi = min(hi, end + max_length)
+    result = []
+    pos = start
+    while True:
+        m = percent.search(buf, pos, hi)
+        if m is None:
+            break
+        p = m.start()
+        e = _RUN_RE.match(buf, p, hi).end()
+        pos = e + 1
+        if e == hi or buf[e:e + 1] != b'\0':
+            continue
+        # Look back for the start of the run, growing the window as it
+        # goes.
+        window = _WINDOW
+        while True:
+            window = min(window, max_length + 1)
+            w = max(lo, p - window)
+            n = _RUN_RE.match(buf[w:p][::-1]).end()
+            if n < p - w or w == lo or window > max_length:
+                break
+            window *= 8
+        s = p - n
+        if s >= end:
+            break
+        if s >= start and (s == lo or n < p - w) and e - s <= max_length:
+            result.append(s)
+    return result
+
+def _scan_numpy(buf, start, end, lo, hi, max_length, dialect):
+    # As _scan_re(), looking from the byte before start for the stops of
+    # runs starting at start.  Only the bytes around each plausible '%' are
+    # read to find the ends of its run, so the time taken is mostly that of
+    # finding the '%'s.  The runs longer than the window are looked up
+    # among the stops of the chunk, as by _scan_dense(): growing windows
+    # would take len(pct) * window bytes each time.
+    base = max(lo, start - 1)
+    a = numpy.frombuffer(buf, numpy.uint8, min(hi, end + max_length) - base,
+                         base)
+    pct = numpy.flatnonzero(a[:-1] == 0x25)
+    pct = pct[_table(dialect)[a[pct + 1]]]
+    if len(pct) * _WINDOW * 2 > len(a):
+        return _distinct(_scan_dense(a, pct, base, start, end, max_length))
+    window = min(_WINDOW, max_length + 1)
+    # The stops (bytes that can't be in a run) either side of each '%',
+    # nearest first.  Bytes outside a count as stops that aren't NULs, which
+    # only rejects strings that don't start in [start, end), are too long
+    # or don't end before hi.
+    offsets = numpy.arange(1, window + 1)
+    before = pct[:, None] - offsets
+    inside = before >= 0
+    stop = ~(_RUN[a[numpy.where(inside, before, 0)]] & inside)
+    found = stop.any(1)
+    s = pct - stop.argmax(1)
+
+    after = pct[:, None] + offsets
+    inside = after < len(a)
+    c = a[numpy.where(inside, after, 0)]
+    stop = ~(_RUN[c] & inside)
+    found &= stop.any(1)
+    k = stop.argmax(1)
+    rows = numpy.arange(len(k))
+    nul = (c[rows, k] == 0) & inside[rows, k]
+
+    s = s[found & nul & (k + 1 + pct - s <= max_length)] + base
+    s = s[(s >= start) & (s < end)]
+    pct = pct[~found]
+    if len(pct) and window <= max_length:
+        s = numpy.concatenate((s, _scan_dense(a, pct, base, start, end,
+                                              max_length)))
+    s.sort()
+    return _distinct(s)
+
+def _distinct(s):
+    # The values of the sorted array s, once each, as a list.
+    if len(s) > 1:
+        s = s[numpy.concatenate(([True], s[1:] != s[:-1]))]
+    return s.tolist()
+
+def _scan_dense(a, pct, base, start, end, max_length):
+    # The sorted starts of the candidate runs around the '%'s at pct, for a
+    # chunk with too many of them to read a window around each: all the
+    # stops are found, and the ones around each '%' looked up.
+    stops = numpy.flatnonzero(~_RUN[a])
+    i = numpy.searchsorted(stops, pct)
+    i = i[i < len(stops)]
+    e = stops[i]
+    s = numpy.where(i > 0, stops[i - 1] + 1, 0)
+    # With no stop before the '%', the run starts at base, which is only
+    # start if start is lo.
+    s = s[(a[e] == 0) & (e - s <= max_length)] + base
+    # The '%'s are in order, so the runs are.
+    return s[(s >= start) & (s < end)]
+
+def candidates(buf, start=0, end=None, lo=0, hi=None, dialect='printf',
+               max_length=4096, threads=1, use_numpy=None):
+    '''Returns the offsets, in increasing order, of the candidate format
+    strings in buf (any buffer: bytes, bytearray, mmap, ...) that start in
+    [start, end) and lie within [lo, hi), which default to the whole
+    buffer.  A string may run past end, but not past hi.
+
+    The buffer is scanned in chunks of CHUNK_SIZE bytes, threads of them at
+    a time.  use_numpy forces the use of NumPy (True) or of the regular
+    expression (False); by default NumPy is used if it is installed.'''
+    size = len(buf)
+    if hi is None:
+        hi = size
+    if end is None:
+        end = hi
+    if not 0 <= lo <= start <= end <= hi <= size:
+        raise ValueError('bad range [%d, %d) within [%d, %d)' %
+                         (start, end, lo, hi))
+    if use_numpy is None:
+        use_numpy = numpy is not None
+    elif use_numpy and numpy is None:
+        raise ImportError('NumPy is not installed')
+    scan = _scan_numpy if use_numpy else _scan_re
+
+    def work(chunk):
+        return scan(buf, chunk, min(chunk + CHUNK_SIZE, end), lo, hi,
+                    max_length, dialect)
+    chunks = range(start, end, CHUNK_SIZE)
+    if threads > 1 and len(chunks) > 1:
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(min(threads, len(chunks)))
+        try:
+            results = pool.map(work, chunks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [work(chunk) for chunk in chunks]
+    return [offset for result in results for offset in result]
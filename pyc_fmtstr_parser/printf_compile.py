@@ -0,0 +1,431 @@
+# Copyright (C) 2014, Mark Laws.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program; if not, see <http://www.gnu.org/licenses/>.
+
+'''Compiles printf format strings into Python formatting functions.
+
+printf_compile() parses the format once and generates a function that renders
+its arguments with C printf semantics.  Directives whose C behaviour Python's
+own % operator reproduces exactly are folded into a single %-format string;
+the rest are rendered by the _format_* helpers below, which implement the C
+rules directly.'''
+
+import locale
+import math
+
+from .abi import get_profile
+from .lru import LRUCache
+from .printf_parse import (ARG_NONE, Arg_type, FLAG_ALT, FLAG_GROUP,
+                           FLAG_LEFT, FLAG_SHOWSIGN, FLAG_SPACE, FLAG_ZERO,
+                           printf_parse)
+
+try:
+    _integer_types = (int, long)
+except NameError:
+    _integer_types = (int,)
+
+try:
+    _unichr = unichr
+except NameError:
+    _unichr = chr
+
+# Compiled functions, keyed by (fmt, ABI profile sizes, thousands separator).
+compiled = LRUCache(maxsize=1024)
+
+def _justify(s, width, flags):
+    if len(s) >= width:
+        return s
+    if flags & FLAG_LEFT:
+        return s.ljust(width)
+    return s.rjust(width)
+
+def _star(flags, width, precision):
+    # Applies C's rules for widths and precisions taken from arguments.
+    if width is None:
+        width = 0
+    elif width < 0:
+        flags |= FLAG_LEFT
+        width = -width
+    if precision is not None and precision < 0:
+        precision = None
+    return flags, width, precision
+
+def _group(digits, sep):
+    head = len(digits) % 3 or 3
+    return sep.join([digits[:head]] +
+                    [digits[i:i + 3] for i in range(head, len(digits), 3)])
+
+def _pad_number(prefix, body, flags, width, zero):
+    if zero and not flags & FLAG_LEFT and len(prefix) + len(body) < width:
+        body = body.rjust(width - len(prefix), '0')
+    return _justify(prefix + body, width, flags)
+
+def _format_int(value, width, precision, conv, flags, bits, signed, sep):
+    flags, width, precision = _star(flags, width, precision)
+    mask = (1 << bits) - 1
+    value &= mask
+    if signed and value >> (bits - 1):
+        value -= 1 << bits
+
+    if conv in 'diu':
+        digits = str(abs(value))
+    elif conv == 'o':
+        digits = '%o' % value
+    else:
+        digits = ('%x' if conv == 'x' else '%X') % value
+
+    if precision is not None:
+        if precision == 0 and value == 0:
+            digits = ''
+        digits = digits.rjust(precision, '0')
+    if flags & FLAG_GROUP and sep and conv in 'diu':
+        digits = _group(digits, sep)
+
+    prefix = ''
+    if signed:
+        if value < 0:
+            prefix = '-'
+        elif flags & FLAG_SHOWSIGN:
+            prefix = '+'
+        elif flags & FLAG_SPACE:
+            prefix = ' '
+    if flags & FLAG_ALT:
+        if conv == 'o' and not digits.startswith('0'):
+            digits = '0' + digits
+        elif conv in 'xX' and value != 0:
+            prefix = '0' + conv
+
+    return _pad_number(prefix, digits, flags, width, flags & FLAG_ZERO and
+                       precision is None)
+
+def _hexfloat(value, precision, alt, x87=False):
+    # value is finite and non-negative.  Follows glibc: doubles print as
+    # 0x1.<hex>p<exp> if normal and as 0x0.<hex>p-1022 if subnormal, and
+    # trailing zeros are dropped unless a precision is given.  An x87 long
+    # double prints from its 64-bit mantissa, whose explicit integer bit and
+    # next three bits make the first digit, 0x8 to 0xf; every double is
+    # normal there.
+    if x87:
+        n = exp = 0
+        if value:
+            m, exp = math.frexp(value)
+            n = int(m * (1 << 64))
+            exp -= 4
+        lead = n >> 60
+        frac = '%015x' % (n & ((1 << 60) - 1))
+    else:
+        mantissa, exp = value.hex()[2:].split('p')
+        lead, _, frac = mantissa.partition('.')
+        lead = int(lead, 16)
+        exp = int(exp)
+    if precision is None:
+        frac = frac.rstrip('0')
+    elif precision < len(frac):
+        shift = 4 * (len(frac) - precision)
+        n = (lead << (4 * len(frac))) | int(frac, 16)
+        half = 1 << (shift - 1)
+        rest = n & ((1 << shift) - 1)
+        n >>= shift
+        if rest > half or (rest == half and n & 1):
+            n += 1
+        lead = n >> (4 * precision)
+        frac = ('%0*x' % (precision, n & ((1 << (4 * precision)) - 1))
+                if precision else '')
+        if lead > 0xf:
+            # Rounded up from 0xf.ff...: glibc starts again at 0x1.
+            lead = 1
+            exp += 4
+    else:
+        frac = frac.ljust(precision, '0')
+    point = '.' if frac or alt else ''
+    return '0x%x%s%sp%+d' % (lead, point, frac, exp)
+
+def _format_float(value, width, precision, conv, flags, sep, x87=False):
+    flags, width, precision = _star(flags, width, precision)
+    value = float(value)
+    upper = conv in 'FEGA'
+
+    if math.copysign(1.0, value) < 0:
+        prefix = '-'
+        value = -value
+    elif flags & FLAG_SHOWSIGN:
+        prefix = '+'
+    elif flags & FLAG_SPACE:
+        prefix = ' '
+    else:
+        prefix = ''
+
+    if math.isinf(value) or math.isnan(value):
+        # Never zero-padded.
+        body = 'inf' if math.isinf(value) else 'nan'
+        return _justify(prefix + (body.upper() if upper else body), width,
+                        flags)
+
+    if conv in 'aA':
+        body = _hexfloat(value, precision, flags & FLAG_ALT, x87)
+        if upper:
+            body = body.upper()
+        return _pad_number(prefix + body[:2], body[2:], flags, width,
+                           flags & FLAG_ZERO)
+
+    spec = '%' + ('#' if flags & FLAG_ALT else '')
+    if precision is not None:
+        spec += '.%d' % precision
+    body = (spec + conv) % value
+    if flags & FLAG_GROUP and sep and conv in 'fFgG':
+        end = len(body)
+        for i, c in enumerate(body):
+            if not c.isdigit():
+                end = i
+                break
+        body = _group(body[:end], sep) + body[end:]
+    return _pad_number(prefix, body, flags, width, flags & FLAG_ZERO)
+
+def _cstr(value, precision):
+    # What C would print for a char * argument.
+    if value is None:
+        # glibc prints "(null)", or nothing if it wouldn't fit.
+        return '(null)' if precision is None or precision >= 6 else ''
+    if isinstance(value, (bytes, bytearray)) and bytes is not str:
+        return value.decode('latin-1')
+    return value
+
+def _format_string(value, width, precision, flags):
+    flags, width, precision = _star(flags, width, precision)
+    s = _cstr(value, precision)
+    if precision is not None:
+        s = s[:precision]
+    return _justify(s, width, flags)
+
+def _format_char(value, width, precision, flags, wide):
+    flags, width, precision = _star(flags, width, precision)
+    if isinstance(value, _integer_types):
+        value = _unichr(value) if wide else chr(value & 0xff)
+    return _justify(_cstr(value, None), width, flags)
+
+def _format_pointer(value, width, precision, flags):
+    flags, width, precision = _star(flags, width, precision)
+    if value is None or value == 0:
+        s = '(nil)'
+    else:
+        if not isinstance(value, _integer_types):
+            value = id(value)
+        # glibc prints pointers as %#lx, but honours '+' and ' '.
+        if flags & FLAG_SHOWSIGN:
+            prefix = '+0x'
+        elif flags & FLAG_SPACE:
+            prefix = ' 0x'
+        else:
+            prefix = '0x'
+        return _pad_number(prefix, '%x' % value, flags, width,
+                           flags & FLAG_ZERO)
+    return _justify(s, width, flags)
+
+def _escape(s):
+    return s.replace('%', '%%')
+
+class _Compiler(object):
+    '''Builds the source of one formatting function.'''
+    __slots__ = ['fmt', 'd', 'a', 'abi', 'sep', 'pieces', 'values',
+                 'namespace']
+
+    def __init__(self, fmt, abi, sep):
+        self.fmt = fmt
+        self.d, self.a = printf_parse(fmt, abi=abi)
+        self.abi = abi
+        self.sep = sep
+        self.pieces = []     # the combined %-format string
+        self.values = []     # Python expressions for its operands
+        self.namespace = {'_cstr': _cstr}
+
+    def call(self, func, *args):
+        # Returns an expression calling func(*args) from the compiled function.
+        name = '_h%d' % len(self.namespace)
+        self.namespace[name] = func
+        return '%s(%s)' % (name, ', '.join(args))
+
+    def helper(self, func, *args):
+        self.pieces.append('%s')
+        self.values.append(self.call(func, *args))
+
+    def compile_directive(self, dp):
+        fmt = self.fmt
+        conv = dp.conversion
+        flags = dp.flags
+        arg = 'a%d' % dp.arg_index if dp.arg_index != ARG_NONE else None
+
+        if conv == '%':
+            self.pieces.append('%%')
+            return
+        if conv == 'n':
+            # There is nowhere to store the count; the argument is ignored.
+            return
+
+        if dp.width_arg_index != ARG_NONE:
+            width = 'a%d' % dp.width_arg_index
+        elif dp.width_start is not None:
+            width = fmt[dp.width_start:dp.width_end]
+        else:
+            width = None
+        if dp.precision_arg_index != ARG_NONE:
+            precision = 'a%d' % dp.precision_arg_index
+        elif dp.precision_start is not None:
+            precision = str(int(fmt[dp.precision_start + 1:dp.precision_end]
+                                or 0))
+        else:
+            precision = None
+        star_precision = dp.precision_arg_index != ARG_NONE
+        type = self.a.arg[dp.arg_index].type
+
+        if conv in 'diouxX':
+            bits, signed = self.abi.integer_bits(Arg_type, type)
+            if not signed:
+                # C ignores these for unsigned conversions; Python doesn't.
+                flags &= ~(FLAG_SHOWSIGN | FLAG_SPACE)
+            if precision is not None and not star_precision:
+                # A precision overrides the 0 flag.
+                flags &= ~FLAG_ZERO
+            if (flags & (FLAG_GROUP | FLAG_ALT) or star_precision or
+                    precision == '0'):
+                self.helper(_format_int, arg, width or 'None',
+                            precision or 'None', repr(conv), str(flags),
+                            str(bits), str(signed), repr(self.sep))
+                return
+            mask = (1 << bits) - 1
+            if signed:
+                half = 1 << (bits - 1)
+                value = '((%s + %d) & %d) - %d' % (arg, half, mask, half)
+            else:
+                value = '%s & %d' % (arg, mask)
+            self.native(flags, width, precision, 'd' if conv == 'u' else conv,
+                        value)
+        elif conv in 'fFeEgGaA':
+            if (conv in 'aA' or flags & (FLAG_GROUP | FLAG_ZERO) or
+                    star_precision):
+                # %La follows the ABI's long double.
+                x87 = (type == Arg_type.TYPE_LONGDOUBLE and
+                       self.abi.long_double_digits == 64)
+                self.helper(_format_float, arg, width or 'None',
+                            precision or 'None', repr(conv), str(flags),
+                            repr(self.sep), str(x87))
+                return
+            # Python prints a NaN without its sign, where glibc prints -nan;
+            # NaNs (the only values unequal to themselves) go to the helper.
+            spec, operands = self.spec(flags, width, precision)
+            self.pieces.append('%s')
+            self.values.append('(%r %% (%s%s,) if %s == %s else %s)' % (
+                spec + conv, ''.join(x + ', ' for x in operands), arg, arg,
+                arg, self.call(_format_float, arg, width or 'None',
+                               precision or 'None', repr(conv), str(flags),
+                               repr(self.sep), 'False')))
+        elif conv == 's':
+            if star_precision:
+                self.helper(_format_string, arg, width or 'None',
+                            precision or 'None', str(flags))
+                return
+            value = '(%s if %s.__class__ is str else _cstr(%s, %s))' % (
+                arg, arg, arg, precision)
+            self.native(flags & FLAG_LEFT, width, precision, 's', value)
+        elif conv == 'c':
+            self.helper(_format_char, arg, width or 'None', 'None',
+                        str(flags), str(type == Arg_type.TYPE_WIDE_CHAR))
+        elif conv == 'p':
+            self.helper(_format_pointer, arg, width or 'None', 'None',
+                        str(flags))
+        else:
+            raise ValueError('cannot compile conversion %%%s' % conv)
+
+    def spec(self, flags, width, precision):
+        # Returns the %-format spec, less its conversion, and the expressions
+        # for any operands it takes ahead of the value.
+        spec = '%'
+        operands = []
+        for flag, c in ((FLAG_LEFT, '-'), (FLAG_SHOWSIGN, '+'),
+                        (FLAG_SPACE, ' '), (FLAG_ALT, '#'), (FLAG_ZERO, '0')):
+            if flags & flag:
+                spec += c
+        if width is not None:
+            if width.startswith('a'):
+                spec += '*'
+                operands.append(width)
+            else:
+                spec += width
+        if precision is not None:
+            spec += '.' + precision
+        return spec, operands
+
+    def native(self, flags, width, precision, conv, value):
+        spec, operands = self.spec(flags, width, precision)
+        self.pieces.append(spec + conv)
+        self.values.extend(operands)
+        self.values.append(value)
+
+    def compile(self):
+        fmt = self.fmt
+        d = self.d
+        nargs = self.a.count
+        cp = 0
+        for dp in d.dir[:d.count]:
+            self.pieces.append(_escape(fmt[cp:dp.dir_start]))
+            self.compile_directive(dp)
+            cp = dp.dir_end
+        self.pieces.append(_escape(fmt[cp:]))
+
+        names = ['a%d' % i for i in range(nargs)]
+        lines = ['def printf_format(*args):']
+        if nargs:
+            lines.append('    if len(args) < %d:' % nargs)
+            lines.append("        raise TypeError('format requires %d "
+                         "arguments, got %%d' %% len(args))" % nargs)
+            lines.append('    %s, = args[:%d]' % (', '.join(names), nargs))
+        template = ''.join(self.pieces)
+        if self.values:
+            lines.append('    return %r %% (%s,)' %
+                         (template, ', '.join(self.values)))
+        else:
+            lines.append('    return %r' % (template % ()))
+
+        namespace = self.namespace
+        exec('\n'.join(lines), namespace)
+        func = namespace['printf_format']
+        func.fmt = fmt
+        func.nargs = nargs
+        return func
+
+def printf_compile(fmt, abi=None, thousands_sep=None, cache=True):
+    '''Returns a function that formats its arguments like C's sprintf(fmt,
+    ...) would, and returns the result.
+
+    Integer arguments are truncated to the width of their C type in the ABI
+    profile abi (default: the host's).  Strings may be str, bytes (decoded as
+    Latin-1) or None ("(null)"); %c takes a character or a code point; %p
+    takes an int or None ("(nil)").  %n consumes its argument but can't store
+    anything.  The ' flag groups digits with thousands_sep, which defaults to
+    the current LC_NUMERIC locale's separator (none in the C locale).
+
+    Compiled functions are kept in the LRU cache compiled unless cache is
+    false.'''
+    abi = get_profile(abi)
+    if thousands_sep is None:
+        thousands_sep = locale.localeconv()['thousands_sep']
+
+    key = (fmt, abi.sizes, thousands_sep)
+    if cache:
+        func = compiled.get(key)
+        if func is not None:
+            return func
+    func = _Compiler(fmt, abi, thousands_sep).compile()
+    if cache:
+        compiled.put(key, func)
+    return func
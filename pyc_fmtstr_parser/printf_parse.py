@@ -18,35 +18,42 @@
 # You should have received a copy of the GNU Lesser General Public License along
 # with this program; if not, see <http://www.gnu.org/licenses/>.
 
-import ctypes
-from flufl.enum import Enum
-sizeof = ctypes.sizeof
-
-Arg_type = Enum('Arg_type', [str(x.strip()) for x in '''
-TYPE_NONE
-TYPE_SCHAR
-TYPE_UCHAR
-TYPE_SHORT
-TYPE_USHORT
-TYPE_INT
-TYPE_UINT
-TYPE_LONGINT
-TYPE_ULONGINT
-TYPE_LONGLONGINT
-TYPE_ULONGLONGINT
-TYPE_DOUBLE
-TYPE_LONGDOUBLE
-TYPE_CHAR
-TYPE_WIDE_CHAR
-TYPE_STRING
-TYPE_WIDE_STRING
-TYPE_POINTER
-TYPE_COUNT_SCHAR_POINTER
-TYPE_COUNT_SHORT_POINTER
-TYPE_COUNT_INT_POINTER
-TYPE_COUNT_LONGINT_POINTER
-TYPE_COUNT_LONGLONGINT_POINTER
-'''.splitlines() if x != ''])
+from . import engine
+
+class Arg_type(object):
+    '''Argument types.  These are plain ints so that neither importing the
+    parser nor comparing types costs anything; use Arg_type.name() to get the
+    name of one.'''
+    TYPE_NONE = 1
+    TYPE_SCHAR = 2
+    TYPE_UCHAR = 3
+    TYPE_SHORT = 4
+    TYPE_USHORT = 5
+    TYPE_INT = 6
+    TYPE_UINT = 7
+    TYPE_LONGINT = 8
+    TYPE_ULONGINT = 9
+    TYPE_LONGLONGINT = 10
+    TYPE_ULONGLONGINT = 11
+    TYPE_DOUBLE = 12
+    TYPE_LONGDOUBLE = 13
+    TYPE_CHAR = 14
+    TYPE_WIDE_CHAR = 15
+    TYPE_STRING = 16
+    TYPE_WIDE_STRING = 17
+    TYPE_POINTER = 18
+    TYPE_COUNT_SCHAR_POINTER = 19
+    TYPE_COUNT_SHORT_POINTER = 20
+    TYPE_COUNT_INT_POINTER = 21
+    TYPE_COUNT_LONGINT_POINTER = 22
+    TYPE_COUNT_LONGLONGINT_POINTER = 23
+
+    @classmethod
+    def name(cls, value):
+        for name, v in vars(cls).items():
+            if name.startswith('TYPE_') and v == value:
+                return name
+        raise ValueError('not an Arg_type: %r' % (value,))
 
 FLAG_GROUP    = 1   # ' flag
 FLAG_LEFT     = 2   # - flag
@@ -58,6 +65,9 @@ FLAG_ZERO     = 32
 # arg_index value indicating that no argument is consumed.
 ARG_NONE = ~0
 
+# The stats.ParseStats recording each parse, if stats.enable() was called.
+_stats = None
+
 class Argument(object):
     __slots__ = ['type', 'data']
 
@@ -72,9 +82,11 @@ class Directive(object):
     '''A parsed directive.'''
     __slots__ = ['dir_start', 'dir_end', 'flags', 'width_start', 'width_end',
                  'width_arg_index', 'precision_start', 'precision_end',
-                 'precision_arg_index', 'conversion', 'arg_index']
+                 'precision_arg_index', 'conversion', 'arg_index', 'length']
 
     # conversion: d i o u x X f F e E g G a A c s p n U % but not C S
+    # length: the raw length modifier, e.g. '' or 'll'; C and S are recorded
+    # as lc and ls
 
     def __init__(self):
         self.flags = 0
@@ -85,6 +97,7 @@ class Directive(object):
         self.precision_end = None
         self.precision_arg_index = ARG_NONE
         self.arg_index = ARG_NONE
+        self.length = ''
 
 class Directives(object):
     '''A parsed format string.'''
@@ -94,20 +107,12 @@ class Directives(object):
         self.count = 0
         self.dir = []
 
+(FrozenDirective, FrozenDirectives, FrozenArgument, FrozenArguments,
+ freeze) = engine.frozen_results(__name__, Directive, Directives, Argument,
+                                 Arguments)
+
 def REGISTER_ARG(a, index, type):
-    n = index
-
-    while a.count <= n:
-        try:
-            a.arg[a.count]
-        except IndexError:
-            a.arg.append(Argument())
-        a.arg[a.count].type = Arg_type.TYPE_NONE
-        a.count += 1
-    if a.arg[n].type == Arg_type.TYPE_NONE:
-        a.arg[n].type = type
-    elif a.arg[n].type != type:
-        raise ValueError('ambiguous type for positional argument')
+    engine.register_arg(DIALECT, a, index, type)
 
 def conv_signed(c, flags):
     # If 'long long' exists and is larger than 'long':
@@ -216,200 +221,53 @@ _conv_char = {
     '%': conv_none
 }
 
-def printf_parse(fmt):
+DIALECT = engine.Dialect(
+    'printf', Directive, Directives, Argument, Arguments,
+    flags={'\'': FLAG_GROUP, '-': FLAG_LEFT, '+': FLAG_SHOWSIGN,
+           ' ': FLAG_SPACE, '#': FLAG_ALT, '0': FLAG_ZERO},
+    repeat_flags=True, suppress=0, star=True, precision=True,
+    conversions=engine.conversion_table(_conv_char), Arg_type=Arg_type)
+
+def printf_parse(fmt, start=0, abi=None, diagnostics=None):
     '''Parses the format string.  Fills in the number N of directives, and fills
     in directives[0], ..., directives[N-1], and sets directives[N].dir_start to
     the end of the format string.  Also fills in the arg_type fields of the
-    arguments and the needed count of arguments.'''
-    cp = 0                   # index into format string
-    arg_posn = 0             # number of regular arguments consumed
-    max_width_length = 0
-    max_precision_length = 0
-
-    d = Directives()
-    a = Arguments()
-
-    while True:
-        try:
-            c = fmt[cp]
-        except IndexError:
-            break
-
-        cp += 1
-        if c == '%':
-            arg_index = ARG_NONE
-            d.dir.append(Directive())
-            dp = d.dir[d.count]
-            dp.dir_start = cp - 1
-
-            # Test for positional argument.
-            if fmt[cp].isdigit():
-                np = cp
-                while fmt[np].isdigit():
-                    np += 1
-                if fmt[np] == '$':
-                    n = 0
-
-                    np = cp
-                    while fmt[np].isdigit():
-                        n = n * 10 + (ord(fmt[np]) - ord('0'))
-                        np += 1
-                    if n == 0:
-                        raise ValueError('positional argument 0')
-                    arg_index = n - 1
-                    cp = np + 1
-
-            # Read the flags.
-            while True:
-                if fmt[cp] == '\'':
-                    dp.flags |= FLAG_GROUP
-                    cp += 1
-                elif fmt[cp] == '-':
-                    dp.flags |= FLAG_LEFT
-                    cp += 1
-                elif fmt[cp] == '+':
-                    dp.flags |= FLAG_SHOWSIGN
-                    cp += 1
-                elif fmt[cp] == ' ':
-                    dp.flags |= FLAG_SPACE
-                    cp += 1
-                elif fmt[cp] == '#':
-                    dp.flags |= FLAG_ALT
-                    cp += 1
-                elif fmt[cp] == '0':
-                    dp.flags |= FLAG_ZERO
-                    cp += 1
-                else:
-                    break
-
-            # Parse the field width.
-            if fmt[cp] == '*':
-                dp.width_start = cp
-                cp += 1
-                dp.width_end = cp
-                if max_width_length < 1:
-                    max_width_length = 1
-
-                # Test for positional argument.
-                if fmt[cp].isdigit():
-                    np = cp
-                    while fmt[np].isdigit():
-                        np += 1
-                    if fmt[np] == '$':
-                        n = 0
-
-                        np = cp
-                        while fmt[np].isdigit():
-                            n = n * 10 + (ord(fmt[np]) - ord('0'))
-                            np += 1
-                        if n == 0:
-                            raise ValueError('positional argument 0')
-                        dp.width_arg_index = n - 1
-                        cp = np + 1
-                if dp.width_arg_index == ARG_NONE:
-                    dp.width_arg_index = arg_posn
-                    arg_posn += 1
-                REGISTER_ARG(a, dp.width_arg_index, Arg_type.TYPE_INT)
-            elif fmt[cp].isdigit():
-                dp.width_start = cp
-                while fmt[cp].isdigit():
-                    cp += 1
-                dp.width_end = cp
-                width_length = dp.width_end - dp.width_start
-                if max_width_length < width_length:
-                    max_width_length = width_length
-
-            # Parse the precision.
-            if fmt[cp] == '.':
-                cp += 1
-                if fmt[cp] == '*':
-                    dp.precision_start = cp - 1
-                    cp += 1
-                    dp.precision_end = cp
-                    if max_precision_length < 2:
-                        max_precision_length = 2
-
-                    # Test for positional argument.
-                    if fmt[cp].isdigit():
-                        np = cp
-
-                        while fmt[np].isdigit():
-                            np += 1
-                        if fmt[np] == '$':
-                            n = 0
-
-                            np = cp
-                            while fmt[np].isdigit():
-                                n = n * 10 + (ord(fmt[np]) - ord('0'))
-                                np += 1
-                            if n == 0:
-                                raise ValueError('positional argument 0')
-                            dp.precision_arg_index = n - 1
-                            cp = np + 1
-                    if dp.precision_arg_index == ARG_NONE:
-                        dp.precision_arg_index = arg_posn
-                        arg_posn += 1
-                    REGISTER_ARG(a, dp.precision_arg_index, Arg_type.TYPE_INT)
-                else:
-                    dp.precision_start = cp - 1
-                    while fmt[cp].isdigit():
-                        cp += 1
-                    dp.precision_end = cp
-                    precision_length = dp.precision_end - dp.precision_start
-                    if max_precision_length < precision_length:
-                        max_precision_length = precision_length
-
-            # Parse argument type/size specifiers.
-            flags = 0
-
-            while True:
-                if fmt[cp] == 'h':
-                    flags |= (1 << (flags & 1))
-                    cp += 1
-                elif fmt[cp] == 'L':
-                    flags |= 4
-                    cp += 1
-                elif fmt[cp] == 'l':
-                    flags += 8
-                    cp += 1
-                elif fmt[cp] == 'j':
-                    raise ValueError("don't know how to handle intmax_t")
-                elif fmt[cp] == 'z':
-                    if sizeof(ctypes.c_size_t) > sizeof(ctypes.c_long):
-                        # size_t = long long
-                        flags += 16
-                    elif sizeof(ctypes.c_size_t) > sizeof(ctypes.c_int):
-                        # size_t = long
-                        flags += 8
-                    cp += 1
-                elif fmt[cp] == 't':
-                    raise ValueError("don't know how to handle ptrdiff_t")
-                else:
-                    break
-
-            # Read the conversion character.
-            c = fmt[cp]
-            cp += 1
-            try:
-                c, type = _conv_char[c](c, flags)
-            except KeyError:
-                raise ValueError('bad conversion character: %%%s' % c)
-
-            if type != Arg_type.TYPE_NONE:
-                dp.arg_index = arg_index
-                if dp.arg_index == ARG_NONE:
-                    dp.arg_index = arg_posn
-                    arg_posn += 1
-                REGISTER_ARG(a, dp.arg_index, type)
-            dp.conversion = c
-            dp.dir_end = cp
-
-            d.count += 1
-
-    d.dir.append(Directive())
-    d.dir[d.count].dir_start = cp
-
-    d.max_width_length = max_width_length
-    d.max_precision_length = max_precision_length
-
-    return d, a
+    arguments and the needed count of arguments.
+
+    Parsing begins at offset start.  fmt may also be any buffer-protocol object
+    (bytes, bytearray, memoryview, mmap, ...), in which case the format string
+    is the NUL-terminated byte string at offset start, parsed in place; all
+    offsets in the result are relative to the start of the buffer.  For a
+    wide string (as wprintf and wscanf take), pass a buffers.WideBuffer:
+    start and the offsets in the result then count code units.
+
+    abi is the target ABI profile (an AbiProfile or the name of a registered
+    one; see the abi module) used to resolve the 'z', 'j' and 't' length
+    modifiers; it defaults to the host's.
+
+    A malformed format string raises ValueError, unless diagnostics is a
+    list: then a Diagnostic is appended to it and the directives before the
+    bad one are returned (see the diagnostics module).'''
+    if _stats is not None:
+        return _stats.measure('printf', _printf_parse, fmt, start, abi,
+                              diagnostics)
+    return engine.parse(DIALECT, fmt, start, abi, diagnostics)
+
+def _printf_parse(fmt, start, abi, diagnostics):
+    return engine.parse(DIALECT, fmt, start, abi, diagnostics)
+
+def iter_printf_directives(fmt, start=0, abi=None, diagnostics=None):
+    '''Yields the directives of the format string one at a time, as
+    iterparse.DirectiveTuples, without building the Directives and
+    Arguments; see the iterparse module.  The arguments are as for
+    printf_parse(), and an error is raised (or reported) when the iteration
+    reaches the bad directive.'''
+    from .iterparse import iter_directives
+    return iter_directives(DIALECT, fmt, start, abi, diagnostics)
+
+def resolve_arguments(d, abi=None):
+    '''Returns the Arguments that parsing the format string for the ABI
+    profile abi would have produced, working from the length modifiers and
+    conversions recorded in the Directives d instead of re-scanning the
+    string.'''
+    return engine.resolve_arguments(DIALECT, d, abi)
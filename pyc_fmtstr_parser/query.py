@@ -0,0 +1,149 @@
+# Copyright (C) 2014, Mark Laws.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program; if not, see <http://www.gnu.org/licenses/>.
+
+'''Questions about a format string, answered without a full parse.
+
+    if has_percent_n(fmt):
+        ...
+    n = argument_count(fmt)
+
+Each query walks the directives as iterparse does, building no Directive or
+Argument, and stops as soon as its answer is known; when a string can't
+hold the answer at all (has_percent_n() of a string with no 'n'), it isn't
+walked.
+
+Answers are those of the tolerant full parse, printf_parse(fmt,
+diagnostics=[]) (or scanf_parse()): they are about the directives before
+the first error, if there is one, since those are the ones a C library would
+act on before reaching it.  Queries don't raise for a malformed string; if
+diagnostics is a list and the walk reaches the error, its Diagnostic is
+appended.  So, for any string,
+
+    argument_count(fmt) == a.count
+    signature(fmt) == catalog.signature(a)
+    has_conversion(fmt, 'n') == any(dp.conversion == 'n'
+                                    for dp in d.dir[:d.count])
+    takes_type(fmt, types) == any(x.type in types for x in a.arg[:a.count])
+
+where d, a = printf_parse(fmt, diagnostics=[]).'''
+
+from .batch import parser_module
+from .engine import ARG_NONE, prepare, scan_directives, text_type
+
+# Per dialect, the conversion characters that can record each conversion,
+# and those that can take an argument of each type.
+_conv_chars = {}
+_type_chars = {}
+
+def _chars(dialect, table, index, values):
+    # The characters in fmt that must be present for a directive to have
+    # one of the values; index 0 of a conversion table entry for
+    # conversions, 1 for types.
+    try:
+        by_value = table[dialect]
+    except KeyError:
+        by_value = table[dialect] = {}
+        mod = parser_module(dialect)
+        for c, entry in mod.DIALECT.conversions.items():
+            for value in ((entry[0],) if index == 0 else set(entry[1])):
+                by_value.setdefault(value, set()).add(c)
+        if index == 1 and mod.DIALECT.star:
+            # '*' takes an int.
+            by_value.setdefault(mod.Arg_type.TYPE_INT, set()).add('*')
+    chars = set()
+    for value in values:
+        chars.update(by_value.get(value, ()))
+    return chars
+
+def _present(fmt, start, chars):
+    # False if fmt has no '%' or none of chars after start, so that nothing
+    # needs to be parsed.  Buffers are always parsed.
+    if not isinstance(fmt, text_type):
+        return True
+    if fmt.find('%', start) < 0:
+        return False
+    for c in chars:
+        if fmt.find(c, start) >= 0:
+            return True
+    return False
+
+def _walk(dialect, fmt, start, abi, diagnostics, types):
+    # The directives of fmt, as plain tuples, up to the first error, keeping
+    # the type of each argument so far, by number, in the list types.
+    fmt, end = prepare(fmt, start)
+    return scan_directives(parser_module(dialect).DIALECT, fmt, end, start,
+                           abi, [] if diagnostics is None else diagnostics,
+                           types, [0, 0], tuple)
+
+def has_conversion(fmt, conversions, dialect='printf', start=0, abi=None,
+                   diagnostics=None):
+    '''Returns whether any directive of fmt records one of conversions (a
+    string of conversion characters, e.g. 'sn'), stopping at the first
+    that does.'''
+    if not _present(fmt, start, _chars(dialect, _conv_chars, 0,
+                                       conversions)):
+        return False
+    for dt in _walk(dialect, fmt, start, abi, diagnostics, []):
+        if dt[9] in conversions:
+            return True
+    return False
+
+def has_percent_n(fmt, dialect='printf', start=0, abi=None,
+                  diagnostics=None):
+    '''Returns whether fmt has a %n directive.'''
+    return has_conversion(fmt, 'n', dialect, start, abi, diagnostics)
+
+def takes_type(fmt, types, dialect='printf', start=0, abi=None,
+               diagnostics=None):
+    '''Returns whether any argument of fmt has one of types (a collection
+    of Arg_type values), counting '*' widths and precisions, stopping at the
+    first directive that takes one.'''
+    types = frozenset(types)
+    if not _present(fmt, start, _chars(dialect, _type_chars, 1, types)):
+        return False
+    Arg_type = parser_module(dialect).Arg_type
+    if Arg_type.TYPE_NONE in types:
+        # Only the arguments that no numbered directive uses have no type,
+        # which isn't known until the end.
+        return not types.isdisjoint(_types(fmt, dialect, start, abi,
+                                           diagnostics))
+    star = Arg_type.TYPE_INT in types
+    for dt in _walk(dialect, fmt, start, abi, diagnostics, []):
+        if dt[12] in types or (star and (dt[5] != ARG_NONE or
+                                            dt[8] != ARG_NONE)):
+            return True
+    return False
+
+def _types(fmt, dialect, start, abi, diagnostics):
+    # The types list of the whole walk.
+    types = []
+    for _ in _walk(dialect, fmt, start, abi, diagnostics, types):
+        pass
+    return types
+
+def argument_count(fmt, dialect='printf', start=0, abi=None,
+                   diagnostics=None):
+    '''Returns the number of arguments fmt takes: the highest argument
+    number any directive uses.'''
+    if not _present(fmt, start, '%'):
+        return 0
+    return len(_types(fmt, dialect, start, abi, diagnostics))
+
+def signature(fmt, dialect='printf', start=0, abi=None, diagnostics=None):
+    '''Returns the types of the arguments fmt takes as a tuple, in argument
+    order, as catalog.signature() does for a parse result.'''
+    if not _present(fmt, start, '%'):
+        return ()
+    return tuple(_types(fmt, dialect, start, abi, diagnostics))
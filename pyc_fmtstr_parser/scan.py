@@ -0,0 +1,325 @@
+# Copyright (C) 2014, Mark Laws.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program; if not, see <http://www.gnu.org/licenses/>.
+
+'''Finds and parses the format strings in C source files and binaries.
+
+In C sources, the format strings are the string literals passed as the
+format argument of the printf and scanf families of functions (see CALLS).
+In ELF and PE binaries (and in any file, if asked), they are the
+NUL-terminated runs of printable characters in read-only data sections
+that contain something like a directive (see the prescan module), which
+are parsed in place.
+
+jobs() splits the files under a set of paths into jobs, splitting large
+binaries into chunks so that no job needs more than a chunk of memory, and
+scan_job() runs one and returns its results as JSON lines.  The command-line
+scanner (python -m pyc_fmtstr_parser) hands the jobs to a process pool.'''
+
+import json
+import mmap
+import os
+import re
+import struct
+
+from .batch import parser_module
+from .catalog import unescape
+from .prescan import candidates
+
+JOB_SOURCE = 'source'
+JOB_BINARY = 'binary'
+
+SOURCE_EXTENSIONS = frozenset(['.c', '.h', '.cc', '.cpp', '.cxx', '.hh',
+                               '.hpp', '.hxx', '.m', '.i'])
+
+# Functions taking a format string: name -> (dialect, index of the format
+# among the arguments).
+CALLS = {
+    'printf': ('printf', 0),
+    'fprintf': ('printf', 1),
+    'dprintf': ('printf', 1),
+    'sprintf': ('printf', 1),
+    'snprintf': ('printf', 2),
+    'asprintf': ('printf', 1),
+    'vprintf': ('printf', 0),
+    'vfprintf': ('printf', 1),
+    'vdprintf': ('printf', 1),
+    'vsprintf': ('printf', 1),
+    'vsnprintf': ('printf', 2),
+    'vasprintf': ('printf', 1),
+    'syslog': ('printf', 1),
+    'vsyslog': ('printf', 1),
+    'err': ('printf', 1),
+    'errx': ('printf', 1),
+    'warn': ('printf', 0),
+    'warnx': ('printf', 0),
+    'verr': ('printf', 1),
+    'verrx': ('printf', 1),
+    'vwarn': ('printf', 0),
+    'vwarnx': ('printf', 0),
+    'error': ('printf', 2),
+    'scanf': ('scanf', 0),
+    'fscanf': ('scanf', 1),
+    'sscanf': ('scanf', 1),
+    'vscanf': ('scanf', 0),
+    'vfscanf': ('scanf', 1),
+    'vsscanf': ('scanf', 1),
+}
+
+_CALL = re.compile(r'\b(%s)\s*\(' % '|'.join(sorted(CALLS, key=len,
+                                                     reverse=True)))
+# The tokens of an argument list that matter for finding its arguments.
+_TOKEN = re.compile(r'"(?:[^"\\\n]|\\.)*"|\'(?:[^\'\\\n]|\\.)*\'|'
+                    r'/\*.*?\*/|//[^\n]*|[(),]|[^"\'(),/]+|/', re.S)
+_SPACE = re.compile(r'\s*$')
+
+def _literal(tokens):
+    # The value of an argument made only of adjacent string literals (and
+    # comments), or None.
+    parts = []
+    for token in tokens:
+        if token.startswith('"'):
+            parts.append(token[1:-1])
+        elif not (token.startswith('/*') or token.startswith('//') or
+                  _SPACE.match(token)):
+            return None
+    if not parts:
+        return None
+    return unescape(''.join(parts))
+
+def _argument(text, pos, index):
+    # The tokens of argument index of the call whose '(' ends at pos, or
+    # None if the call has fewer arguments.
+    depth = 0
+    n = 0
+    tokens = []
+    for m in _TOKEN.finditer(text, pos):
+        token = m.group()
+        if token == '(':
+            depth += 1
+        elif token == ')':
+            if not depth:
+                break
+            depth -= 1
+        elif token == ',' and not depth:
+            if n == index:
+                return tokens
+            n += 1
+            continue
+        if n == index:
+            tokens.append(token)
+    return tokens if n == index else None
+
+def source_strings(text):
+    '''Yields (offset, line, function, dialect, format) for each format
+    string literal passed to one of CALLS in the C source text.'''
+    line = 1
+    last = 0
+    for m in _CALL.finditer(text):
+        name = m.group(1)
+        dialect, index = CALLS[name]
+        tokens = _argument(text, m.end(), index)
+        if tokens is None:
+            continue
+        fmt = _literal(tokens)
+        if fmt is None:
+            continue
+        line += text.count('\n', last, m.start())
+        last = m.start()
+        yield m.start(), line, name, dialect, fmt
+
+# Binaries.
+
+# Read-only ELF sections that never hold strings.
+_ELF_SKIP = frozenset(['.eh_frame', '.eh_frame_hdr', '.gcc_except_table',
+                       '.interp', '.ARM.exidx', '.ARM.extab'])
+
+def _elf_sections(m):
+    # (name, start, end) of the read-only data sections of an ELF file.
+    bits, order = m[4:6]
+    order = '<' if order in (1, b'\x01') else '>'
+    if bits in (2, b'\x02'):
+        header = struct.Struct(order + 'IIQQQQIIQQ')
+        shoff, = struct.unpack_from(order + 'Q', m, 0x28)
+        shentsize, shnum, shstrndx = struct.unpack_from(order + 'HHH', m,
+                                                        0x3a)
+    else:
+        header = struct.Struct(order + 'IIIIIIIIII')
+        shoff, = struct.unpack_from(order + 'I', m, 0x20)
+        shentsize, shnum, shstrndx = struct.unpack_from(order + 'HHH', m,
+                                                        0x2e)
+    if not shoff or shoff + shnum * shentsize > len(m):
+        return None
+    sections = [header.unpack_from(m, shoff + i * shentsize)
+                for i in range(shnum)]
+    names = sections[shstrndx][4] if shstrndx < shnum else None
+    result = []
+    for section in sections:
+        name, type, flags, addr, offset, size = section[:6]
+        # SHT_PROGBITS, SHF_ALLOC but not SHF_WRITE or SHF_EXECINSTR
+        if type != 1 or flags & 7 != 2 or offset + size > len(m):
+            continue
+        if names is not None:
+            end = m.find(b'\0', names + name)
+            name = m[names + name:end].decode('latin-1')
+            if name in _ELF_SKIP:
+                continue
+        else:
+            name = ''
+        result.append((name, offset, offset + size))
+    return result
+
+def _pe_sections(m):
+    # (name, start, end) of the read-only data sections of a PE file.
+    pe, = struct.unpack_from('<I', m, 0x3c)
+    if m[pe:pe + 4] != b'PE\0\0':
+        return None
+    nsections, = struct.unpack_from('<H', m, pe + 6)
+    optional, = struct.unpack_from('<H', m, pe + 20)
+    table = pe + 24 + optional
+    result = []
+    for i in range(nsections):
+        name, _, _, size, offset, _, _, _, _, flags = struct.unpack_from(
+            '<8sIIIIIIHHI', m, table + 40 * i)
+        # IMAGE_SCN_CNT_INITIALIZED_DATA but not MEM_EXECUTE or MEM_WRITE
+        if flags & 0xa0000040 != 0x40 or offset + size > len(m):
+            continue
+        result.append((name.rstrip(b'\0').decode('latin-1'), offset,
+                       offset + size))
+    return result
+
+def binary_sections(path, raw=False):
+    '''Returns the (name, start, end) of the read-only data sections of the
+    ELF or PE file at path; for any other file, the whole file as one
+    section named '' if raw is true, and otherwise nothing.'''
+    size = os.path.getsize(path)
+    if not size:
+        return []
+    with open(path, 'rb') as f:
+        m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        sections = None
+        try:
+            if m[:4] == b'\x7fELF':
+                sections = _elf_sections(m)
+            elif m[:2] == b'MZ' and size >= 0x40:
+                sections = _pe_sections(m)
+        except struct.error:
+            pass
+        if sections is None:
+            sections = [('', 0, size)] if raw else []
+        return sections
+    finally:
+        m.close()
+
+def binary_strings(m, start, end, lo, hi, max_length=4096,
+                   dialect='printf'):
+    '''Returns the offsets of the candidate format strings in the buffer m
+    that start in [start, end) and lie in the section [lo, hi), as
+    prescan.candidates() finds them.'''
+    return candidates(m, start, end, lo, hi, dialect, max_length)
+
+# Jobs.
+
+def jobs(paths, chunk_size=1 << 22, raw=False):
+    '''Yields the jobs for scanning the files at or under each of paths, in
+    order:
+
+        (JOB_SOURCE, path, 0, size, 0, size, '')
+        (JOB_BINARY, path, start, end, section start, section end, name)
+
+    A binary job covers the strings that start in [start, end).'''
+    for top in paths:
+        if os.path.isdir(top):
+            for dirpath, dirnames, filenames in os.walk(top):
+                dirnames.sort()
+                for name in sorted(filenames):
+                    for job in _file_jobs(os.path.join(dirpath, name),
+                                          chunk_size, raw):
+                        yield job
+        else:
+            for job in _file_jobs(top, chunk_size, raw):
+                yield job
+
+def _file_jobs(path, chunk_size, raw):
+    if not os.path.isfile(path):
+        return
+    if os.path.splitext(path)[1].lower() in SOURCE_EXTENSIONS:
+        size = os.path.getsize(path)
+        yield JOB_SOURCE, path, 0, size, 0, size, ''
+        return
+    try:
+        sections = binary_sections(path, raw)
+    except (IOError, OSError, ValueError):
+        return
+    for name, lo, hi in sections:
+        for start in range(lo, hi, chunk_size):
+            yield (JOB_BINARY, path, start, min(start + chunk_size, hi),
+                   lo, hi, name)
+
+def _record(mod, d, a, diagnostics, start=0):
+    if diagnostics:
+        return {'error': diagnostics[0].message,
+                'error_offset': diagnostics[0].offset - start}
+    name = mod.Arg_type.name
+    return {'directives': d.count,
+            'arguments': [name(x.type)[5:].lower()
+                          for x in a.arg[:a.count]]}
+
+def scan_job(job, dialect='printf', abi=None, max_length=4096):
+    '''Runs one of the jobs() and returns (lines, bytes scanned, strings
+    found), where lines holds a JSON object for each string found:
+
+        {"file": ..., "offset": ..., "dialect": ..., "format": ...,
+         "directives": ..., "arguments": [...]}
+
+    with "line" and "call" for sources and "section" for binaries, and
+    "error" and "error_offset" in place of "directives" and "arguments" for
+    strings that don't parse (error_offset counts from the start of the
+    string).  Strings in binaries are parsed as dialect, and their "format"
+    is decoded as Latin-1.'''
+    kind, path, start, end, lo, hi, section = job
+    lines = []
+    diagnostics = []
+    if kind == JOB_SOURCE:
+        with open(path, 'rb') as f:
+            text = f.read().decode('latin-1')
+        for offset, line, call, dialect, fmt in source_strings(text):
+            mod = parser_module(dialect)
+            d, a = getattr(mod, dialect + '_parse')(
+                fmt, abi=abi, diagnostics=diagnostics)
+            record = _record(mod, d, a, diagnostics)
+            record.update(file=path, offset=offset, line=line, call=call,
+                          dialect=dialect, format=fmt)
+            lines.append(json.dumps(record, sort_keys=True))
+            del diagnostics[:]
+        return lines, end - start, len(lines)
+
+    mod = parser_module(dialect)
+    parse = getattr(mod, dialect + '_parse')
+    with open(path, 'rb') as f:
+        m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        for offset in binary_strings(m, start, end, lo, hi, max_length,
+                                     dialect):
+            d, a = parse(m, offset, abi=abi, diagnostics=diagnostics)
+            record = _record(mod, d, a, diagnostics, offset)
+            fmt = m[offset:m.find(b'\0', offset)].decode('latin-1')
+            record.update(file=path, offset=offset, section=section,
+                          dialect=dialect, format=fmt)
+            lines.append(json.dumps(record, sort_keys=True))
+            del diagnostics[:]
+    finally:
+        m.close()
+    return lines, end - start, len(lines)
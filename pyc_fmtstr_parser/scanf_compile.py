@@ -0,0 +1,421 @@
+# Copyright (C) 2014, Mark Laws.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program; if not, see <http://www.gnu.org/licenses/>.
+
+'''Compiles scanf format strings into Python matching functions.
+
+scanf_compile() parses the format once and translates each directive into a
+regular expression that matches what C's scanf would read for it.  Runs of
+directives are joined into one expression, so a typical format is matched
+with one or two regex calls.  Each field is an atomic group: like scanf, a
+field never gives back characters it has read so that a later one can match.
+Numeric fields with a width are matched on their own, with endpos limiting
+them to that many characters.'''
+
+import re
+
+from .abi import get_profile
+from .lru import LRUCache
+from .scanf_parse import ARG_NONE, Arg_type, scanf_parse
+
+try:
+    _unichr = unichr
+except NameError:
+    _unichr = chr
+
+# Compiled functions, keyed by (fmt, ABI profile sizes).
+compiled = LRUCache(maxsize=1024)
+
+# What isspace() accepts in the C locale.
+_SPACES = '[ \\t\\n\\v\\f\\r]*'
+
+# Python 3.11 has atomic groups; elsewhere (?=(...))\N does the same job.
+try:
+    re.compile('(?>a)')
+    _HAVE_ATOMIC = True
+except re.error:
+    _HAVE_ATOMIC = False
+
+_HEX = '[0-9a-fA-F]'
+
+# What glibc reads for each integer conversion.  Like glibc, a "0x" with no
+# hexadecimal digits after it is read, as 0.
+_INTEGER = {
+    'd': '[-+]?[0-9]+',
+    'u': '[-+]?[0-9]+',
+    'o': '[-+]?[0-7]+',
+    'x': '[-+]?(?:0[xX]?%s*|%s+)' % (_HEX, _HEX),
+    'i': '[-+]?(?:0[xX]%s*|0[0-7]*|[1-9][0-9]*)' % _HEX,
+}
+_INTEGER['X'] = _INTEGER['p'] = _INTEGER['x']
+
+_BASE = {'d': 10, 'i': 0, 'u': 10, 'o': 8, 'x': 16, 'X': 16, 'p': 16}
+
+def _nocase(word):
+    return ''.join('[%s%s]' % (c.lower(), c.upper()) for c in word)
+
+# strtod's syntax, as glibc reads it: an exponent marker is read even if no
+# digits follow it, "inf" followed by an "i" must go on to spell "infinity",
+# and "0x" must be followed by digits or a point.  The hexadecimal form comes
+# first so that the "0" of "0x" isn't taken as a complete decimal number.
+_FLOAT = ('[-+]?(?:0[xX](?:%s+(?:\\.%s*)?|\\.%s+)(?:[pP][-+]?[0-9]*)?'
+          '|0[xX]\\.'
+          '|(?!0[xX]%%s)(?:[0-9]+(?:\\.[0-9]*)?|\\.[0-9]+)'
+          '(?:[eE][-+]?[0-9]*)?'
+          '|%s(?:%s|(?![iI]))|%s)' %
+          (_HEX, _HEX, _HEX, _nocase('inf'), _nocase('inity'),
+           _nocase('nan')))
+# A field width that ends right after "0x" makes glibc read just the "0".
+_FLOAT_WIDTH = _FLOAT % '.'
+_FLOAT = _FLOAT % ''
+
+def _int(s, base):
+    body = s.lstrip('+-')
+    if base == 0:
+        # %i: the base follows from the prefix, as with strtol(s, NULL, 0).
+        if body[:2] in ('0x', '0X'):
+            base = 16
+        elif body[:1] == '0':
+            base = 8
+        else:
+            base = 10
+    if body[-1:] in ('x', 'X'):
+        return 0
+    return int(s, base)
+
+def _strtol(s, base, bits):
+    # glibc converts with strtol (or strtoll), which clamps values that are
+    # out of range, and then truncates the result to the argument's type.
+    value = _int(s, base)
+    limit = 1 << (bits - 1)
+    return min(max(value, -limit), limit - 1)
+
+def _strtoul(s, base, bits):
+    value = _int(s, base)
+    if abs(value) >> bits:
+        return (1 << bits) - 1
+    return value & ((1 << bits) - 1)
+
+def _float(s):
+    try:
+        return float(s)
+    except ValueError:
+        pass
+    # Python's float() accepts neither hexadecimal nor an exponent marker
+    # without digits.
+    body = s.lstrip('+-')
+    if body[:2] in ('0x', '0X'):
+        try:
+            value = float.fromhex(body.rstrip('pP+-'))
+        except OverflowError:
+            value = float('inf')
+        except ValueError:
+            # "0x."
+            value = 0.0
+    else:
+        value = float(body.rstrip('eE+-'))
+    return -value if s.startswith('-') else value
+
+def _scanset(scanset):
+    '''Returns a regex character class matching the characters that scanset
+    (a Scanset) accepts.'''
+    items = []
+    for first, last in scanset.intervals():
+        if first == last:
+            items.append(re.escape(_unichr(first)))
+        else:
+            items.append('%s-%s' % (re.escape(_unichr(first)),
+                                    re.escape(_unichr(last))))
+    return '[%s%s]' % ('^' if scanset.negate else '', ''.join(items))
+
+class _Compiler(object):
+    '''Builds the source of one matching function.
+
+    The directives and literal text of the format become a list of pieces of
+    regex, which are joined into steps; each step is one regex match.  Pieces
+    up to and including the last directive that assigns an argument must
+    match, or the function returns None.  The ones after it only affect how
+    much input is consumed, so each of them is optional, and the rest of the
+    step is skipped once one fails to match.'''
+    __slots__ = ['fmt', 'd', 'a', 'abi', 'namespace', 'lines', 'pieces',
+                 'spaces_end', 'optional_start', 'ngroups', 'fields',
+                 'required']
+
+    def __init__(self, fmt, abi):
+        self.fmt = fmt
+        self.d, self.a = scanf_parse(fmt, abi=abi)
+        self.abi = abi
+        self.namespace = {'_strtol': _strtol, '_strtoul': _strtoul,
+                          '_float': _float}
+        self.lines = []
+        self.pieces = []     # pieces of the step being built
+        self.spaces_end = -1 # len(pieces) after the last white space piece
+        self.optional_start = 0
+        self.ngroups = 0
+        self.fields = []     # (arg variable, group, conversion expression)
+        self.required = True
+
+    def atomic(self, pattern, capture=False):
+        '''Appends pattern as a piece that, once matched, is never backed
+        into.  Returns its group number if capture is true.'''
+        if _HAVE_ATOMIC:
+            if capture:
+                self.ngroups += 1
+                pattern = '(%s)' % pattern
+            self.pieces.append('(?>%s)' % pattern)
+        else:
+            self.ngroups += 1
+            self.pieces.append('(?=(%s))\\%d' % (pattern, self.ngroups))
+        return self.ngroups
+
+    def spaces(self):
+        # Any amount of white space, including none; two in a row are the
+        # same as one.
+        if self.spaces_end != len(self.pieces):
+            self.atomic(_SPACES)
+            self.spaces_end = len(self.pieces)
+
+    def regex(self, pattern):
+        name = '_r%d' % len(self.namespace)
+        self.namespace[name] = re.compile(pattern, re.DOTALL).match
+        return name
+
+    def conversion(self, dp, var):
+        '''Returns the expression converting the string var that dp matched
+        to the value stored for it.'''
+        conv = dp.conversion
+        if conv in 'cs[':
+            return var
+        if conv in 'aAeEfFgG':
+            return '_float(%s)' % var
+
+        type = self.a.arg[dp.arg_index].type
+        signed = conv in 'di'
+        if type in (Arg_type.TYPE_LONGLONGINT, Arg_type.TYPE_ULONGLONGINT):
+            strto_bits = self.abi.long_long * 8
+        else:
+            strto_bits = self.abi.long * 8
+        value = '%s(%s, %d, %d)' % ('_strtol' if signed else '_strtoul', var,
+                                    _BASE[conv], strto_bits)
+        if conv in 'du':
+            # Fast path: a string this short can't be out of range.
+            value = '(int(%s) if len(%s) < %d else %s)' % (
+                var, var, len(str(1 << (strto_bits - 1))), value)
+
+        integer = self.abi.integer_bits(Arg_type, type)
+        if integer is not None:
+            bits, signed_type = integer
+        else:
+            # A pointer.
+            bits, signed_type = self.abi.size_t * 8, False
+        mask = (1 << bits) - 1
+        if signed_type:
+            if bits == strto_bits:
+                return value
+            half = 1 << (bits - 1)
+            return '((%s + %d) & %d) - %d' % (value, half, mask, half)
+        if bits == strto_bits and conv != 'u':
+            return value
+        return '%s & %d' % (value, mask)
+
+    def flush(self, limit=None, width_pattern=None, final=False):
+        '''Emits the code for the step built so far.  limit bounds the number
+        of characters it may match; if width_pattern is given, it replaces
+        the step's pattern when that bound falls short of the input's end.
+        final means that nothing follows the step.'''
+        if not self.pieces:
+            return
+        lines = self.lines
+        pieces = self.pieces
+        if self.required or limit is not None:
+            start = len(pieces)
+        else:
+            start = self.optional_start
+        pattern = ''.join(pieces[:start])
+        marker = None
+        if start < len(pieces):
+            # Each optional piece is tried only if the ones before it
+            # matched; the marker group shows whether they all did.
+            optional = '(?:'.join(pieces[start:])
+            if not final:
+                self.ngroups += 1
+                marker = self.ngroups
+                optional += '()'
+            pattern += '(?:%s%s' % (optional, ')?' * (len(pieces) - start))
+        name = self.regex(pattern)
+
+        if limit is None:
+            lines.append('m = %s(text, p, endpos)' % name)
+        elif width_pattern is None:
+            lines.append('m = %s(text, p, min(endpos, p + %d))' %
+                         (name, limit))
+        else:
+            lines.append('e = p + %d' % limit)
+            lines.append('m = (%s(text, p, e) if e <= endpos else '
+                         '%s(text, p, endpos))' %
+                         (self.regex(width_pattern), name))
+        if limit is not None and not self.required:
+            lines.append('if m is None: return %s, p - pos' % self.result())
+        elif start:
+            lines.append('if m is None: return None')
+
+        fields = self.fields
+        strings = [(var, str(group)) for var, group, expr in fields
+                   if expr is not None]
+        if strings:
+            # m.group() returns a tuple when given more than one group.
+            lines.append('%s = m.group(%s)' %
+                         (', '.join(var for var, group in strings),
+                          ', '.join(group for var, group in strings)))
+        for var, group, expr in fields:
+            if expr is None:
+                # %n
+                lines.append('%s = m.start(%d) - pos' % (var, group))
+            elif expr != var:
+                lines.append('%s = %s' % (var, expr))
+        lines.append('p = m.end()')
+        if marker is not None:
+            lines.append('if m.start(%d) < 0: return %s, p - pos' %
+                         (marker, self.result()))
+        self.pieces = []
+        self.spaces_end = -1
+        self.optional_start = 0
+        self.ngroups = 0
+        self.fields = []
+
+    def result(self):
+        return '(%s)' % ''.join('a%d, ' % i for i in range(self.a.count))
+
+    def literal(self, text):
+        for c in text:
+            if c in ' \t\n\v\f\r':
+                self.spaces()
+            else:
+                self.pieces.append(re.escape(c))
+
+    def directive(self, dp):
+        fmt = self.fmt
+        conv = dp.conversion
+        if dp.width_start is not None:
+            width = int(fmt[dp.width_start:dp.width_end])
+        else:
+            width = None
+        var = 'a%d' % dp.arg_index if dp.arg_index != ARG_NONE else None
+
+        if conv not in 'c[n':
+            self.spaces()
+
+        if conv == '%':
+            self.pieces.append('%')
+        elif conv == 'n':
+            if var is not None:
+                self.ngroups += 1
+                self.pieces.append('()')
+                self.fields.append((var, self.ngroups, None))
+        elif conv in 'cs[' or width is None:
+            if conv == 'c':
+                # Fewer than width characters are enough if the input ends.
+                pattern = '.{1,%d}' % (width or 1)
+            else:
+                if conv == 's':
+                    pattern = '[^ \\t\\n\\v\\f\\r]'
+                elif conv == '[':
+                    pattern = _scanset(dp.scanset)
+                elif conv in _INTEGER:
+                    pattern = _INTEGER[conv]
+                else:
+                    pattern = _FLOAT
+                if width is not None:
+                    pattern += '{1,%d}' % width
+                elif conv in 's[':
+                    pattern += '+'
+            group = self.atomic(pattern, var is not None)
+            if var is not None:
+                self.fields.append((var, group, self.conversion(dp, var)))
+        else:
+            # A number of at most width characters: match it by itself,
+            # with endpos cutting the input off at the width.
+            self.flush()
+            group = self.atomic(_INTEGER.get(conv, _FLOAT), var is not None)
+            if var is not None:
+                self.fields.append((var, group, self.conversion(dp, var)))
+            if conv in _INTEGER:
+                self.flush(width)
+            else:
+                self.flush(width, '(%s)' % _FLOAT_WIDTH)
+
+    def compile(self):
+        fmt = self.fmt
+        d = self.d
+        nargs = self.a.count
+        last = -1
+        assigned = set()
+        for i in range(d.count):
+            if d.dir[i].arg_index != ARG_NONE:
+                last = i
+                assigned.add(d.dir[i].arg_index)
+
+        # Arguments skipped over by positional directives are never set.
+        self.lines = ['a%d = None' % i for i in range(nargs)
+                      if i not in assigned]
+        self.lines += ['if endpos is None: endpos = len(text)', 'p = pos']
+        self.required = last >= 0
+        cp = 0
+        for i, dp in enumerate(d.dir[:d.count]):
+            self.literal(fmt[cp:dp.dir_start])
+            self.directive(dp)
+            if i == last:
+                self.required = False
+                self.optional_start = len(self.pieces)
+            cp = dp.dir_end
+        self.literal(fmt[cp:d.dir[d.count].dir_start])
+        self.flush(final=True)
+        self.lines.append('return %s, p - pos' % self.result())
+
+        source = ('def scanf_match(text, pos=0, endpos=None):\n' +
+                  ''.join('    %s\n' % line for line in self.lines))
+        namespace = self.namespace
+        exec(source, namespace)
+        func = namespace['scanf_match']
+        func.fmt = fmt
+        func.nargs = nargs
+        return func
+
+def scanf_compile(fmt, abi=None, cache=True):
+    '''Returns a function match(text, pos=0, endpos=None) that reads text
+    from offset pos like C's sscanf(text, fmt, ...) would, stopping at
+    endpos.
+
+    It returns (values, consumed): values is a tuple with an item for each
+    argument that fmt assigns, in argument order, and consumed is the number
+    of characters read.  Integers are truncated to the width of their C type
+    in the ABI profile abi (default: the host's) and %p gives an int; floats
+    of every size give a float; %c, %s and %[ give str, as do their wide
+    forms (%lc, %ls, %l[), since text is already a sequence of characters;
+    %n gives the count of characters read up to that point.  If the input
+    runs out or stops matching before every argument has been assigned, it
+    returns None instead.
+
+    Compiled functions are kept in the LRU cache compiled unless cache is
+    false.'''
+    abi = get_profile(abi)
+    key = (fmt, abi.sizes)
+    if cache:
+        func = compiled.get(key)
+        if func is not None:
+            return func
+    func = _Compiler(fmt, abi).compile()
+    if cache:
+        compiled.put(key, func)
+    return func
@@ -18,42 +18,56 @@
 # You should have received a copy of the GNU Lesser General Public License along
 # with this program; if not, see <http://www.gnu.org/licenses/>.
 
-import ctypes
-from flufl.enum import Enum
-sizeof = ctypes.sizeof
-
-Arg_type = Enum('Arg_type', [str(x.strip()) for x in '''
-TYPE_NONE
-TYPE_SCHAR
-TYPE_UCHAR
-TYPE_SHORT
-TYPE_USHORT
-TYPE_INT
-TYPE_UINT
-TYPE_LONGINT
-TYPE_ULONGINT
-TYPE_LONGLONGINT
-TYPE_ULONGLONGINT
-TYPE_FLOAT
-TYPE_DOUBLE
-TYPE_LONGDOUBLE
-TYPE_CHAR
-TYPE_WIDE_CHAR
-TYPE_STRING
-TYPE_WIDE_STRING
-TYPE_POINTER
-TYPE_COUNT_SCHAR_POINTER
-TYPE_COUNT_SHORT_POINTER
-TYPE_COUNT_INT_POINTER
-TYPE_COUNT_LONGINT_POINTER
-TYPE_COUNT_LONGLONGINT_POINTER
-TYPE_CHARSEQ
-TYPE_NUMREAD
-'''.splitlines() if x != ''])
+from . import engine
+from .diagnostics import ERR_UNTERMINATED_SCANSET
+
+class Arg_type(object):
+    '''Argument types.  These are plain ints so that neither importing the
+    parser nor comparing types costs anything; use Arg_type.name() to get the
+    name of one.'''
+    TYPE_NONE = 1
+    TYPE_SCHAR = 2
+    TYPE_UCHAR = 3
+    TYPE_SHORT = 4
+    TYPE_USHORT = 5
+    TYPE_INT = 6
+    TYPE_UINT = 7
+    TYPE_LONGINT = 8
+    TYPE_ULONGINT = 9
+    TYPE_LONGLONGINT = 10
+    TYPE_ULONGLONGINT = 11
+    TYPE_FLOAT = 12
+    TYPE_DOUBLE = 13
+    TYPE_LONGDOUBLE = 14
+    TYPE_CHAR = 15
+    TYPE_WIDE_CHAR = 16
+    TYPE_STRING = 17
+    TYPE_WIDE_STRING = 18
+    TYPE_POINTER = 19
+    TYPE_COUNT_SCHAR_POINTER = 20
+    TYPE_COUNT_SHORT_POINTER = 21
+    TYPE_COUNT_INT_POINTER = 22
+    TYPE_COUNT_LONGINT_POINTER = 23
+    TYPE_COUNT_LONGLONGINT_POINTER = 24
+    TYPE_CHARSEQ = 25
+    TYPE_NUMREAD = 26
+
+    @classmethod
+    def name(cls, value):
+        for name, v in vars(cls).items():
+            if name.startswith('TYPE_') and v == value:
+                return name
+        raise ValueError('not an Arg_type: %r' % (value,))
+
+# Flags
+FLAG_SUPPRESS = 1   # * flag: match, but don't assign
 
 # arg_index value indicating that no argument is consumed.
 ARG_NONE = ~0
 
+# The stats.ParseStats recording each parse, if stats.enable() was called.
+_stats = None
+
 class Argument(object):
     __slots__ = ['type', 'data']
 
@@ -64,17 +78,94 @@ class Arguments(object):
         self.count = 0
         self.arg = []
 
+class Scanset(object):
+    '''The set of characters a %[ directive accepts.
+
+    bits has bit n set if the character with code n < 256 is listed; ranges
+    holds the (first, last) code ranges of listed characters from 256 up.
+    negate is true for a %[^...] set, which accepts the characters that
+    aren't listed.  Scansets are immutable.'''
+    __slots__ = ['bits', 'ranges', 'negate']
+
+    def __init__(self, bits=0, ranges=(), negate=False):
+        self.bits = bits
+        self.ranges = tuple(ranges)
+        self.negate = negate
+
+    def __contains__(self, c):
+        n = ord(c)
+        if n < 256:
+            listed = self.bits >> n & 1
+        else:
+            listed = False
+            for first, last in self.ranges:
+                if first <= n <= last:
+                    listed = True
+                    break
+        return bool(listed) != self.negate
+
+    def intervals(self):
+        '''Returns the listed codes as a sorted list of disjoint (first,
+        last) ranges.'''
+        result = []
+        bits = self.bits
+        n = 0
+        while bits:
+            if bits & 1:
+                first = n
+                while bits & 1:
+                    bits >>= 1
+                    n += 1
+                result.append((first, n - 1))
+            else:
+                # Skip the run of clear bits in one go.
+                skip = (bits & -bits).bit_length() - 1
+                bits >>= skip
+                n += skip
+        for first, last in sorted(self.ranges):
+            if result and first <= result[-1][1] + 1:
+                if last > result[-1][1]:
+                    result[-1] = (result[-1][0], last)
+            else:
+                result.append((first, last))
+        return result
+
+    def __eq__(self, other):
+        return (isinstance(other, Scanset) and self.bits == other.bits and
+                self.ranges == other.ranges and self.negate == other.negate)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((self.bits, self.ranges, self.negate))
+
+    def __reduce__(self):
+        return (Scanset, (self.bits, self.ranges, self.negate))
+
+    def __repr__(self):
+        return 'Scanset(%#x, %r, %r)' % (self.bits, self.ranges, self.negate)
+
 class Directive(object):
     '''A parsed directive.'''
-    __slots__ = ['dir_start', 'dir_end', 'width_start', 'width_end',
+    __slots__ = ['dir_start', 'dir_end', 'flags', 'width_start', 'width_end',
                  'width_arg_index', 'precision_arg_index', 'conversion',
-                 'arg_index']
+                 'arg_index', 'length', 'scanset']
+
+    # length: the raw length modifier, e.g. '' or 'll'
+    # width_arg_index: always ARG_NONE; scanf widths can't come from arguments
+    # precision_arg_index: always ARG_NONE; scanf has no precisions
+    # scanset: the Scanset of a %[ directive, otherwise None
 
     def __init__(self):
+        self.flags = 0
         self.width_start = None
         self.width_end = None
         self.width_arg_index = ARG_NONE
+        self.precision_arg_index = ARG_NONE
         self.arg_index = ARG_NONE
+        self.length = ''
+        self.scanset = None
 
 class Directives(object):
     '''A parsed format string.'''
@@ -84,20 +175,12 @@ class Directives(object):
         self.count = 0
         self.dir = []
 
+(FrozenDirective, FrozenDirectives, FrozenArgument, FrozenArguments,
+ freeze) = engine.frozen_results(__name__, Directive, Directives, Argument,
+                                 Arguments)
+
 def REGISTER_ARG(a, index, type):
-    n = index
-
-    while a.count <= n:
-        try:
-            a.arg[a.count]
-        except IndexError:
-            a.arg.append(Argument())
-        a.arg[a.count].type = Arg_type.TYPE_NONE
-        a.count += 1
-    if a.arg[n].type == Arg_type.TYPE_NONE:
-        a.arg[n].type = type
-    elif a.arg[n].type != type:
-        raise ValueError('ambiguous type for positional argument')
+    engine.register_arg(DIALECT, a, index, type)
 
 def conv_signed(c, flags):
     # If 'long long' exists and is larger than 'long':
@@ -153,6 +236,13 @@ def conv_string(c, flags):
     else:
         return c, Arg_type.TYPE_STRING
 
+def conv_scanset(c, flags):
+    # As in glibc, %l[ stores wide characters, as %ls does.
+    if flags >= 8:
+        return c, Arg_type.TYPE_WIDE_STRING
+    else:
+        return c, Arg_type.TYPE_CHARSEQ
+
 def conv_pointer(c, flags):
     return c, Arg_type.TYPE_POINTER
 
@@ -198,178 +288,106 @@ _conv_char = {
     '%': conv_none
 }
 
-def scanf_parse(fmt):
-    '''Parses the format string.  Fills in the number N of directives, and fills
-    in directives[0], ..., directives[N-1], and sets directives[N].dir_start to
-    the end of the format string.  Also fills in the arg_type fields of the
-    arguments and the needed count of arguments.'''
-    cp = 0                   # index into format string
-    arg_posn = 0             # number of regular arguments consumed
-    max_width_length = 0
-
-    d = Directives()
-    a = Arguments()
-
-    while True:
-        try:
-            c = fmt[cp]
-        except IndexError:
-            break
+def parse_scanset(fmt, cp):
+    '''Parses the scanset of a %[ directive, from just after the '[' at
+    offset cp.  Returns the Scanset and the offset just past the closing
+    ']', or (None, len(fmt)) if the set isn't closed.
+
+    As in glibc, a ']' right after the '[' or '[^' is listed rather than
+    closing the set, a '-' first or last is listed, and so is one between a
+    higher and a lower character; any other '-' makes a range.'''
+    if hasattr(fmt, 'code'):
+        # A BufferFormat or WideBufferFormat: set members are code units.
+        code = fmt.code
+    else:
+        code = lambda i: ord(fmt[i])
 
+    end = len(fmt)
+    negate = cp < end and fmt[cp] == '^'
+    if negate:
         cp += 1
-        if c == '%':
-            arg_index = ARG_NONE
-            d.dir.append(Directive())
-            dp = d.dir[d.count]
-            dp.dir_start = cp - 1
-
-            # Test for positional argument.
-            if fmt[cp].isdigit():
-                np = cp
-                while fmt[np].isdigit():
-                    np += 1
-                if fmt[np] == '$':
-                    n = 0
-
-                    np = cp
-                    while fmt[np].isdigit():
-                        n = n * 10 + (ord(fmt[np]) - ord('0'))
-                        np += 1
-                    if n == 0:
-                        raise ValueError('positional argument 0')
-                    arg_index = n - 1
-                    cp = np + 1
-
-            # Parse the field width.
-            if fmt[cp] == '*':
-                dp.width_start = cp
-                cp += 1
-                dp.width_end = cp
-                if max_width_length < 1:
-                    max_width_length = 1
-
-                # Test for positional argument.
-                if fmt[cp].isdigit():
-                    np = cp
-                    while fmt[np].isdigit():
-                        np += 1
-                    if fmt[np] == '$':
-                        n = 0
-
-                        np = cp
-                        while fmt[np].isdigit():
-                            n = n * 10 + (ord(fmt[np]) - ord('0'))
-                            np += 1
-                        if n == 0:
-                            raise ValueError('positional argument 0')
-                        dp.width_arg_index = n - 1
-                        cp = np + 1
-                if dp.width_arg_index == ARG_NONE:
-                    dp.width_arg_index = arg_posn
-                    arg_posn += 1
-                REGISTER_ARG(a, dp.width_arg_index, Arg_type.TYPE_INT)
-            elif fmt[cp].isdigit():
-                dp.width_start = cp
-                while fmt[cp].isdigit():
-                    cp += 1
-                dp.width_end = cp
-                width_length = dp.width_end - dp.width_start
-                if max_width_length < width_length:
-                    max_width_length = width_length
-
-            # Parse argument type/size specifiers.
-            flags = 0
-
-            while True:
-                if fmt[cp] == 'h':
-                    flags |= (1 << (flags & 1))
-                    cp += 1
-                elif fmt[cp] == 'L':
-                    flags |= 4
-                    cp += 1
-                elif fmt[cp] == 'l':
-                    flags += 8
-                    cp += 1
-                elif fmt[cp] == 'j':
-                    raise ValueError("don't know how to handle intmax_t")
-                elif fmt[cp] == 'z':
-                    if sizeof(ctypes.c_size_t) > sizeof(ctypes.c_long):
-                        # size_t = long long
-                        flags += 16
-                    elif sizeof(ctypes.c_size_t) > sizeof(ctypes.c_int):
-                        # size_t = long
-                        flags += 8
-                    cp += 1
-                elif fmt[cp] == 't':
-                    raise ValueError("don't know how to handle ptrdiff_t")
-                else:
-                    break
-
-            # Read the conversion character.
-            c = fmt[cp]
+    first = cp
+    bits = 0
+    ranges = []
+
+    while cp < end:
+        c = fmt[cp]
+        if c == ']' and cp != first:
+            return Scanset(bits, ranges, negate), cp + 1
+        n = code(cp)
+        if (c == '-' and cp != first and cp + 1 < end and
+                fmt[cp + 1] != ']' and code(cp - 1) <= code(cp + 1)):
+            # A range; its first character has been listed already.
+            lo = code(cp - 1)
+            hi = code(cp + 1)
             cp += 1
-            if c == '[':
-                match = True
-                chars = ''
-                first = cp
-
-                while True:
-                    try:
-                        c = fmt[cp]
-                    except IndexError:
-                        break
-                    try:
-                        c2 = fmt[cp + 2]
-                    except IndexError:
-                        c2 = ''
-
-                    if cp == first and c == '^':
-                        match = False
-                    elif cp == first and c == ']':
-                        chars += ']'
-                    elif fmt[first] == '^' and cp == first + 1 and c == ']':
-                        chars += ']'
-                    elif c == '-':
-                        if fmt[cp + 1] == ']':
-                            chars += '-'
-                            cp += 1
-                            c = ']'
-                            break
-                        else:
-                            chars += ''.join(chr(x) for x in xrange(
-                                ord(fmt[cp - 1]), ord(fmt[cp + 1]) + 1))
-                            cp += 1
-                    elif c == ']':
-                        break
-                    elif fmt[cp + 1] == '-' and c2 != ']':
-                        pass
-                    else:
-                        chars += c
-                    cp += 1
-
-            if c == ']':
-                c = '['
-                type = Arg_type.TYPE_CHARSEQ
-            else:
-                try:
-                    c, type = _conv_char[c](c, flags)
-                except KeyError:
-                    raise ValueError('bad conversion character: %%%s' % c)
+        else:
+            lo = hi = n
+        if lo < 256:
+            bits |= ((1 << (min(hi, 255) - lo + 1)) - 1) << lo
+        if hi >= 256:
+            ranges.append((max(lo, 256), hi))
+        cp += 1
 
-            if type != Arg_type.TYPE_NONE:
-                dp.arg_index = arg_index
-                if dp.arg_index == ARG_NONE:
-                    dp.arg_index = arg_posn
-                    arg_posn += 1
-                REGISTER_ARG(a, dp.arg_index, type)
-            dp.conversion = c
-            dp.dir_end = cp
+    return None, end
 
-            d.count += 1
+def _scanset(fmt, cp, end, dp):
+    # The hook of the '[' conversion.
+    dp.scanset, cp = parse_scanset(fmt, cp + 1)
+    if dp.scanset is None:
+        return end, ERR_UNTERMINATED_SCANSET
+    return cp, None
 
-    d.dir.append(Directive())
-    d.dir[d.count].dir_start = cp
+_conversions = engine.conversion_table(_conv_char)
+_conversions['['] = ('[',
+                      engine.conversion_table({'[': conv_scanset})['['][1],
+                      _scanset)
 
-    d.max_width_length = max_width_length
+DIALECT = engine.Dialect(
+    'scanf', Directive, Directives, Argument, Arguments,
+    flags={'*': FLAG_SUPPRESS}, repeat_flags=False, suppress=FLAG_SUPPRESS,
+    star=False, precision=False, conversions=_conversions, Arg_type=Arg_type)
 
-    return d, a
+def scanf_parse(fmt, start=0, abi=None, diagnostics=None):
+    '''Parses the format string.  Fills in the number N of directives, and fills
+    in directives[0], ..., directives[N-1], and sets directives[N].dir_start to
+    the end of the format string.  Also fills in the arg_type fields of the
+    arguments and the needed count of arguments.
+
+    Parsing begins at offset start.  fmt may also be any buffer-protocol object
+    (bytes, bytearray, memoryview, mmap, ...), in which case the format string
+    is the NUL-terminated byte string at offset start, parsed in place; all
+    offsets in the result are relative to the start of the buffer.  For a
+    wide string (as wprintf and wscanf take), pass a buffers.WideBuffer:
+    start and the offsets in the result then count code units.
+
+    abi is the target ABI profile (an AbiProfile or the name of a registered
+    one; see the abi module) used to resolve the 'z', 'j' and 't' length
+    modifiers; it defaults to the host's.
+
+    A malformed format string raises ValueError, unless diagnostics is a
+    list: then a Diagnostic is appended to it and the directives before the
+    bad one are returned (see the diagnostics module).'''
+    if _stats is not None:
+        return _stats.measure('scanf', _scanf_parse, fmt, start, abi,
+                              diagnostics)
+    return engine.parse(DIALECT, fmt, start, abi, diagnostics)
+
+def _scanf_parse(fmt, start, abi, diagnostics):
+    return engine.parse(DIALECT, fmt, start, abi, diagnostics)
+
+def iter_scanf_directives(fmt, start=0, abi=None, diagnostics=None):
+    '''Yields the directives of the format string one at a time, as
+    iterparse.DirectiveTuples, without building the Directives and
+    Arguments; see the iterparse module.  The arguments are as for
+    scanf_parse(), and an error is raised (or reported) when the iteration
+    reaches the bad directive.'''
+    from .iterparse import iter_directives
+    return iter_directives(DIALECT, fmt, start, abi, diagnostics)
+
+def resolve_arguments(d, abi=None):
+    '''Returns the Arguments that parsing the format string for the ABI
+    profile abi would have produced, working from the length modifiers and
+    conversions recorded in the Directives d instead of re-scanning the
+    string.'''
+    return engine.resolve_arguments(DIALECT, d, abi)
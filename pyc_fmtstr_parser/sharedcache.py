@@ -0,0 +1,463 @@
+# Copyright (C) 2014, Mark Laws.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program; if not, see <http://www.gnu.org/licenses/>.
+
+'''Parse results in shared memory, one copy per host for a pool of worker
+processes.
+
+    cache = SharedCache(1 << 26)        # before forking the workers
+    ...
+    d, a = cache.printf_parse(fmt)      # in any worker
+
+The cache is a block of shared memory (from multiprocessing.shared_memory
+where it exists, an anonymous shared mmap otherwise) split into shards, each
+an open-addressing hash table of keys (as the diskcache module makes them)
+and an arena of records.  A record is a fixed layout of integers: a header,
+then one struct per directive and one byte per argument type, so a lookup
+reads it in place with a single struct unpack and builds the result from
+that, with no unpickling.  As with the disk cache, a lookup costs more than
+parsing a short format string and less than parsing a long one; what it
+saves is memory, since each result is held once however many processes use
+it.  A format string that doesn't parse is saved as its diagnostic and
+raises the same ValueError on every lookup.
+
+Lookups take no lock.  Each shard has a sequence number that writers make
+odd while they change the shard and even again when done; a reader that
+sees it odd, or changed by the end of its lookup, treats the lookup as a
+miss.  Inserts take the shard's lock, and give up rather than wait if another
+process holds it, so neither ever blocks.  A shard whose table or arena is
+full is emptied before the next insert into it, which bounds the memory used
+at the size given and keeps the cost of eviction to one shard.
+
+Memory is shared with the processes forked after the cache is made, and
+with those it is passed to as an argument when they're started (pickling it
+passes the name and locks, as for multiprocessing's own locks).  The process
+that made the cache should unlink() it when done.  Results whose directives
+don't fit the layout (a length modifier of three characters or more, or a
+scanset listing characters past U+00FF) are parsed but not cached.'''
+
+import mmap
+import struct
+from binascii import hexlify, unhexlify
+
+from .batch import parse_error, parser_module
+from .diagnostics import Diagnostic
+from .diskcache import cache_key, version
+from .lru import CacheInfo
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
+MAGIC = b'PYCFMTSC'
+LAYOUT = 1
+
+# magic, layout, shards, table slots per shard, arena bytes per shard,
+# version hash
+_HEADER = struct.Struct('<8sIIII20s')
+# sequence number, entries, arena bytes used, evictions
+_SHARD = struct.Struct('<QIIQ')
+_SEQ = struct.Struct('<Q')
+# key, record offset in the arena + 1 (0 for an empty slot)
+_SLOT = struct.Struct('<16sI')
+_HASH = struct.Struct('<HQ')
+# count (_ERROR for a string that doesn't parse), arguments,
+# max_width_length, max_precision_length, dir_start of the sentinel; for an
+# error, the Diagnostic's code, offset and dir_start in the last three
+_RECORD = struct.Struct('<HHiii')
+_ERROR = 0xffff
+
+# None in an int field.
+_NONE = -0x80000000
+# The length modifiers that fit the layout, by code.
+_LENGTHS = [''] + list('hlLjzt') + [a + b for a in 'hlLjzt'
+                                     for b in 'hlLjzt']
+_LENGTH_CODES = dict((s, i) for i, s in enumerate(_LENGTHS))
+_CHARS = [None] + [chr(i) for i in range(255)]
+
+def _scanset(dialect):
+    Scanset = getattr(parser_module(dialect), 'Scanset', None)
+
+    def scanset(raw, negate):
+        if negate == 2:
+            return None
+        bits = int(hexlify(raw), 16) if raw.strip(b'\0') else 0
+        return Scanset(bits, (), bool(negate))
+    return scanset
+
+# (struct format, encoder, decoder) of each dialect's directives; see
+# _codec().
+_codecs = {}
+
+def _codec(dialect):
+    # The struct format of a directive of the dialect, with encode(dp),
+    # which returns its fields as a tuple or None if they don't fit, and
+    # build(fields, count, append), which appends count Directives made from
+    # the fields of as many.  Both are generated from Directive.__slots__:
+    # conversion is a byte (its code + 1), length a byte (its index in
+    # _LENGTHS), scanset 32 bytes of bits and a byte for negate (2 for none),
+    # and every other slot an int.  Only the int slots that a new Directive
+    # leaves None may be None; a result with None in another can't be saved.
+    try:
+        return _codecs[dialect]
+    except KeyError:
+        pass
+    Directive = parser_module(dialect).Directive
+    blank = Directive()
+    layout = []
+    encode = ['def encode(dp):', '    fields = []',
+              '    append = fields.append']
+    names = []
+    values = []
+    fixes = []
+    for name in Directive.__slots__:
+        get = "getattr(dp, %r, None)" % name
+        f = 'f%d' % len(names)
+        names.append(f)
+        if name == 'conversion':
+            layout.append('B')
+            encode.append('    c = %s' % get)
+            encode.append('    append(0 if c is None else ord(c) + 1)')
+            values.append('chars[%s]' % f)
+        elif name == 'length':
+            layout.append('B')
+            encode.append('    append(lengths[%s])' % get)
+            values.append('all_lengths[%s]' % f)
+        elif name == 'scanset':
+            layout.append('32sB')
+            encode.append('    s = %s' % get)
+            encode.append('    if s is None:')
+            encode.append("        append(b''); append(2)")
+            encode.append('    elif s.ranges:')
+            encode.append('        return None')
+            encode.append('    else:')
+            encode.append("        append(unhexlify('%064x' % s.bits))")
+            encode.append('        append(1 if s.negate else 0)')
+            negate = 'f%d' % len(names)
+            names.append(negate)
+            values.append('None if %s == 2 else scanset(%s, %s)' % (
+                negate, f, negate))
+        else:
+            layout.append('i')
+            encode.append('    x = %s' % get)
+            if getattr(blank, name, None) is None:
+                encode.append('    append(NONE if x is None else x)')
+                fixes.append('        if %s == NONE: dp.%s = None' % (f,
+                                                                      name))
+            else:
+                encode.append('    if x is None: return None')
+                encode.append('    append(x)')
+            values.append(f)
+    encode.append('    return fields')
+    nfields = len(names)
+    build = [
+        'def build(fields, count, append):',
+        '    new = object.__new__',
+        '    for i in range(0, count * %d, %d):' % (nfields, nfields),
+        '        %s, = fields[i:i + %d]' % (', '.join(names), nfields),
+        '        dp = new(Directive)',
+        '        %s = %s' % (', '.join('dp.' + name
+                                      for name in Directive.__slots__),
+                             ', '.join('(%s)' % v for v in values)),
+    ] + fixes + [
+        '        append(dp)',
+    ]
+    namespace = {'Directive': Directive, 'NONE': _NONE, 'chars': _CHARS,
+                 'lengths': _LENGTH_CODES, 'all_lengths': _LENGTHS,
+                 'unhexlify': unhexlify, 'scanset': _scanset(dialect)}
+    exec('\n'.join(encode + build), namespace)
+    codec = _codecs[dialect] = (''.join(layout), namespace['encode'],
+                                namespace['build'])
+    return codec
+
+def _encode(dialect, d, a):
+    # The record of a parse result, or None if it doesn't fit the layout.
+    layout, encode, build = _codec(dialect)
+    fields = []
+    try:
+        for dp in d.dir[:d.count]:
+            f = encode(dp)
+            if f is None:
+                return None
+            fields.extend(f)
+        types = bytearray(x.type for x in a.arg)
+        mpl = getattr(d, 'max_precision_length', None)
+        return _RECORD.pack(d.count, len(types), d.max_width_length,
+                            _NONE if mpl is None else mpl,
+                            d.dir[d.count].dir_start) + struct.pack(
+                                '<' + layout * d.count, *fields) + bytes(types)
+    except (KeyError, ValueError, struct.error, OverflowError):
+        # A length modifier not in _LENGTHS, or a value out of range.
+        return None
+
+class SharedCache(object):
+    '''Parse results in shared memory of about size bytes, split into
+    shards.  With multiprocessing.shared_memory, name names the block
+    (default: a new random name).'''
+    __slots__ = ['hits', 'misses', 'name', '_shm', '_buf', '_locks',
+                 '_nshards', '_nslots', '_arena', '_shard_size', '_structs',
+                 '_owner']
+
+    def __init__(self, size=1 << 26, shards=64, name=None, _attach=None):
+        self.hits = 0
+        self.misses = 0
+        self._structs = {}
+        if _attach is not None:
+            self._owner = False
+            self.name, self._locks = _attach
+            self._shm = shared_memory.SharedMemory(self.name)
+            self._buf = self._shm.buf
+            (magic, layout, self._nshards, self._nslots, self._arena,
+             file_version) = _HEADER.unpack_from(self._buf)
+            if (magic != MAGIC or layout != LAYOUT or
+                    file_version != version()):
+                self.close()
+                raise ValueError('incompatible shared cache: %r' %
+                                 (self.name,))
+            self._shard_size = (_SHARD.size + self._nslots * _SLOT.size +
+                                self._arena)
+            return
+
+        if shards < 1 or shards & (shards - 1):
+            raise ValueError('shards must be a power of 2')
+        per_shard = size // shards - _SHARD.size
+        # A quarter of each shard for its table, which is at most half full.
+        nslots = 8
+        while nslots * 2 * _SLOT.size <= per_shard // 4:
+            nslots *= 2
+        arena = per_shard - nslots * _SLOT.size
+        if arena < 1024:
+            raise ValueError('size too small for %d shards' % shards)
+        self._owner = True
+        self._nshards = shards
+        self._nslots = nslots
+        self._arena = arena
+        self._shard_size = _SHARD.size + nslots * _SLOT.size + arena
+        total = _HEADER.size + shards * self._shard_size
+        if shared_memory is not None:
+            self._shm = shared_memory.SharedMemory(name, create=True,
+                                                   size=total)
+            self.name = self._shm.name
+            self._buf = self._shm.buf
+        else:
+            if name is not None:
+                raise ValueError('named shared memory needs '
+                                 'multiprocessing.shared_memory')
+            self._shm = None
+            self.name = None
+            # Anonymous mappings are MAP_SHARED, so forked children see the
+            # same pages.
+            self._buf = mmap.mmap(-1, total)
+        _HEADER.pack_into(self._buf, 0, MAGIC, LAYOUT, shards, nslots, arena,
+                          version())
+        import multiprocessing
+        self._locks = [multiprocessing.Lock() for _ in range(shards)]
+
+    def __reduce__(self):
+        if self._shm is None:
+            raise TypeError('a SharedCache without shared_memory is shared '
+                            'only by forking')
+        return _attach, (self.name, self._locks)
+
+    def _locate(self, key):
+        # The offset of key's shard and the index of its first table slot.
+        shard, h = _HASH.unpack_from(key)
+        return (_HEADER.size + (shard & (self._nshards - 1)) *
+                self._shard_size, h & (self._nslots - 1))
+
+    def _find(self, base, i, key):
+        # The offset of key's record in the shard at base, or None.
+        buf = self._buf
+        table = base + _SHARD.size
+        mask = self._nslots - 1
+        for _ in range(self._nslots):
+            k, offset = _SLOT.unpack_from(buf, table + i * _SLOT.size)
+            if not offset:
+                return None
+            if k == key:
+                return (base + _SHARD.size + self._nslots * _SLOT.size +
+                        offset - 1)
+            i = (i + 1) & mask
+        return None
+
+    def _read(self, dialect, fmt, offset):
+        buf = self._buf
+        count, nargs, mwl, mpl, end = _RECORD.unpack_from(buf, offset)
+        offset += _RECORD.size
+        if count == _ERROR:
+            return parse_error(fmt, Diagnostic(mwl, mpl, end))
+        try:
+            s, build = self._structs[dialect, count]
+        except KeyError:
+            layout, encode, build = _codec(dialect)
+            s = struct.Struct('<' + layout * count)
+            self._structs[dialect, count] = s, build
+        mod = parser_module(dialect)
+        d = mod.Directives()
+        build(s.unpack_from(buf, offset), count, d.dir.append)
+        offset += s.size
+        d.count = count
+        sentinel = mod.Directive()
+        sentinel.dir_start = end
+        d.dir.append(sentinel)
+        d.max_width_length = mwl
+        if mpl != _NONE:
+            d.max_precision_length = mpl
+        a = mod.Arguments()
+        Argument = mod.Argument
+        for type in bytearray(buf[offset:offset + nargs]):
+            arg = Argument()
+            arg.type = type
+            a.arg.append(arg)
+        a.count = nargs
+        return d, a
+
+    def _lookup(self, dialect, fmt, key):
+        # The result or error saved for key, or None.
+        base, i = self._locate(key)
+        seq, = _SEQ.unpack_from(self._buf, base)
+        if seq & 1:
+            return None
+        offset = self._find(base, i, key)
+        if offset is None:
+            return None
+        try:
+            result = self._read(dialect, fmt, offset)
+        except (struct.error, IndexError, KeyError, ValueError):
+            # Torn by a writer; the sequence number says so below.
+            result = None
+        if _SEQ.unpack_from(self._buf, base)[0] != seq:
+            return None
+        return result
+
+    def _insert(self, key, record):
+        base, i = self._locate(key)
+        lock = self._locks[(base - _HEADER.size) // self._shard_size]
+        if len(record) > self._arena or not lock.acquire(False):
+            return
+        buf = self._buf
+        try:
+            if self._find(base, i, key) is not None:
+                return
+            seq, entries, used, evictions = _SHARD.unpack_from(buf, base)
+            _SEQ.pack_into(buf, base, seq + 1)
+            table = base + _SHARD.size
+            arena = table + self._nslots * _SLOT.size
+            if (2 * (entries + 1) > self._nslots or
+                    used + len(record) > self._arena):
+                evictions += entries
+                entries = used = 0
+                buf[table:arena] = b'\0' * (arena - table)
+            buf[arena + used:arena + used + len(record)] = record
+            mask = self._nslots - 1
+            while _SLOT.unpack_from(buf, table + i * _SLOT.size)[1]:
+                i = (i + 1) & mask
+            _SLOT.pack_into(buf, table + i * _SLOT.size, key, used + 1)
+            _SHARD.pack_into(buf, base, seq + 2, entries + 1,
+                             used + len(record), evictions)
+        finally:
+            lock.release()
+
+    def parse(self, dialect, fmt, abi=None):
+        '''Returns the result of parsing fmt (a str or bytes) with the
+        dialect ('printf' or 'scanf') for the ABI profile abi, from the
+        cache if it's there and by parsing it (and caching the result)
+        otherwise.'''
+        key = cache_key(dialect, fmt, abi)
+        result = self._lookup(dialect, fmt, key)
+        if result is not None:
+            self.hits += 1
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+        self.misses += 1
+        parse = getattr(parser_module(dialect), dialect + '_parse')
+        diagnostics = []
+        d, a = parse(fmt, abi=abi, diagnostics=diagnostics)
+        if diagnostics:
+            diagnostic = diagnostics[0]
+            self._insert(key, _RECORD.pack(
+                _ERROR, 0, diagnostic.code, diagnostic.offset,
+                diagnostic.dir_start))
+            raise parse_error(fmt, diagnostic)
+        record = _encode(dialect, d, a)
+        if record is not None:
+            self._insert(key, record)
+        return d, a
+
+    def printf_parse(self, fmt, abi=None):
+        return self.parse('printf', fmt, abi)
+
+    def scanf_parse(self, fmt, abi=None):
+        return self.parse('scanf', fmt, abi)
+
+    def _shards(self):
+        for n in range(self._nshards):
+            yield _SHARD.unpack_from(self._buf,
+                                     _HEADER.size + n * self._shard_size)
+
+    def __len__(self):
+        return sum(shard[1] for shard in self._shards())
+
+    def info(self):
+        '''Returns this process's hits and misses, and the evictions and
+        entries of the cache as a whole.'''
+        evictions = entries = 0
+        for seq, n, used, e in self._shards():
+            entries += n
+            evictions += e
+        return CacheInfo(self.hits, self.misses, evictions,
+                         self._nshards * (self._nslots // 2), entries, None)
+
+    def clear(self):
+        '''Empties the cache, for every process.'''
+        for n in range(self._nshards):
+            base = _HEADER.size + n * self._shard_size
+            with self._locks[n]:
+                seq, entries, used, evictions = _SHARD.unpack_from(
+                    self._buf, base)
+                _SEQ.pack_into(self._buf, base, seq + 1)
+                table = base + _SHARD.size
+                self._buf[table:table + self._nslots * _SLOT.size] = (
+                    b'\0' * (self._nslots * _SLOT.size))
+                _SHARD.pack_into(self._buf, base, seq + 2, 0, 0, evictions)
+
+    def close(self):
+        '''Unmaps the memory in this process.'''
+        if self._shm is not None:
+            self._buf = None
+            self._shm.close()
+            self._shm = None
+        elif self._buf is not None:
+            self._buf.close()
+            self._buf = None
+
+    def unlink(self):
+        '''Frees the shared memory once every process has closed it; for the
+        process that made the cache.'''
+        if self._shm is not None:
+            self._shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._owner:
+            self.unlink()
+        self.close()
+
+def _attach(name, locks):
+    return SharedCache(_attach=(name, locks))
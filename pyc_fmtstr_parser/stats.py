@@ -0,0 +1,261 @@
+# Copyright (C) 2014, Mark Laws.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program; if not, see <http://www.gnu.org/licenses/>.
+
+'''Opt-in counters and timings for printf_parse and scanf_parse.
+
+    from pyc_fmtstr_parser import stats
+    stats.enable()
+    ...
+    metrics = stats.snapshot()
+
+While disabled, which is the default, the parsers pay one test of a module
+global per call and nothing per directive.  Once enabled, every call of
+either parser (including those made by the cache, batch and compile
+modules) is timed, and its result is walked to count conversions, length
+modifiers and positional and sequential argument references.  Failed parses
+are counted by the kind of error.  The slowest formats seen are kept, up to
+a limit.
+
+Counts are per process: parses run by a process-pool batch are recorded in
+the worker processes, not here.'''
+
+import threading
+import time
+from collections import defaultdict
+
+from .engine import DIGITS
+from .printf_parse import ARG_NONE
+
+try:
+    text_type = basestring
+except NameError:
+    text_type = str
+
+clock = getattr(time, 'perf_counter', time.time)
+
+# Formats longer than this are truncated in the slowest-formats list.
+MAX_FORMAT_LENGTH = 200
+
+def _positional(fmt, cp):
+    # True if fmt has an argument number ("12$") at cp.  Only ASCII digits
+    # count, as in the parser.
+    np = cp
+    while fmt[np] in DIGITS:
+        np += 1
+    return np > cp and fmt[np] == '$'
+
+def _error_kind(e):
+    # The message up to any detail, e.g. 'ValueError: bad conversion
+    # character'.
+    return '%s: %s' % (type(e).__name__, str(e).split(':', 1)[0])
+
+class _DialectStats(object):
+    __slots__ = ['parses', 'seconds', 'directives', 'conversions',
+                 'lengths', 'arguments', 'errors']
+
+    def __init__(self):
+        self.parses = 0
+        self.seconds = 0.0
+        self.directives = 0
+        self.conversions = defaultdict(int)
+        self.lengths = defaultdict(int)
+        self.arguments = defaultdict(int)
+        self.errors = defaultdict(int)
+
+    def snapshot(self):
+        return {
+            'parses': self.parses,
+            'seconds': self.seconds,
+            'directives': self.directives,
+            'conversions': dict(self.conversions),
+            'lengths': dict(self.lengths),
+            'arguments': dict(self.arguments),
+            'errors': dict(self.errors),
+        }
+
+class ParseStats(object):
+    '''Collects counters for the parses of each dialect ('printf' and
+    'scanf'), and the top slowest distinct formats with their slowest
+    time.'''
+    __slots__ = ['top', 'dialects', 'slowest', '_floor', '_lock']
+
+    def __init__(self, top=10):
+        self.top = top
+        self.dialects = {}
+        self.slowest = {}        # (dialect, fmt) -> seconds
+        self._floor = 0.0
+        self._lock = threading.Lock()
+
+    def measure(self, dialect, parse, fmt, start, abi, diagnostics=None):
+        '''Runs parse(fmt, start, abi, diagnostics), recording it under
+        dialect, and returns its result.'''
+        ndiagnostics = len(diagnostics) if diagnostics is not None else 0
+        t = clock()
+        try:
+            d, a = parse(fmt, start, abi, diagnostics)
+        except Exception as e:
+            self.record_error(dialect, _error_kind(e), clock() - t)
+            raise
+        seconds = clock() - t
+        if diagnostics is not None and len(diagnostics) > ndiagnostics:
+            self.record_error(dialect, 'ValueError: %s' %
+                              diagnostics[-1].message, seconds)
+        else:
+            self.record(dialect, fmt, start, d, seconds)
+        return d, a
+
+    def record_error(self, dialect, kind, seconds):
+        '''Records a failed parse that took seconds; kind is as in
+        _error_kind(), even if the parser reported the error as a
+        Diagnostic.'''
+        with self._lock:
+            s = self._dialect(dialect)
+            s.parses += 1
+            s.seconds += seconds
+            s.errors[kind] += 1
+
+    def _dialect(self, dialect):
+        try:
+            return self.dialects[dialect]
+        except KeyError:
+            s = self.dialects[dialect] = _DialectStats()
+            return s
+
+    def record(self, dialect, fmt, start, d, seconds):
+        '''Records a successful parse of fmt from offset start that returned
+        the Directives d and took seconds.'''
+        if not isinstance(fmt, text_type):
+            from .buffers import as_format
+            fmt = as_format(fmt, start)
+        conversions = []
+        lengths = []
+        positional = sequential = 0
+        for dp in d.dir[:d.count]:
+            conversions.append(dp.conversion)
+            lengths.append(dp.length)
+            if dp.arg_index != ARG_NONE:
+                if _positional(fmt, dp.dir_start + 1):
+                    positional += 1
+                else:
+                    sequential += 1
+            if dp.width_arg_index != ARG_NONE:
+                if _positional(fmt, dp.width_start + 1):
+                    positional += 1
+                else:
+                    sequential += 1
+            if getattr(dp, 'precision_arg_index', ARG_NONE) != ARG_NONE:
+                if _positional(fmt, dp.precision_start + 2):
+                    positional += 1
+                else:
+                    sequential += 1
+
+        with self._lock:
+            s = self._dialect(dialect)
+            s.parses += 1
+            s.seconds += seconds
+            s.directives += d.count
+            for c in conversions:
+                s.conversions[c] += 1
+            for length in lengths:
+                s.lengths[length] += 1
+            if positional:
+                s.arguments['positional'] += positional
+            if sequential:
+                s.arguments['sequential'] += sequential
+            if self.top and seconds > self._floor:
+                self._slow(dialect, fmt[start:start + MAX_FORMAT_LENGTH],
+                           seconds)
+
+    def _slow(self, dialect, fmt, seconds):
+        # Keeps the top slowest distinct formats; _floor is the time a parse
+        # must beat to get in once the list is full.
+        slowest = self.slowest
+        key = (dialect, fmt)
+        if key in slowest:
+            slowest[key] = max(seconds, slowest[key])
+        else:
+            if len(slowest) >= self.top:
+                del slowest[min(slowest, key=slowest.get)]
+            slowest[key] = seconds
+        if len(slowest) >= self.top:
+            self._floor = min(slowest.values())
+
+    def snapshot(self):
+        '''Returns the counters as a dict of plain dicts, lists and numbers:
+
+            {'printf': {'parses': ..., 'seconds': ..., 'directives': ...,
+                        'conversions': {'d': ..., ...},
+                        'lengths': {'': ..., 'l': ..., ...},
+                        'arguments': {'positional': ..., 'sequential': ...},
+                        'errors': {'ValueError: bad conversion character':
+                                   ..., ...}},
+             'scanf': {...},
+             'slowest': [{'seconds': ..., 'dialect': ..., 'format': ...},
+                         ...]}
+
+        seconds is the cumulative parse time, including failed parses;
+        slowest is sorted slowest first.'''
+        with self._lock:
+            result = dict((dialect, s.snapshot())
+                          for dialect, s in self.dialects.items())
+            result['slowest'] = [
+                {'seconds': seconds, 'dialect': dialect, 'format': fmt}
+                for (dialect, fmt), seconds in sorted(
+                    self.slowest.items(), key=lambda x: -x[1])]
+        return result
+
+    def reset(self):
+        with self._lock:
+            self.dialects = {}
+            self.slowest = {}
+            self._floor = 0.0
+
+# The collector the parsers are recording into, or None.
+collector = None
+
+def _parser_modules():
+    from . import printf_parse, scanf_parse
+    return printf_parse, scanf_parse
+
+def enable(top=10):
+    '''Starts recording parses, keeping the top slowest formats.  Counters
+    already collected are kept, unless top differs from the last call's.'''
+    global collector
+    if collector is None:
+        collector = ParseStats(top)
+    elif collector.top != top:
+        collector.top = top
+        collector.reset()
+    for mod in _parser_modules():
+        mod._stats = collector
+
+def disable():
+    '''Stops recording parses.  The counters are kept until reset().'''
+    for mod in _parser_modules():
+        mod._stats = None
+
+def enabled():
+    return _parser_modules()[0]._stats is not None
+
+def snapshot():
+    '''Returns the counters collected so far; see ParseStats.snapshot().'''
+    if collector is None:
+        return {'slowest': []}
+    return collector.snapshot()
+
+def reset():
+    '''Zeroes the counters and empties the slowest-formats list.'''
+    if collector is not None:
+        collector.reset()
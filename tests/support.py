@@ -0,0 +1,10 @@
+'''Helpers shared by the tests.'''
+
+def dump(mod, d, a):
+    '''Returns the results d, a of parsing with the parser module mod as
+    plain values, for comparing results built different ways.'''
+    slots = mod.Directive.__slots__
+    return ([tuple(getattr(dp, name) for name in slots)
+             for dp in d.dir[:d.count]], d.dir[d.count].dir_start,
+            d.max_width_length, getattr(d, 'max_precision_length', None),
+            [x.type for x in a.arg[:a.count]])
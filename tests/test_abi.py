@@ -0,0 +1,56 @@
+import unittest
+
+from pyc_fmtstr_parser import abi
+from pyc_fmtstr_parser import printf_parse as P
+from pyc_fmtstr_parser import scanf_parse as S
+
+PT = P.Arg_type
+
+def types(a):
+    return [x.type for x in a.arg[:a.count]]
+
+class AbiTest(unittest.TestCase):
+    def test_typedef_modifiers(self):
+        fmt = '%zd %jd %td %zu'
+        self.assertEqual(types(P.printf_parse(fmt, abi='lp64')[1]),
+                         [PT.TYPE_LONGINT, PT.TYPE_LONGINT, PT.TYPE_LONGINT,
+                          PT.TYPE_ULONGINT])
+        self.assertEqual(types(P.printf_parse(fmt, abi='ilp32')[1]),
+                         [PT.TYPE_INT, PT.TYPE_LONGLONGINT, PT.TYPE_INT,
+                          PT.TYPE_UINT])
+        self.assertEqual(types(P.printf_parse(fmt, abi=abi.LLP64)[1]),
+                         [PT.TYPE_LONGLONGINT, PT.TYPE_LONGLONGINT,
+                          PT.TYPE_LONGLONGINT, PT.TYPE_ULONGLONGINT])
+
+    def test_resolve_arguments(self):
+        # One parse gives the arguments for every ABI.
+        for mod, fmt in ((P, '%2$*1$jd %3$zu %4$ls'), (S, '%zu %jd %*tx %n')):
+            parse = getattr(mod, mod.DIALECT.name + '_parse')
+            d, a = parse(fmt, abi='lp64')
+            for name in ('ilp32', 'lp64', 'llp64', 'host'):
+                self.assertEqual(types(mod.resolve_arguments(d, name)),
+                                 types(parse(fmt, abi=name)[1]), name)
+
+    def test_profiles(self):
+        self.assertTrue(abi.get_profile(None) is abi.HOST)
+        self.assertTrue(abi.get_profile(abi.LP64) is abi.LP64)
+        self.assertRaises(ValueError, abi.get_profile, 'pdp11')
+        self.assertEqual(abi.LP64.long_double_digits, 64)
+        self.assertEqual(abi.LLP64.long_double_digits, 53)
+        self.assertEqual(abi.LP64.length_flags('ll'), 16)
+        self.assertRaises(ValueError, abi.LP64.length_flags, 'q')
+
+    def test_register_profile(self):
+        profile = abi.AbiProfile('test16', int=2, long=4, long_long=8,
+                                 size_t=2, ptrdiff_t=2, intmax_t=8,
+                                 wchar_t=2)
+        abi.register_profile(profile)
+        try:
+            self.assertEqual(types(P.printf_parse('%zd %jd',
+                                                  abi='test16')[1]),
+                             [PT.TYPE_INT, PT.TYPE_LONGLONGINT])
+        finally:
+            del abi.profiles['test16']
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+import marshal
+import pickle
+import unittest
+
+from pyc_fmtstr_parser import batch
+from pyc_fmtstr_parser import printf_parse as P
+from pyc_fmtstr_parser import scanf_parse as S
+from tests.support import dump
+
+PRINTF = ['%d', 'x %5.2f %*s', '%2$s %1$lld', '', '100%%']
+SCANF = ['%d %[a-z]', '%*s %5[^,]', '%l[abc] %n', u'%[Ā-Ȁ]']
+
+class PackTest(unittest.TestCase):
+    def test_round_trip(self):
+        for dialect, mod, fmts in (('printf', P, PRINTF),
+                                   ('scanf', S, SCANF)):
+            parse = getattr(mod, dialect + '_parse')
+            for fmt in fmts:
+                result = parse(fmt)
+                packed = batch.pack(dialect, *result)
+                # Plain values only: the packed form marshals.
+                packed = marshal.loads(marshal.dumps(packed))
+                self.assertEqual(dump(mod, *batch.unpack(dialect, packed)),
+                                 dump(mod, *result))
+
+    def test_scansets_are_tuples(self):
+        packed = batch.pack('scanf', *S.scanf_parse('%[^a-c]'))
+        fields = packed[3]
+        scanset = fields[S.Directive.__slots__.index('scanset')]
+        self.assertEqual(scanset, (0xe << 96, (), True))
+
+class ParseManyTest(unittest.TestCase):
+    def test_executors(self):
+        expected = [dump(P, *P.printf_parse(fmt)) for fmt in PRINTF]
+        for executor in (batch.EXECUTOR_SERIAL, batch.EXECUTOR_THREAD,
+                         batch.EXECUTOR_PROCESS):
+            results = batch.printf_parse_many(PRINTF, executor=executor,
+                                              chunksize=2, workers=2)
+            self.assertEqual([dump(P, d, a) for d, a in results], expected,
+                             executor)
+
+    def test_packed(self):
+        results = batch.scanf_parse_many(SCANF, packed=True)
+        self.assertEqual(results, [batch.pack('scanf', *S.scanf_parse(fmt))
+                                   for fmt in SCANF])
+        pickle.loads(pickle.dumps(results))
+
+    def test_read_ahead(self):
+        reads = [0]
+        def fmts():
+            while True:
+                reads[0] += 1
+                yield '%d'
+        for executor in (batch.EXECUTOR_THREAD, batch.EXECUTOR_PROCESS):
+            reads[0] = 0
+            results = batch.iparse_many('printf', fmts(), executor=executor,
+                                        chunksize=10, workers=2)
+            next(results)
+            self.assertTrue(reads[0] <= 2 * batch._WINDOW * 10, executor)
+            results.close()
+
+    def test_errors(self):
+        fmts = ['%d', '%y', '%']
+        self.assertRaises(ValueError, batch.printf_parse_many, fmts)
+        results = batch.printf_parse_many(fmts, errors=batch.ERRORS_RETURN)
+        self.assertEqual(results[0][0].count, 1)
+        self.assertEqual(str(results[1]), 'bad conversion character: %y')
+        self.assertEqual(str(results[2]), 'unterminated directive')
+
+    def test_bad_arguments(self):
+        self.assertRaises(ValueError, batch.printf_parse_many, [],
+                          chunksize=0)
+        self.assertRaises(ValueError, batch.printf_parse_many, [],
+                          executor='fibers')
+        self.assertRaises(ValueError, list,
+                          batch.iparse_many('wprintf', []))
+
+if __name__ == '__main__':
+    unittest.main()
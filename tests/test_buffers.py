@@ -0,0 +1,99 @@
+import mmap
+import unittest
+
+from pyc_fmtstr_parser import printf_parse as P
+from pyc_fmtstr_parser import scanf_parse as S
+from pyc_fmtstr_parser.buffers import WideBuffer
+from tests.support import dump
+
+IMAGE = b'\x7fELF\0x=%d y=%5.2f\0%s %[a-z]\xff\0'
+# On Python 2, bytes is str, which is parsed as a whole string.
+BUFFERS = (bytearray, memoryview) + ((bytes,) if bytes is not str else ())
+
+class BufferTest(unittest.TestCase):
+    def test_buffer_types(self):
+        m = mmap.mmap(-1, len(IMAGE))
+        m.write(IMAGE)
+        try:
+            for buf in [kind(IMAGE) for kind in BUFFERS] + [m]:
+                d, a = P.printf_parse(buf, 5)
+                self.assertEqual(d.count, 2)
+                self.assertEqual(d.dir[0].dir_start, 7)
+                self.assertEqual(d.dir[d.count].dir_start, 17)
+                d, a = S.scanf_parse(buf, 18)
+                self.assertEqual(d.count, 2)
+                self.assertEqual(d.dir[1].dir_start, 21)
+        finally:
+            m.close()
+
+    def test_same_as_str(self):
+        # Offsets in the result count from the start of the buffer.
+        self.assertEqual(dump(P, *P.printf_parse(bytearray(IMAGE), 5)),
+                         dump(P, *P.printf_parse('.....x=%d y=%5.2f', 5)))
+
+    def test_non_ascii(self):
+        # A byte outside ASCII is never part of a directive.
+        self.assertRaises(ValueError, P.printf_parse, bytearray(b'%5\xb2d'))
+
+    def test_start_out_of_range(self):
+        self.assertRaises(ValueError, P.printf_parse, bytearray(IMAGE),
+                          len(IMAGE) + 1)
+
+class WideBufferTest(unittest.TestCase):
+    def test_widths_and_orders(self):
+        expected = dump(P, *P.printf_parse('...xx%d %ls', 3))
+        for width, order, codec in ((2, 'little', 'utf-16-le'),
+                                    (2, 'big', 'utf-16-be'),
+                                    (4, 'little', 'utf-32-le'),
+                                    (4, 'big', 'utf-32-be')):
+            buf = u'ab\0xx%d %ls\0'.encode(codec)
+            result = P.printf_parse(WideBuffer(buf, width, order), 3)
+            self.assertEqual(dump(P, *result), expected,
+                             (width, order))
+
+    def test_scanf(self):
+        buf = u'%d %[a-z]\0'.encode('utf-16-le')
+        self.assertEqual(dump(S, *S.scanf_parse(WideBuffer(buf))),
+                         dump(S, *S.scanf_parse('%d %[a-z]')))
+
+    def test_wide_conversions(self):
+        # printf's %C and %S are %lc and %ls; scanf has neither.
+        expected = dump(P, *P.printf_parse('%C %5S'))
+        for width, codec in (2, 'utf-16-le'), (4, 'utf-32-le'):
+            buf = WideBuffer(u'%C %5S\0'.encode(codec), width)
+            self.assertEqual(dump(P, *P.printf_parse(buf)), expected, width)
+            self.assertRaises(ValueError, S.scanf_parse, buf)
+
+    def test_non_ascii_scanset(self):
+        # Set members keep their code points, not U+FFFD.
+        fmt = u'%[\xe9\u4e00-\u4e05]'
+        expected = S.scanf_parse(fmt)[0].dir[0].scanset
+        self.assertEqual(expected.intervals(), [(0xe9, 0xe9),
+                                                (0x4e00, 0x4e05)])
+        for width, codec in (2, 'utf-16-le'), (4, 'utf-32-le'):
+            buf = (fmt + u'\0').encode(codec)
+            d, a = S.scanf_parse(WideBuffer(buf, width))
+            self.assertEqual(d.dir[0].scanset, expected, width)
+            self.assertTrue(u'\u4e03' in d.dir[0].scanset)
+            self.assertFalse(u'\ufffd' in d.dir[0].scanset)
+
+    def test_surrogate_pairs(self):
+        # Offsets count code units: a character outside the BMP is two of
+        # them in UTF-16, one in UTF-32, and in a scanset each is a member.
+        fmt = u'\U0001f600%d %[\U0001f600]\0'
+        d, a = S.scanf_parse(WideBuffer(fmt.encode('utf-16-le')))
+        self.assertEqual([(dp.dir_start, dp.dir_end)
+                          for dp in d.dir[:d.count]], [(2, 4), (5, 10)])
+        self.assertEqual(d.dir[1].scanset.ranges, ((0xd83d, 0xd83d),
+                                                   (0xde00, 0xde00)))
+        d, a = S.scanf_parse(WideBuffer(fmt.encode('utf-32-le'), 4))
+        self.assertEqual([(dp.dir_start, dp.dir_end)
+                          for dp in d.dir[:d.count]], [(1, 3), (4, 8)])
+        self.assertEqual(d.dir[1].scanset.ranges, ((0x1f600, 0x1f600),))
+
+    def test_bad_arguments(self):
+        self.assertRaises(ValueError, WideBuffer, b'', 3)
+        self.assertRaises(ValueError, WideBuffer, b'', 2, 'middle')
+
+if __name__ == '__main__':
+    unittest.main()
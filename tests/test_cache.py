@@ -0,0 +1,100 @@
+import subprocess
+import sys
+import unittest
+
+from pyc_fmtstr_parser import cache
+from pyc_fmtstr_parser import printf_parse as P
+from pyc_fmtstr_parser.abi import AbiProfile
+from pyc_fmtstr_parser.lru import LRUCache, POLICY_FIFO, POLICY_LRU
+
+class LRUCacheTest(unittest.TestCase):
+    def test_lru(self):
+        c = LRUCache(2, POLICY_LRU)
+        c.put('a', 1)
+        c.put('b', 2)
+        self.assertEqual(c.get('a'), 1)
+        c.put('c', 3)
+        self.assertFalse('b' in c)
+        self.assertTrue('a' in c)
+        info = c.info()
+        self.assertEqual((info.hits, info.misses, info.evictions,
+                          info.currsize), (1, 0, 1, 2))
+
+    def test_fifo(self):
+        c = LRUCache(2, POLICY_FIFO)
+        c.put('a', 1)
+        c.put('b', 2)
+        c.get('a')
+        c.put('c', 3)
+        self.assertFalse('a' in c)
+        self.assertEqual(c.get('b'), 2)
+
+    def test_bounds(self):
+        c = LRUCache(0)
+        c.put('a', 1)
+        self.assertEqual(len(c), 0)
+        self.assertEqual(c.get('a', 'missing'), 'missing')
+        self.assertRaises(ValueError, LRUCache, -1)
+        self.assertRaises(ValueError, LRUCache, 1, 'random')
+
+class ParseCacheTest(unittest.TestCase):
+    def setUp(self):
+        cache.parse_cache('printf').clear()
+
+    def test_cached(self):
+        d, a = cache.cached_printf_parse('%d %s')
+        self.assertTrue(cache.cached_printf_parse('%d %s')[0] is d)
+        info = cache.parse_cache('printf').info()
+        self.assertEqual((info.hits, info.misses), (1, 1))
+        self.assertEqual([x.type for x in a.arg],
+                         [P.Arg_type.TYPE_INT, P.Arg_type.TYPE_STRING])
+
+    def test_frozen(self):
+        d, a = cache.cached_scanf_parse('%d %s')
+        self.assertRaises(AttributeError, setattr, d.dir[0], 'flags', 1)
+        self.assertRaises(AttributeError, setattr, d, 'count', 0)
+
+    def test_errors_not_cached(self):
+        self.assertRaises(ValueError, cache.cached_printf_parse, '%y')
+        self.assertRaises(ValueError, cache.cached_printf_parse, '%y')
+        self.assertEqual(cache.parse_cache('printf').info().currsize, 0)
+
+    def test_abi(self):
+        # Keyed by the profile's sizes, not its name.
+        ilp32 = AbiProfile('custom', int=4, long=4, long_long=8, size_t=4,
+                           ptrdiff_t=4, intmax_t=8, wchar_t=4,
+                           long_double_digits=64)
+        lp64 = AbiProfile('custom', int=4, long=8, long_long=8, size_t=8,
+                          ptrdiff_t=8, intmax_t=8, wchar_t=4)
+        types = [cache.cached_printf_parse('%zu', abi)[1].arg[0].type
+                 for abi in (ilp32, lp64, 'ilp32')]
+        self.assertEqual(types, [P.Arg_type.TYPE_UINT,
+                                 P.Arg_type.TYPE_ULONGINT,
+                                 P.Arg_type.TYPE_UINT])
+        info = cache.parse_cache('printf').info()
+        self.assertEqual((info.hits, info.misses), (1, 2))
+
+    def test_configure(self):
+        cache.cached_printf_parse('%d')
+        try:
+            cache.configure(maxsize=1, policy=POLICY_FIFO)
+            info = cache.parse_cache('printf').info()
+            self.assertEqual((info.maxsize, info.policy, info.currsize),
+                             (1, POLICY_FIFO, 0))
+            cache.cached_printf_parse('%d')
+            cache.cached_printf_parse('%s')
+            self.assertEqual(cache.parse_cache('printf').info().currsize, 1)
+            self.assertEqual(cache.parse_cache('scanf').info().maxsize, 1)
+            self.assertRaises(ValueError, cache.configure, -1)
+        finally:
+            cache.configure()
+
+    def test_lazy_parsers(self):
+        # Using one dialect's cache doesn't import the other's parser.
+        code = ('import sys; from pyc_fmtstr_parser import cache; '
+                'cache.cached_printf_parse("%d"); '
+                'sys.exit("pyc_fmtstr_parser.scanf_parse" in sys.modules)')
+        self.assertEqual(subprocess.call([sys.executable, '-c', code]), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+from pyc_fmtstr_parser import catalog
+from pyc_fmtstr_parser import printf_parse as P
+
+PO = u'''\
+msgid ""
+msgstr ""
+"Content-Type: text/plain; charset=UTF-8\\n"
+
+#, c-format
+msgid "%d files in %s"
+msgstr "%2$s: %1$d Dateien"
+
+#, c-format
+msgid "%d file"
+msgid_plural "%d files"
+msgstr[0] "eine Datei"
+msgstr[1] "%d Dateien"
+
+#, c-format
+msgid "%s left"
+msgstr "%d übrig"
+
+msgid "plain %d"
+msgstr "schlicht"
+
+#, no-c-format
+msgid "100%"
+msgstr "100 %"
+
+#, c-format, fuzzy
+msgid "untranslated %s"
+msgstr ""
+'''.encode('utf-8')
+
+def check(msgid, msgstr, msgid_plural=None):
+    msgstr = msgstr if isinstance(msgstr, list) else [msgstr]
+    entry = catalog.Entry(None, msgid, msgid_plural, msgstr,
+                          frozenset(['c-format']), 1)
+    return [p.kind for p in catalog.check_entries([entry])]
+
+def write_mo(path, pairs):
+    # A little-endian .mo file of the (msgid, msgstr) byte strings pairs.
+    pairs = sorted(pairs)
+    n = len(pairs)
+    originals = 28
+    translations = originals + 8 * n
+    offset = translations + 8 * n
+    table = []
+    data = b''
+    for s in [k for k, v in pairs] + [v for k, v in pairs]:
+        table.append(struct.pack('<II', len(s), offset + len(data)))
+        data += s + b'\0'
+    with open(path, 'wb') as f:
+        f.write(struct.pack('<IIIIIII', catalog.MO_MAGIC, 0, n, originals,
+                            translations, 0, 0))
+        f.write(b''.join(table) + data)
+
+class ReadPoTest(unittest.TestCase):
+    def test_entries(self):
+        entries = list(catalog.read_po(PO.splitlines(True)))
+        self.assertEqual(len(entries), 7)
+        plural = entries[2]
+        self.assertEqual((plural.msgid, plural.msgid_plural),
+                         ('%d file', '%d files'))
+        self.assertEqual(plural.msgstr, ['eine Datei', '%d Dateien'])
+        self.assertEqual(plural.flags, set(['c-format']))
+        self.assertEqual(plural.line, 10)
+        self.assertEqual(entries[3].msgstr, [u'%d übrig'])
+
+class CheckTest(unittest.TestCase):
+    def test_signature(self):
+        self.assertEqual(catalog.signature(P.printf_parse('%2$s %1$d')[1]),
+                         catalog.signature(P.printf_parse('%d %s')[1]))
+
+    def test_exact(self):
+        self.assertEqual(check('%d of %s', '%2$s: %1$d'), [])
+        self.assertEqual(check('%d of %s', '%d'), [catalog.PROBLEM_COUNT])
+        self.assertEqual(check('%d of %s', '%s %d'), [catalog.PROBLEM_TYPES])
+        self.assertEqual(check('%d', '%d%'), [catalog.PROBLEM_INVALID])
+        self.assertEqual(check('%d', '%d%n'), [catalog.PROBLEM_PERCENT_N])
+
+    def test_plural(self):
+        # As with msgfmt -c, plural forms may leave arguments out, from the
+        # end or by number, but not add or change them.
+        self.assertEqual(check('%d file', ['one file', '%d files'],
+                               '%d files'), [])
+        self.assertEqual(check('%d of %s', ['%2$s'], '%d of %s'), [])
+        self.assertEqual(check('%d of %s', ['%d'], '%d of %s'), [])
+        self.assertEqual(check('%d file', ['%d %s'], '%d files'),
+                         [catalog.PROBLEM_COUNT])
+        self.assertEqual(check('%d file', ['%ld'], '%d files'),
+                         [catalog.PROBLEM_TYPES])
+
+    def test_catalog(self):
+        problems = list(catalog.check_entries(
+            catalog.read_po(PO.splitlines(True))))
+        self.assertEqual([(p.kind, p.entry.line, p.index) for p in problems],
+                         [(catalog.PROBLEM_TYPES, 16, 0),
+                          (catalog.PROBLEM_COUNT, 19, 0)])
+        self.assertTrue(str(problems[0]).startswith(
+            '16: types: msgstr[0] (int), expected (string): '))
+        # Entries without c-format are checked only if their messages take
+        # arguments, and not at all with require_flag.
+        problems = catalog.check_entries(catalog.read_po(PO.splitlines(True)),
+                                         require_flag=True)
+        self.assertEqual([p.entry.line for p in problems], [16])
+
+class CheckCatalogTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_po(self):
+        path = os.path.join(self.dir, 'de.po')
+        with open(path, 'wb') as f:
+            f.write(PO)
+        self.assertEqual([p.entry.line for p in catalog.check_catalog(path)],
+                         [16, 19])
+
+    def test_mo(self):
+        path = os.path.join(self.dir, 'de.mo')
+        write_mo(path, [
+            (b'', b'Content-Type: text/plain; charset=UTF-8\n'),
+            (b'%d of %s', b'%2$s: %1$d'),
+            (b'%d file\0%d files', b'eine Datei\0%d Dateien'),
+            (b'%s left', u'%d übrig'.encode('utf-8'))])
+        with open(path, 'rb') as f:
+            entries = list(catalog.read_mo(f.read()))
+        self.assertEqual([e.msgid_plural for e in entries],
+                         [None, '%d files', None, None])
+        problems = catalog.check_catalog(path)
+        self.assertEqual([(p.kind, p.entry.msgid) for p in problems],
+                         [(catalog.PROBLEM_TYPES, '%s left')])
+        self.assertEqual(problems[0].entry.msgstr, [u'%d übrig'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import unittest
+
+from pyc_fmtstr_parser import classify
+from pyc_fmtstr_parser.classify import TemplateIndex
+
+try:
+    unichr
+except NameError:
+    unichr = chr
+
+class ClassifyTest(unittest.TestCase):
+    def setUp(self):
+        self.index = TemplateIndex(['user %s logged in from %s',
+                                    'user %s logged out',
+                                    'disk %s at %d%%', '%d'])
+
+    def test_classify(self):
+        m = self.index.classify('user bob logged in from 10.0.0.1')
+        self.assertEqual(m.template.id, 0)
+        self.assertEqual(m.args, ('bob', '10.0.0.1'))
+        self.assertEqual(self.index.classify('disk sda at 93%').args,
+                         ('sda', 93))
+        self.assertEqual(self.index.classify('42').args, (42,))
+        self.assertEqual(self.index.classify('nothing like it'), None)
+
+    def test_ambiguous(self):
+        index = TemplateIndex(['%s', 'took %d ms'])
+        m = index.classify('took 5 ms')
+        self.assertEqual(m.template.fmt, 'took %d ms')
+        self.assertTrue(m.ambiguous)
+        self.assertEqual(m.alternatives[0].args, ('took 5 ms',))
+
+    def test_candidates(self):
+        line = 'user eve logged out'
+        self.assertEqual([t.id for t in self.index.candidates(line)],
+                         [1, 3])
+        template = self.index.add('user %s logged out at %d', 'late')
+        self.assertEqual(self.index.classify(line + ' at 5').template,
+                         template)
+        self.assertEqual(template.data, 'late')
+
+    def test_interleaved(self):
+        # Lookups between adds see every template added so far, without
+        # rebuilding one automaton over all the anchors each time.
+        fmts = ['event %d: code %%d in %%s' % i for i in range(200)]
+        index = TemplateIndex()
+        for i, fmt in enumerate(fmts):
+            template = index.add(fmt)
+            m = index.classify('event %d: code 7 in main' % i)
+            self.assertEqual(m.template, template)
+            self.assertEqual(m.args, (7, 'main'))
+            self.assertEqual(
+                index.classify('event 0: code 1 in x').template.id, 0)
+            self.assertTrue(len(index.automata) <= i.bit_length() + 1)
+        bulk = TemplateIndex(fmts)
+        for i in range(0, 200, 7):
+            line = 'event %d: code %d in f' % (i, i)
+            self.assertEqual([t.id for t in index.candidates(line)],
+                             [t.id for t in bulk.candidates(line)])
+        self.assertEqual(len(bulk.automata), 1)
+
+    def test_args(self):
+        index = TemplateIndex(['%5d|%-4s|%x|%p|%.2f|%*d'])
+        m = index.classify('   12|ab  |ff|0x10|2.50|  7')
+        self.assertEqual(m.args, (12, 'ab', 255, 16, 2.5, None, 7))
+
+    def test_foreign_transitions_bounded(self):
+        # Characters in none of the anchors all lead to the root; only so
+        # many of their transitions are remembered.
+        old = classify._MAX_FOREIGN
+        classify._MAX_FOREIGN = 100
+        try:
+            automaton = classify._Automaton(['abc', 'bcd'])
+            text = u''.join(map(unichr, range(0x4e00, 0x4e00 + 1000)))
+            self.assertEqual(automaton.scan(text + u'xabcd'),
+                             ['abc', 'bcd'])
+            self.assertEqual(automaton.foreign, 100)
+            self.assertTrue(sum(len(g) for g in automaton.goto) < 200)
+        finally:
+            classify._MAX_FOREIGN = old
+
+if __name__ == '__main__':
+    unittest.main()
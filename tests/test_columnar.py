@@ -0,0 +1,55 @@
+import unittest
+
+from pyc_fmtstr_parser import batch
+from pyc_fmtstr_parser import printf_parse as P
+from pyc_fmtstr_parser import scanf_parse as S
+from pyc_fmtstr_parser.columnar import ColumnarDirectives
+from tests.support import dump
+
+class ColumnarTest(unittest.TestCase):
+    def test_round_trip(self):
+        for dialect, mod, fmts in (
+                ('printf', P, ['%d %s', '', '%2$*1$.3lf', '%C%%']),
+                ('scanf', S, ['%d %[a-z]', '%*s %l[^,] %5c'])):
+            parse = getattr(mod, dialect + '_parse')
+            cols = ColumnarDirectives.from_strings(dialect, fmts)
+            packed = ColumnarDirectives(dialect)
+            for fmt in fmts:
+                packed.append_packed(batch.pack(dialect, *parse(fmt)))
+            self.assertEqual(cols.nstrings, len(fmts))
+            for k, fmt in enumerate(fmts):
+                expected = dump(mod, *parse(fmt))
+                self.assertEqual(dump(mod, *cols.to_result(k)), expected)
+                self.assertEqual(dump(mod, *packed.to_result(k)), expected)
+
+    def test_views(self):
+        cols = ColumnarDirectives.from_strings('printf', ['%d %s', '%%'])
+        self.assertEqual(len(cols), 3)
+        self.assertEqual([v.conversion for v in cols], ['d', 's', '%'])
+        self.assertEqual(cols[1].arg_type, P.Arg_type.TYPE_STRING)
+        self.assertEqual(cols[-1].arg_type, None)
+        self.assertEqual(cols[0].width_start, None)
+        self.assertEqual(len(cols.directives(1)), 1)
+        self.assertRaises(IndexError, cols.__getitem__, 3)
+
+    def test_large_values(self):
+        # Offsets past 64K, argument numbers past 32K and many distinct
+        # length modifiers don't overflow the columns.
+        buf = bytearray(100000)
+        buf[70000:70005] = b'%lld\0'
+        cols = ColumnarDirectives('printf')
+        cols.append(*P.printf_parse(buf, 70000))
+        cols.append(*P.printf_parse('%40000$d'))
+        for i in range(300):
+            cols.append(*P.printf_parse('%' + 'h' * (i + 1) + 'd'))
+        self.assertEqual((cols[0].dir_start, cols[0].dir_end),
+                         (70000, 70004))
+        self.assertEqual(cols[1].arg_index, 39999)
+        self.assertEqual(cols[-1].length, 'h' * 300)
+        self.assertEqual(cols.to_result(1)[1].count, 40000)
+        if bytes is not str:
+            # 64 bits even where a C long is 32, for buffers over 2 GB.
+            self.assertEqual(cols.columns['dir_start'].itemsize, 8)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import math
+import unittest
+
+from pyc_fmtstr_parser.abi import AbiProfile
+from pyc_fmtstr_parser.printf_compile import printf_compile
+from pyc_fmtstr_parser.scanf_compile import scanf_compile
+
+class PrintfCompileTest(unittest.TestCase):
+    def test_format(self):
+        f = printf_compile("%'d|%-5s|%05.1f|%#x|%+d|%c|%p|%n|%hhd|%s",
+                           thousands_sep=',')
+        self.assertEqual(f(1234567, 'ab', 3.14159, 255, 5, 65, None, None,
+                           300, None),
+                         '1,234,567|ab   |003.1|0xff|+5|A|(nil)||44|(null)')
+        self.assertEqual(f.nargs, 10)
+
+    def test_positional(self):
+        self.assertEqual(printf_compile('%2$s %1$*3$d')(7, 'x', 4), 'x    7')
+        self.assertEqual(printf_compile('%*d|%-*d')(-4, 1, 3, 2),
+                         '1   |2  ')
+
+    def test_truncation(self):
+        self.assertEqual(printf_compile('%u %hd', abi='lp64')(-1, 40000),
+                         '4294967295 -25536')
+        self.assertEqual(printf_compile('%lu', abi='llp64')(-1),
+                         '4294967295')
+
+    def test_hex_float(self):
+        f = printf_compile('%a|%A|%.2a', abi='lp64')
+        self.assertEqual(f(1.0, -0.5, 0.1), '0x1p+0|-0X1P-1|0x1.9ap-4')
+
+    def test_x87_long_double(self):
+        # Where long double is the x87's, glibc prints %La from its 64-bit
+        # mantissa, with a leading digit of 8 to f.
+        f = printf_compile('%La|%LA|%.3La|%.0La', abi='lp64')
+        self.assertEqual(f(1.0, 0.1, 0.1, 1.99),
+                         '0x8p-3|0XC.CCCCCCCCCCCDP-7|0xc.ccdp-7|0x1p+1')
+        # Elsewhere it is printed as a double.
+        self.assertEqual(printf_compile('%La', abi='llp64')(1.0), '0x1p+0')
+
+    def test_wide_char(self):
+        f = printf_compile('%lc|%c|%-3lc|')
+        self.assertEqual(f(0x20ac, 0x141, u'\u20ac'),
+                         u'\u20ac|A|\u20ac  |')
+
+    def test_nan(self):
+        nan = math.copysign(float('nan'), 1)
+        neg = math.copysign(nan, -1)
+        f = printf_compile('%f|%5.1e|%g|%-*G|%+f')
+        self.assertEqual(f(neg, neg, neg, 5, neg, nan),
+                         '-nan| -nan|-nan|-NAN |+nan')
+        self.assertEqual(f(1.5, 1.5, 1.5, 5, 1.5, 1.5),
+                         '1.500000|1.5e+00|1.5|1.5  |+1.500000')
+
+    def test_cache_abi(self):
+        # Profiles are told apart by their sizes, not their names.
+        a = AbiProfile('custom', int=4, long=4, long_long=8, size_t=4,
+                       ptrdiff_t=4, intmax_t=8, wchar_t=4)
+        b = AbiProfile('custom', int=4, long=8, long_long=8, size_t=8,
+                       ptrdiff_t=8, intmax_t=8, wchar_t=4)
+        self.assertEqual(printf_compile('%lx', a)(-1), 'ffffffff')
+        self.assertEqual(printf_compile('%lx', b)(-1), 'ffffffffffffffff')
+
+    def test_cache(self):
+        self.assertTrue(printf_compile('%d cached') is
+                        printf_compile('%d cached'))
+        self.assertFalse(printf_compile('%d', cache=False) is
+                         printf_compile('%d', cache=False))
+
+class ScanfCompileTest(unittest.TestCase):
+    def test_match(self):
+        match = scanf_compile('%d %5s %l[a-z]%n %[^,],%c')
+        self.assertEqual(match('12 helloworld x, y'),
+                         ((12, 'hello', 'world', 13, 'x', ' '), 17))
+
+    def test_conversions(self):
+        match = scanf_compile('%hhd %x %f %*d %p')
+        self.assertEqual(match(' 300 ff 2.5 9 0x10'),
+                         ((44, 255, 2.5, 16), 18))
+        self.assertEqual(scanf_compile('%3d%d')('12345'), ((123, 45), 5))
+        self.assertEqual(scanf_compile('%2$s %1$d')('abc 5'),
+                         ((5, 'abc'), 5))
+
+    def test_failure(self):
+        self.assertEqual(scanf_compile('%d %d')('5 '), None)
+        self.assertEqual(scanf_compile('%[a-z]')('123'), None)
+        self.assertEqual(scanf_compile('x%d')('y1'), None)
+
+    def test_pos(self):
+        match = scanf_compile('%d')
+        self.assertEqual(match('ab 42', 2), ((42,), 3))
+        self.assertEqual(match('4242', 0, 2), ((42,), 2))
+
+    def test_cache_abi(self):
+        # Profiles are told apart by their sizes, not their names.
+        a = AbiProfile('custom', int=4, long=4, long_long=8, size_t=4,
+                       ptrdiff_t=4, intmax_t=8, wchar_t=4)
+        b = AbiProfile('custom', int=4, long=8, long_long=8, size_t=8,
+                       ptrdiff_t=8, intmax_t=8, wchar_t=4)
+        self.assertEqual(scanf_compile('%lu', a)('4294967297'),
+                         ((4294967295,), 10))
+        self.assertEqual(scanf_compile('%lu', b)('4294967297'),
+                         ((4294967297,), 10))
+
+if __name__ == '__main__':
+    unittest.main()
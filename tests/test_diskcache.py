@@ -0,0 +1,128 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import unittest
+
+from pyc_fmtstr_parser import diskcache
+from pyc_fmtstr_parser import printf_parse as P
+from pyc_fmtstr_parser.diskcache import DiskCache
+from tests.support import dump
+
+def _fill(path, worker):
+    # Flushes often, so that flushes of different processes overlap.
+    cache = DiskCache(path)
+    for i in range(25):
+        cache.printf_parse('%d worker %d' % (worker, i))
+        cache.flush()
+    cache.close()
+
+class DiskCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'formats.cache')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_round_trip(self):
+        fmts = ['%d', '%5.2f %s', '%2$s %1$*3$d', '', 'x%%y']
+        with DiskCache(self.path) as cache:
+            for fmt in fmts:
+                cache.printf_parse(fmt)
+            self.assertEqual(cache.info().misses, len(fmts))
+        cache = DiskCache(self.path)
+        try:
+            self.assertEqual(len(cache), len(fmts))
+            for fmt in fmts:
+                self.assertEqual(dump(P, *cache.printf_parse(fmt)),
+                                 dump(P, *P.printf_parse(fmt)))
+            self.assertEqual(cache.info().hits, len(fmts))
+            # Keys depend on the dialect and the ABI.
+            cache.scanf_parse('%d')
+            cache.printf_parse('%d', abi='ilp32')
+            self.assertEqual(cache.info().misses, 2)
+        finally:
+            cache.close()
+
+    def test_errors_cached(self):
+        with DiskCache(self.path) as cache:
+            self.assertRaises(ValueError, cache.printf_parse, '%y')
+        with DiskCache(self.path) as cache:
+            try:
+                cache.printf_parse('%y')
+            except ValueError as e:
+                self.assertEqual(str(e), 'bad conversion character: %y')
+            else:
+                self.fail('no ValueError')
+            self.assertEqual(cache.info().hits, 1)
+
+    def test_prefill(self):
+        with DiskCache(self.path) as cache:
+            self.assertEqual(cache.prefill('printf', ['%d', '%s', '%d']), 2)
+            self.assertEqual(cache.prefill('printf', ['%d', '%x']), 1)
+        with DiskCache(self.path) as cache:
+            self.assertEqual(len(cache), 3)
+
+    def test_flush_appends(self):
+        with DiskCache(self.path) as cache:
+            cache.printf_parse('%d')
+        inode = os.stat(self.path).st_ino
+        reader = DiskCache(self.path)
+        try:
+            with DiskCache(self.path) as cache:
+                cache.printf_parse('%s')
+            # The file grew in place, and a process that had it mapped
+            # still reads it.
+            self.assertEqual(os.stat(self.path).st_ino, inode)
+            self.assertEqual(dump(P, *reader.printf_parse('%d')),
+                             dump(P, *P.printf_parse('%d')))
+            self.assertEqual(reader.info().hits, 1)
+        finally:
+            reader.close()
+        # Replaced tables don't pile up: the file is rewritten once they
+        # outweigh the rest.
+        cache = DiskCache(self.path)
+        for i in range(20):
+            cache.printf_parse('%%d %d' % i)
+            cache.flush()
+        cache.close()
+        with DiskCache(self.path) as cache:
+            self.assertEqual(len(cache), 22)
+            live = (sum(length for _, _, length in cache._slots()) +
+                    cache._nslots * diskcache._SLOT.size)
+            self.assertTrue(os.path.getsize(self.path) < 3 * live)
+            for i in range(20):
+                cache.printf_parse('%%d %d' % i)
+            self.assertEqual(cache.info().misses, 0)
+
+    def test_version_mismatch(self):
+        with DiskCache(self.path) as cache:
+            cache.printf_parse('%d')
+        old = diskcache.version
+        diskcache.version = lambda: b'\0' * 20
+        try:
+            with DiskCache(self.path) as cache:
+                self.assertEqual(len(cache), 0)
+                cache.printf_parse('%d')
+                self.assertEqual(cache.info().misses, 1)
+        finally:
+            diskcache.version = old
+        # The file was rewritten for the other version.
+        with DiskCache(self.path) as cache:
+            self.assertEqual(len(cache), 0)
+
+    def test_concurrent_flushes(self):
+        workers = [multiprocessing.Process(target=_fill,
+                                           args=(self.path, i))
+                   for i in range(4)]
+        for p in workers:
+            p.start()
+        for p in workers:
+            p.join()
+            self.assertEqual(p.exitcode, 0)
+        with DiskCache(self.path) as cache:
+            self.assertEqual(len(cache), 4 * 25)
+
+if __name__ == '__main__':
+    unittest.main()
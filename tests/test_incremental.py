@@ -0,0 +1,58 @@
+import random
+import unittest
+
+from pyc_fmtstr_parser import printf_parse as P
+from pyc_fmtstr_parser import scanf_parse as S
+from pyc_fmtstr_parser.incremental import printf_reparse, scanf_reparse
+from tests.support import dump
+
+class ReparseTest(unittest.TestCase):
+    def test_insert(self):
+        fmt = 'a %d b %s c'
+        d, a = P.printf_parse(fmt)
+        second = d.dir[1]
+        new, d, a = printf_reparse(fmt, d, a, 4, 0, ' %5.2f')
+        self.assertEqual(new, 'a %d %5.2f b %s c')
+        self.assertEqual(dump(P, d, a), dump(P, *P.printf_parse(new)))
+        # Directives after the edit keep their objects.
+        self.assertTrue(d.dir[2] is second)
+
+    def test_error_leaves_result(self):
+        fmt = '%d %s'
+        d, a = P.printf_parse(fmt)
+        before = dump(P, d, a)
+        self.assertRaises(ValueError, printf_reparse, fmt, d, a, 2, 0, '%y')
+        self.assertEqual(dump(P, d, a), before)
+
+    def test_matches_full_parse(self):
+        rng = random.Random(2)
+        pieces = ['%d', '%s', '%5.2f', '%*d', '%%', '%lld', 'ab', ' ', 'x',
+                  '%2$d', '%[a-z]', '%5c']
+        for mod, dialect, reparse in ((P, 'printf', printf_reparse),
+                                      (S, 'scanf', scanf_reparse)):
+            parse = getattr(mod, dialect + '_parse')
+            for _ in range(500):
+                fmt = ''.join(rng.choice(pieces)
+                              for _ in range(rng.randint(0, 6)))
+                try:
+                    d, a = parse(fmt)
+                except ValueError:
+                    continue
+                offset = rng.randint(0, len(fmt))
+                deleted = rng.randint(0, len(fmt) - offset)
+                inserted = ''.join(rng.choice(pieces)
+                                   for _ in range(rng.randint(0, 2)))
+                new = fmt[:offset] + inserted + fmt[offset + deleted:]
+                try:
+                    expected = dump(mod, *parse(new))
+                except ValueError:
+                    self.assertRaises(ValueError, reparse, fmt, d, a,
+                                      offset, deleted, inserted)
+                    continue
+                result, d, a = reparse(fmt, d, a, offset, deleted, inserted)
+                self.assertEqual(result, new)
+                self.assertEqual(dump(mod, d, a), expected,
+                                 (fmt, offset, deleted, inserted))
+
+if __name__ == '__main__':
+    unittest.main()
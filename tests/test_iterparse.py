@@ -0,0 +1,63 @@
+import random
+import unittest
+
+from pyc_fmtstr_parser import printf_parse as P
+from pyc_fmtstr_parser import scanf_parse as S
+from pyc_fmtstr_parser.iterparse import DirectiveTuple
+
+# Characters that make up most of the grammar of both dialects.
+_ALPHABET = "%%%%$$*.0123456789-+ #'hlLqjztdiouxXfFeEgGaAcsCSpnm[]^a-z!"
+
+def fields(dp, slots):
+    return tuple(getattr(dp, name) for name in slots)
+
+class IterparseTest(unittest.TestCase):
+    def test_tuples(self):
+        dts = list(P.iter_printf_directives('a %5.2f %*d'))
+        self.assertEqual(len(dts), 2)
+        self.assertTrue(isinstance(dts[0], DirectiveTuple))
+        self.assertEqual((dts[0].conversion, dts[0].type),
+                         ('f', P.Arg_type.TYPE_DOUBLE))
+        self.assertEqual((dts[1].width_arg_index, dts[1].arg_index), (1, 2))
+        self.assertEqual(dts[1].scanset, None)
+        dt, = S.iter_scanf_directives('%[a-c]')
+        self.assertTrue('b' in dt.scanset)
+
+    def test_error_after_directives(self):
+        it = P.iter_printf_directives('%d %s %y')
+        self.assertEqual(next(it).conversion, 'd')
+        self.assertEqual(next(it).conversion, 's')
+        self.assertRaises(ValueError, next, it)
+
+        diagnostics = []
+        dts = list(P.iter_printf_directives('%d %1$s',
+                                            diagnostics=diagnostics))
+        self.assertEqual(len(dts), 1)
+        self.assertEqual(len(diagnostics), 1)
+
+    def test_matches_parse(self):
+        # The iterator yields exactly the directives and diagnostics of the
+        # full parse, for both dialects.
+        rng = random.Random(0)
+        for mod, iterate in ((P, P.iter_printf_directives),
+                             (S, S.iter_scanf_directives)):
+            slots = mod.Directive.__slots__
+            parse = getattr(mod, mod.DIALECT.name + '_parse')
+            for _ in range(5000):
+                fmt = ''.join(rng.choice(_ALPHABET)
+                              for _ in range(rng.randint(0, 16)))
+                parsed = []
+                d, a = parse(fmt, diagnostics=parsed)
+                iterated = []
+                dts = list(iterate(fmt, diagnostics=iterated))
+                self.assertEqual([fields(dt, slots) for dt in dts],
+                                 [fields(dp, slots)
+                                  for dp in d.dir[:d.count]], fmt)
+                self.assertEqual(iterated, parsed, fmt)
+                types = [x.type for x in a.arg[:a.count]]
+                for dt in dts:
+                    if dt.arg_index != mod.ARG_NONE:
+                        self.assertEqual(dt.type, types[dt.arg_index], fmt)
+
+if __name__ == '__main__':
+    unittest.main()
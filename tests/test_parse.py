@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+import subprocess
+import sys
+import unittest
+
+from pyc_fmtstr_parser import printf_parse as P
+from pyc_fmtstr_parser import scanf_parse as S
+from pyc_fmtstr_parser.diagnostics import (Diagnostic, ERR_AMBIGUOUS_ARG,
+                                           ERR_ARG_ZERO, ERR_BAD_CONVERSION,
+                                           ERR_UNTERMINATED,
+                                           ERR_UNTERMINATED_SCANSET)
+
+PT = P.Arg_type
+ST = S.Arg_type
+
+def types(a):
+    return [x.type for x in a.arg[:a.count]]
+
+class PrintfParseTest(unittest.TestCase):
+    def test_directives(self):
+        fmt = 'x=%-08.3f %*s %lld%%'
+        d, a = P.printf_parse(fmt)
+        self.assertEqual(d.count, 4)
+        self.assertEqual([dp.conversion for dp in d.dir[:d.count]],
+                         ['f', 's', 'd', '%'])
+        dp = d.dir[0]
+        self.assertEqual((dp.dir_start, dp.dir_end), (2, 9))
+        self.assertEqual(dp.flags, P.FLAG_LEFT | P.FLAG_ZERO)
+        self.assertEqual(fmt[dp.width_start:dp.width_end], '8')
+        self.assertEqual(fmt[dp.precision_start:dp.precision_end], '.3')
+        self.assertEqual(d.dir[1].width_arg_index, 1)
+        self.assertEqual(d.dir[1].arg_index, 2)
+        self.assertEqual(d.dir[2].length, 'll')
+        self.assertEqual(d.dir[3].arg_index, P.ARG_NONE)
+        self.assertEqual(d.dir[d.count].dir_start, len(fmt))
+        self.assertEqual((d.max_width_length, d.max_precision_length),
+                         (1, 2))
+        self.assertEqual(types(a), [PT.TYPE_DOUBLE, PT.TYPE_INT,
+                                    PT.TYPE_STRING, PT.TYPE_LONGLONGINT])
+
+    def test_literal_text(self):
+        text = 'no directives here, just text ' * 100
+        d, a = P.printf_parse(text + '%d' + text)
+        self.assertEqual(d.count, 1)
+        self.assertEqual(d.dir[0].dir_start, len(text))
+        self.assertEqual(d.dir[1].dir_start, 2 * len(text) + 2)
+        d, a = P.printf_parse('')
+        self.assertEqual((d.count, a.count), (0, 0))
+
+    def test_positional(self):
+        d, a = P.printf_parse('%2$*1$.*3$lld %2$lld')
+        self.assertEqual(d.count, 2)
+        dp = d.dir[0]
+        self.assertEqual((dp.width_arg_index, dp.arg_index,
+                          dp.precision_arg_index), (0, 1, 2))
+        self.assertEqual(types(a), [PT.TYPE_INT, PT.TYPE_LONGLONGINT,
+                                    PT.TYPE_INT])
+
+    def test_unused_positional_argument(self):
+        d, a = P.printf_parse('%3$d')
+        self.assertEqual(types(a), [PT.TYPE_NONE, PT.TYPE_NONE,
+                                    PT.TYPE_INT])
+
+    def test_wide_conversions(self):
+        d, a = P.printf_parse('%C %S %lc %ls')
+        self.assertEqual([dp.length for dp in d.dir[:d.count]],
+                         ['l', 'l', 'l', 'l'])
+        self.assertEqual(types(a), [PT.TYPE_WIDE_CHAR, PT.TYPE_WIDE_STRING,
+                                    PT.TYPE_WIDE_CHAR, PT.TYPE_WIDE_STRING])
+
+    def test_count_pointers(self):
+        d, a = P.printf_parse('%hhn %hn %n %ln %lln')
+        self.assertEqual(types(a), [PT.TYPE_COUNT_SCHAR_POINTER,
+                                    PT.TYPE_COUNT_SHORT_POINTER,
+                                    PT.TYPE_COUNT_INT_POINTER,
+                                    PT.TYPE_COUNT_LONGINT_POINTER,
+                                    PT.TYPE_COUNT_LONGLONGINT_POINTER])
+
+    def test_errors(self):
+        for fmt, message in [('%', 'unterminated directive'),
+                             ('%5', 'unterminated directive'),
+                             ('%y', 'bad conversion character: %y'),
+                             ('%0$d', 'positional argument 0'),
+                             ('%1$d %1$s',
+                              'ambiguous type for positional argument')]:
+            try:
+                P.printf_parse(fmt)
+            except ValueError as e:
+                self.assertEqual(str(e), message)
+            else:
+                self.fail('%r parsed' % (fmt,))
+
+    def test_diagnostics(self):
+        for fmt, code, offset, dir_start in [
+                ('ab %d %', ERR_UNTERMINATED, 7, 6),
+                ('%d %y', ERR_BAD_CONVERSION, 4, 3),
+                ('%1$d %0$d', ERR_ARG_ZERO, 6, 5),
+                ('%1$d %1$s', ERR_AMBIGUOUS_ARG, 5, 5)]:
+            diagnostics = []
+            d, a = P.printf_parse(fmt, diagnostics=diagnostics)
+            self.assertEqual(diagnostics,
+                             [Diagnostic(code, offset, dir_start)])
+            # The bad directive becomes the sentinel, and the arguments are
+            # those of the directives before it.
+            self.assertEqual(d.count, 1)
+            self.assertEqual(d.dir[1].dir_start, dir_start)
+            self.assertEqual(types(a), [PT.TYPE_INT])
+
+    def test_diagnostics_keep_max_lengths_of_good_directives(self):
+        diagnostics = []
+        d, a = P.printf_parse('%5.2d %123.4567y', diagnostics=diagnostics)
+        self.assertEqual(len(diagnostics), 1)
+        self.assertEqual((d.max_width_length, d.max_precision_length),
+                         (1, 2))
+
+    def test_non_ascii_digits(self):
+        # Only ASCII digits make widths and argument numbers.
+        self.assertRaises(ValueError, P.printf_parse, u'%١d')
+
+    def test_freeze(self):
+        d, a = P.freeze(*P.printf_parse('%d %s'))
+        self.assertRaises(AttributeError, setattr, d.dir[0], 'flags', 1)
+        self.assertRaises(AttributeError, setattr, a, 'count', 0)
+        self.assertEqual(types(a), [PT.TYPE_INT, PT.TYPE_STRING])
+
+    def test_arg_type_name(self):
+        self.assertEqual(PT.name(PT.TYPE_LONGDOUBLE), 'TYPE_LONGDOUBLE')
+        self.assertRaises(ValueError, PT.name, 1000)
+
+    def test_light_imports(self):
+        # The parsers import neither ctypes nor flufl.enum.
+        code = ('import sys, pyc_fmtstr_parser.printf_parse, '
+                'pyc_fmtstr_parser.scanf_parse; '
+                'sys.exit("ctypes" in sys.modules or '
+                '"flufl.enum" in sys.modules)')
+        self.assertEqual(subprocess.call([sys.executable, '-c', code]), 0)
+
+class ScanfParseTest(unittest.TestCase):
+    def test_directives(self):
+        fmt = '%5d %*s %lf %hhu %n'
+        d, a = S.scanf_parse(fmt)
+        self.assertEqual(d.count, 5)
+        self.assertEqual(d.dir[1].flags, S.FLAG_SUPPRESS)
+        self.assertEqual(d.dir[1].arg_index, S.ARG_NONE)
+        self.assertEqual(d.dir[0].precision_arg_index, S.ARG_NONE)
+        self.assertEqual(types(a), [ST.TYPE_INT, ST.TYPE_DOUBLE,
+                                    ST.TYPE_UCHAR, ST.TYPE_NUMREAD])
+
+    def test_scanset(self):
+        d, a = S.scanf_parse('%[]a-c] %[^,x]')
+        self.assertEqual([dp.dir_end for dp in d.dir[:d.count]], [7, 14])
+        s = d.dir[0].scanset
+        self.assertEqual(s.intervals(), [(ord(']'), ord(']')),
+                                         (ord('a'), ord('c'))])
+        self.assertTrue('b' in s)
+        self.assertFalse('d' in s)
+        negated = d.dir[1].scanset
+        self.assertTrue(negated.negate)
+        self.assertFalse(',' in negated)
+        self.assertTrue('y' in negated)
+        self.assertEqual(types(a), [ST.TYPE_CHARSEQ, ST.TYPE_CHARSEQ])
+
+    def test_scanset_above_latin1(self):
+        d, a = S.scanf_parse(u'%[Ā-Ȁa]')
+        s = d.dir[0].scanset
+        self.assertTrue(u'Ő' in s)
+        self.assertTrue('a' in s)
+        self.assertFalse(u'ȁ' in s)
+        self.assertEqual(s.intervals(), [(ord('a'), ord('a')),
+                                         (0x100, 0x200)])
+
+    def test_wide_scanset(self):
+        # As in glibc, %l[ stores wide characters, as %ls does.
+        d, a = S.scanf_parse('%l[a-z] %ls %lc')
+        self.assertEqual(types(a), [ST.TYPE_WIDE_STRING,
+                                    ST.TYPE_WIDE_STRING, ST.TYPE_WIDE_CHAR])
+        self.assertEqual(types(S.resolve_arguments(d)), types(a))
+
+    def test_unterminated_scanset(self):
+        diagnostics = []
+        d, a = S.scanf_parse('%d %[abc', diagnostics=diagnostics)
+        self.assertEqual(diagnostics[0].code, ERR_UNTERMINATED_SCANSET)
+        self.assertEqual(d.count, 1)
+        self.assertRaises(ValueError, S.scanf_parse, '%d %[abc')
+        self.assertRaises(ValueError, S.scanf_parse, '%]')
+
+    def test_no_precision(self):
+        self.assertRaises(ValueError, S.scanf_parse, '%.2d')
+
+    def test_literal_text(self):
+        text = 'no directives here, just text ' * 100
+        d, a = S.scanf_parse(text + '%d' + text + '%%')
+        self.assertEqual(d.count, 2)
+        self.assertEqual(d.dir[0].dir_start, len(text))
+        self.assertEqual(d.dir[1].dir_start, 2 * len(text) + 2)
+        self.assertEqual(types(a), [ST.TYPE_INT])
+
+    def test_freeze(self):
+        d, a = S.freeze(*S.scanf_parse('%d %s'))
+        self.assertRaises(AttributeError, setattr, d.dir[0], 'conversion',
+                          'x')
+        self.assertRaises(AttributeError, setattr, d, 'count', 0)
+        self.assertEqual(types(a), [ST.TYPE_INT, ST.TYPE_STRING])
+
+if __name__ == '__main__':
+    unittest.main()
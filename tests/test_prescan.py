@@ -0,0 +1,121 @@
+import random
+import re
+import unittest
+
+from pyc_fmtstr_parser import prescan
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+_PRINTABLE = re.compile(b'[\\t\\n\\r\\x20-\\x7e]')
+
+def reference(buf, start, end, lo, hi, dialect, max_length):
+    # The candidates, from their definition.
+    following = prescan._following(dialect)
+    result = []
+    for s in range(start, end):
+        if s > lo and _PRINTABLE.match(buf, s - 1):
+            continue
+        e = s
+        while e < hi and _PRINTABLE.match(buf, e):
+            e += 1
+        if e == hi or buf[e:e + 1] != b'\0' or e - s > max_length:
+            continue
+        run = buf[s:e]
+        if any(run[i + 1:i + 2] in following and run[i + 1:i + 2]
+               for i in range(len(run)) if run[i:i + 1] == b'%'):
+            result.append(s)
+    return result
+
+def random_buffer(rng, size, dense=False):
+    pieces = [b'\0', b'%d', b'%', b'% ', b'%y', b'abc', b'\xff', b'\n',
+              b'100% done', b'%5.2f', b'%[a-z]']
+    if not dense:
+        pieces += [b'x' * 20, b'\x01\x02\x03']
+    out = []
+    n = 0
+    while n < size:
+        piece = rng.choice(pieces)
+        out.append(piece)
+        n += len(piece)
+    return b''.join(out)[:size]
+
+def ranges(rng, size):
+    lo = rng.randint(0, size // 4)
+    hi = rng.randint(size - size // 4, size)
+    start = rng.randint(lo, hi)
+    end = rng.randint(start, hi)
+    return start, end, lo, hi
+
+class CandidatesTest(unittest.TestCase):
+    def test_basics(self):
+        buf = b'\x01abc %d\0(100%)\0%s\0%%\0x%5.2f\0\xff%d\0%d'
+        self.assertEqual(prescan.candidates(buf, use_numpy=False),
+                         [1, 15, 18, 21, 29])
+        # Strings may run past end, but not past hi.
+        self.assertEqual(prescan.candidates(buf, 0, 5, use_numpy=False), [1])
+        self.assertEqual(prescan.candidates(buf, 0, 5, 0, 7,
+                                            use_numpy=False), [])
+        self.assertEqual(prescan.candidates(buf, max_length=3,
+                                            use_numpy=False), [15, 18, 29])
+        # Only scanf has scansets.
+        self.assertEqual(prescan.candidates(b'%[a]\0', use_numpy=False), [])
+        self.assertEqual(prescan.candidates(b'%[a]\0', dialect='scanf',
+                                            use_numpy=False), [0])
+
+    def test_bad_range(self):
+        self.assertRaises(ValueError, prescan.candidates, b'abc', 2, 1)
+        self.assertRaises(ValueError, prescan.candidates, b'abc', 0, 4)
+
+    def test_regex_matches_definition(self):
+        rng = random.Random(1)
+        for i in range(300):
+            buf = random_buffer(rng, rng.randint(0, 300), dense=i % 2)
+            start, end, lo, hi = ranges(rng, len(buf))
+            dialect = rng.choice(['printf', 'scanf'])
+            max_length = rng.choice([4, 16, 4096])
+            self.assertEqual(
+                prescan.candidates(buf, start, end, lo, hi, dialect,
+                                   max_length, use_numpy=False),
+                reference(buf, start, end, lo, hi, dialect, max_length),
+                (buf, start, end, lo, hi, dialect, max_length))
+
+    @unittest.skipIf(numpy is None, 'NumPy is not installed')
+    def test_numpy_matches_regex(self):
+        rng = random.Random(3)
+        old = prescan.CHUNK_SIZE
+        prescan.CHUNK_SIZE = 1000
+        try:
+            for i in range(300):
+                size = rng.choice([0, 50, 500, 5000])
+                buf = random_buffer(rng, size, dense=i % 2)
+                # Long runs exercise the growing windows.
+                if i % 5 == 0:
+                    buf = b'\0' + b'y' * rng.randint(50, 700) + b'%d\0' + buf
+                start, end, lo, hi = ranges(rng, len(buf))
+                args = (buf, start, end, lo, hi, rng.choice(['printf',
+                                                             'scanf']),
+                        rng.choice([8, 100, 4096]), rng.choice([1, 3]))
+                self.assertEqual(prescan.candidates(*args, use_numpy=True),
+                                 prescan.candidates(*args, use_numpy=False),
+                                 args[1:])
+        finally:
+            prescan.CHUNK_SIZE = old
+
+    @unittest.skipIf(numpy is None, 'NumPy is not installed')
+    def test_numpy_long_runs(self):
+        # Megabytes of text without NULs, with a '%d' every 194 bytes: the
+        # runs are longer than any window, and are found without reading
+        # one around each '%'.
+        text = (b'y' * 192 + b'%d') * ((4 << 20) // 194)
+        buf = b'\0'.join([text[:300], text[:5000], text[:100], text])
+        for max_length in 100, 4096, 1 << 23:
+            args = (buf, 0, len(buf), 0, len(buf), 'printf', max_length)
+            self.assertEqual(prescan.candidates(*args, use_numpy=True),
+                             prescan.candidates(*args, use_numpy=False))
+        self.assertEqual(prescan.candidates(buf, max_length=4096), [0])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import random
+import unittest
+
+from pyc_fmtstr_parser import catalog, query
+from pyc_fmtstr_parser import printf_parse as P
+from pyc_fmtstr_parser import scanf_parse as S
+
+_ALPHABET = "%%%%$$*.0123456789-+ #hlLjztdiouxXfeEgaAcsCSpn[]^a!"
+
+class QueryTest(unittest.TestCase):
+    def test_answers(self):
+        self.assertTrue(query.has_percent_n('%s %n'))
+        self.assertFalse(query.has_percent_n('100%% done'))
+        self.assertFalse(query.has_percent_n('%d\n'))
+        self.assertTrue(query.has_conversion('%5$p', 'xp'))
+        self.assertEqual(query.argument_count('%*.*f %s'), 4)
+        self.assertEqual(query.argument_count('%3$d'), 3)
+        self.assertEqual(query.argument_count('plain text'), 0)
+        self.assertEqual(query.signature('%2$s %1$d'),
+                         (P.Arg_type.TYPE_INT, P.Arg_type.TYPE_STRING))
+        self.assertTrue(query.takes_type('%*d', [P.Arg_type.TYPE_INT]))
+        self.assertFalse(query.takes_type('%s', [P.Arg_type.TYPE_INT]))
+        self.assertTrue(query.has_percent_n('%*d %n', dialect='scanf'))
+
+    def test_malformed(self):
+        diagnostics = []
+        self.assertFalse(query.has_percent_n('%d %y %n',
+                                             diagnostics=diagnostics))
+        self.assertEqual(len(diagnostics), 1)
+        self.assertEqual(query.argument_count('%d %s %'), 2)
+
+    def test_matches_parse(self):
+        rng = random.Random(1)
+        for mod, dialect in ((P, 'printf'), (S, 'scanf')):
+            parse = getattr(mod, dialect + '_parse')
+            for _ in range(3000):
+                fmt = ''.join(rng.choice(_ALPHABET)
+                              for _ in range(rng.randint(0, 14)))
+                d, a = parse(fmt, diagnostics=[])
+                types = [x.type for x in a.arg[:a.count]]
+                self.assertEqual(query.argument_count(fmt, dialect),
+                                 a.count, fmt)
+                self.assertEqual(query.signature(fmt, dialect),
+                                 catalog.signature(a), fmt)
+                self.assertEqual(
+                    query.has_percent_n(fmt, dialect),
+                    any(dp.conversion == 'n' for dp in d.dir[:d.count]),
+                    fmt)
+                wanted = [mod.Arg_type.TYPE_INT, mod.Arg_type.TYPE_NONE]
+                self.assertEqual(query.takes_type(fmt, wanted, dialect),
+                                 any(t in wanted for t in types), fmt)
+
+if __name__ == '__main__':
+    unittest.main()
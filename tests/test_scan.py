@@ -0,0 +1,85 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from pyc_fmtstr_parser import scan
+
+SOURCE = r'''
+#include <stdio.h>
+
+int main(int argc, char **argv)
+{
+    int n;
+    printf("%d args\n", argc);
+    fprintf(stderr, /* the usage */ "usage: %s "
+            "FILE\n", argv[0]);
+    snprintf(buf, sizeof(buf), "%5.2f%%", f(1, 2));
+    sscanf(argv[1], "%d %[a-z]", &n, buf);
+    printf(fmt, argc);
+    printf("%y\n");
+    return 0;
+}
+'''
+
+class SourceTest(unittest.TestCase):
+    def test_source_strings(self):
+        found = [(line, call, dialect, fmt)
+                 for offset, line, call, dialect, fmt
+                 in scan.source_strings(SOURCE)]
+        self.assertEqual(found, [
+            (7, 'printf', 'printf', '%d args\n'),
+            (8, 'fprintf', 'printf', 'usage: %s FILE\n'),
+            (10, 'snprintf', 'printf', '%5.2f%%'),
+            (11, 'sscanf', 'scanf', '%d %[a-z]'),
+            (13, 'printf', 'printf', '%y\n')])
+
+class JobTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, name, data):
+        path = os.path.join(self.dir, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def test_source(self):
+        path = self.write('main.c', SOURCE.encode('ascii'))
+        jobs = list(scan.jobs([self.dir]))
+        self.assertEqual(jobs, [(scan.JOB_SOURCE, path, 0, len(SOURCE), 0,
+                                 len(SOURCE), '')])
+        lines, nbytes, nfound = scan.scan_job(jobs[0])
+        records = [json.loads(line) for line in lines]
+        self.assertEqual((nbytes, nfound), (len(SOURCE), 5))
+        self.assertEqual(records[1]['arguments'], ['string'])
+        self.assertEqual(records[3]['dialect'], 'scanf')
+        self.assertEqual(records[3]['arguments'], ['int', 'charseq'])
+        self.assertEqual((records[4]['error'], records[4]['error_offset']),
+                         ('bad conversion character', 1))
+
+    def test_raw_binary(self):
+        data = b'\x01\x02%d items\0\xff%5.2f%z\0no directive\0' * 3
+        path = self.write('blob.bin', data)
+        # Not ELF or PE: scanned only when raw.
+        self.assertEqual(list(scan.jobs([path])), [])
+        jobs = list(scan.jobs([path], chunk_size=20, raw=True))
+        self.assertEqual([job[2:4] for job in jobs],
+                         [(0, 20), (20, 40), (40, 60), (60, 80),
+                          (80, len(data))])
+        records = []
+        for job in jobs:
+            records.extend(json.loads(line) for line in scan.scan_job(job)[0])
+        self.assertEqual([r['offset'] for r in records],
+                         [2, 12, 35, 45, 68, 78])
+        self.assertEqual(records[0]['format'], '%d items')
+        self.assertEqual(records[0]['section'], '')
+        self.assertEqual((records[1]['error'], records[1]['error_offset']),
+                         ('unterminated directive', 7))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+import multiprocessing
+import unittest
+
+from pyc_fmtstr_parser import printf_parse as P
+from pyc_fmtstr_parser import scanf_parse as S
+from pyc_fmtstr_parser.sharedcache import SharedCache
+from tests.support import dump
+
+def _lookup(cache):
+    # Exits with 0 if the parent's entry is a hit here.
+    cache.printf_parse('%d shared')
+    raise SystemExit(0 if cache.hits == 1 else 1)
+
+class SharedCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = SharedCache(1 << 20, shards=4)
+
+    def tearDown(self):
+        self.cache.unlink()
+        self.cache.close()
+
+    def test_parse(self):
+        cases = [(P, 'printf', ['%d', '%-*.*lld %s', 'x%%y', '']),
+                 (S, 'scanf', ['%d %[a-z]', '%*5[^]x-] %n', '%l[abc]'])]
+        for mod, dialect, fmts in cases:
+            parse = getattr(mod, dialect + '_parse')
+            for fmt in fmts:
+                expected = dump(mod, *parse(fmt))
+                self.assertEqual(dump(mod, *self.cache.parse(dialect, fmt)),
+                                 expected)
+                self.assertEqual(dump(mod, *self.cache.parse(dialect, fmt)),
+                                 expected)
+        info = self.cache.info()
+        self.assertEqual((info.hits, info.misses, info.currsize), (7, 7, 7))
+
+    def test_not_cached(self):
+        # Length modifiers of three characters don't fit the layout, nor
+        # do scansets with characters past U+00FF.
+        for dialect, fmt in ('printf', '%llld'), ('scanf', u'%[Ā-Ȁ]'):
+            self.cache.parse(dialect, fmt)
+            self.cache.parse(dialect, fmt)
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 4))
+
+    def test_errors(self):
+        for _ in range(2):
+            try:
+                self.cache.printf_parse('%5')
+            except ValueError as e:
+                self.assertEqual(str(e), 'unterminated directive')
+            else:
+                self.fail('no ValueError')
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_clear(self):
+        self.cache.printf_parse('%d')
+        self.assertEqual(len(self.cache), 1)
+        self.cache.clear()
+        self.assertEqual(len(self.cache), 0)
+        self.cache.printf_parse('%d')
+        self.assertEqual(self.cache.misses, 2)
+
+    def test_shared_with_children(self):
+        self.cache.printf_parse('%d shared')
+        p = multiprocessing.Process(target=_lookup, args=(self.cache,))
+        p.start()
+        p.join()
+        self.assertEqual(p.exitcode, 0)
+
+    def test_bad_arguments(self):
+        self.assertRaises(ValueError, SharedCache, 1 << 20, 3)
+        self.assertRaises(ValueError, SharedCache, 1 << 12, 64)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+
+from pyc_fmtstr_parser import stats
+from pyc_fmtstr_parser.printf_parse import printf_parse
+from pyc_fmtstr_parser.scanf_parse import scanf_parse
+
+class StatsTest(unittest.TestCase):
+    def setUp(self):
+        stats.enable(top=2)
+        stats.reset()
+
+    def tearDown(self):
+        stats.disable()
+        stats.reset()
+
+    def test_counters(self):
+        printf_parse('%d %2$*1$ld')
+        printf_parse(b'xx%s\0', 2)
+        scanf_parse('%d %5[a-z] %n')
+        self.assertRaises(ValueError, printf_parse, '%y')
+        printf_parse('%', diagnostics=[])
+        metrics = stats.snapshot()
+
+        printf = metrics['printf']
+        self.assertEqual(printf['parses'], 4)
+        self.assertEqual(printf['directives'], 3)
+        self.assertEqual(printf['conversions'], {'d': 2, 's': 1})
+        self.assertEqual(printf['lengths'], {'': 2, 'l': 1})
+        self.assertEqual(printf['arguments'],
+                         {'positional': 2, 'sequential': 2})
+        self.assertEqual(printf['errors'],
+                         {'ValueError: bad conversion character': 1,
+                          'ValueError: unterminated directive': 1})
+        scanf = metrics['scanf']
+        self.assertEqual(scanf['conversions'], {'d': 1, '[': 1, 'n': 1})
+        self.assertEqual(scanf['arguments'], {'sequential': 3})
+
+        slowest = metrics['slowest']
+        self.assertEqual(len(slowest), 2)
+        self.assertTrue(slowest[0]['seconds'] >= slowest[1]['seconds'])
+
+    def test_ascii_argument_numbers(self):
+        # The parser doesn't take other digits for an argument number.
+        fmt = u'%\u0661$d'
+        self.assertRaises(ValueError, printf_parse, fmt)
+        self.assertFalse(stats._positional(fmt, 1))
+        self.assertTrue(stats._positional(u'%12$d', 1))
+
+    def test_disable(self):
+        self.assertTrue(stats.enabled())
+        stats.disable()
+        self.assertFalse(stats.enabled())
+        printf_parse('%d')
+        self.assertEqual(stats.snapshot(), {'slowest': []})
+
+    def test_reset(self):
+        printf_parse('%d')
+        stats.reset()
+        self.assertEqual(stats.snapshot(), {'slowest': []})
+        # Counters survive disabling and enabling again.
+        printf_parse('%d')
+        stats.disable()
+        stats.enable(top=2)
+        self.assertEqual(stats.snapshot()['printf']['parses'], 1)
+
+if __name__ == '__main__':
+    unittest.main()